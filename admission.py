@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kiểm soát tải cho các endpoint convert (TXT -> audio), dùng chung giữa các worker gunicorn:
+- Token bucket theo client: mỗi client được `rate` đơn vị/giây, dồn tối đa `burst`
+  (hết token -> 429 + Retry-After). Request tốn hơn `burst` (batch lớn) được nhận khi bucket
+  đầy và trừ đủ cost: bucket âm, client phải chờ hồi lại phần vượt trước request sau
+- Giới hạn số convert đang chạy trên toàn server bằng N file slot khoá bằng flock
+  (hết slot -> 503 + Retry-After ngay, không xếp hàng chiếm worker)
+
+Route phát audio (/audio, /q, /api/qr-list...) không đi qua đây, nên luôn còn
+worker rảnh khi max_inflight nhỏ hơn tổng số worker.
+Worker chết thì kernel tự nhả flock, slot không bị kẹt.
+"""
+
+import os
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ giới hạn trong process
+    fcntl = None
+
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối vì quá tải; status 429 (client) hoặc 503 (server)"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Slot:
+    """Một slot convert đang giữ; nhả bằng release() hoặc with"""
+
+    def __init__(self, controller, fd=None, index=None):
+        self.controller = controller
+        self.fd = fd
+        self.index = index
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class AdmissionController:
+    """Token bucket theo client + giới hạn convert đồng thời toàn server"""
+
+    def __init__(self, state_dir='temp/admission', max_inflight=2, rate=0.2, burst=5,
+                 retry_after=10):
+        """
+        Args:
+            state_dir: Thư mục trạng thái dùng chung giữa các worker
+            max_inflight: Số convert chạy cùng lúc tối đa trên toàn server
+            rate: Số đơn vị (file TXT) mỗi client được thêm mỗi giây
+            burst: Số đơn vị tối đa dồn được
+            retry_after: Retry-After (giây) khi hết slot
+        """
+        self.state_dir = Path(state_dir)
+        self.bucket_dir = self.state_dir / 'buckets'
+        self.bucket_dir.mkdir(parents=True, exist_ok=True)
+        self.max_inflight = max_inflight
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self._local_inflight = 0  # dùng khi không có fcntl
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    # -- Token bucket ------------------------------------------------------
+
+    def _take_tokens(self, client, cost):
+        """
+        Trừ cost token của client; trả 0 nếu đủ, ngược lại số giây phải chờ.
+        Cost lớn hơn burst chỉ cần bucket đầy, phần vượt để bucket âm (trả dần bằng thời gian chờ)
+        """
+        need = min(cost, self.burst)
+        now = time.time()
+        if fcntl is None:
+            with self._lock:
+                tokens, updated = self._buckets.get(client, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if tokens < need:
+                    return (need - tokens) / self.rate
+                self._buckets[client] = (tokens - cost, now)
+                return 0
+
+        path = self.bucket_dir / hashlib.sha1(client.encode('utf-8')).hexdigest()
+        with open(path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    tokens, updated = (float(x) for x in f.read().split())
+                except ValueError:
+                    tokens, updated = float(self.burst), now
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if tokens < need:
+                    return (need - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(f'{tokens - cost} {now}')
+                return 0
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def cleanup(self):
+        """Xoá bucket của client lâu không hoạt động (đã đầy lại, như bucket mới)"""
+        idle = self.burst / self.rate if self.rate else 0
+        now = time.time()
+        for path in self.bucket_dir.iterdir():
+            try:
+                if path.stat().st_mtime >= now - idle - 60:
+                    continue
+                # Bucket đang âm (sau batch lớn) cần lâu hơn để đầy lại: giữ tới khi hết nợ
+                try:
+                    tokens, updated = (float(x) for x in path.read_text().split())
+                except ValueError:
+                    tokens, updated = float(self.burst), now
+                if tokens + (now - updated) * self.rate >= self.burst:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # -- Slot -------------------------------------------------------------
+
+    def _acquire_slot(self):
+        if fcntl is None:
+            with self._lock:
+                if self._local_inflight >= self.max_inflight:
+                    return None
+                self._local_inflight += 1
+            return _Slot(self)
+        # Bắt đầu từ slot ngẫu nhiên để các worker không cùng tranh slot 0
+        start = random.randrange(self.max_inflight)
+        for i in range(self.max_inflight):
+            index = (start + i) % self.max_inflight
+            fd = os.open(self.state_dir / f'slot-{index}.lock', os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return _Slot(self, fd, index)
+        return None
+
+    def _release(self, slot):
+        if slot.fd is None:
+            with self._lock:
+                self._local_inflight -= 1
+            return
+        try:
+            fcntl.flock(slot.fd, fcntl.LOCK_UN)
+        finally:
+            os.close(slot.fd)
+
+    def inflight(self) -> int:
+        """Số slot đang bị giữ (cho /health)"""
+        if fcntl is None:
+            return self._local_inflight
+        busy = 0
+        for index in range(self.max_inflight):
+            fd = os.open(self.state_dir / f'slot-{index}.lock', os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                busy += 1
+            finally:
+                os.close(fd)
+        return busy
+
+    # -- API ----------------------------------------------------------------
+
+    def admit(self, client, cost=1):
+        """
+        Xin phép chạy một convert
+
+        Args:
+            client: Định danh client (IP)
+            cost: Số đơn vị công việc (số file TXT)
+
+        Returns:
+            Slot (context manager), phải release sau khi convert xong
+
+        Raises:
+            AdmissionRejected: 429 nếu client vượt rate, 503 nếu server hết slot
+        """
+        # Lấy slot trước: request bị 503 không tốn token của client
+        slot = self._acquire_slot()
+        if slot is None:
+            raise AdmissionRejected(
+                'May chu dang ban convert, vui long thu lai sau',
+                status=503, retry_after=self.retry_after)
+        try:
+            wait = self._take_tokens(client, cost)
+        except Exception:
+            slot.release()
+            raise
+        if wait:
+            slot.release()
+            raise AdmissionRejected(
+                'Qua nhieu yeu cau convert, vui long thu lai sau',
+                status=429, retry_after=max(1, int(wait + 0.999)))
+        if random.random() < 0.01:
+            self.cleanup()
+        return slot
+
+    def snapshot(self):
+        return {
+            'max_inflight': self.max_inflight,
+            'inflight': self.inflight(),
+            'rate': self.rate,
+            'burst': self.burst,
+        }
+
+
+def create_admission(state_dir='temp/admission'):
+    """AdmissionController cấu hình qua biến môi trường"""
+    return AdmissionController(
+        state_dir=os.environ.get('ADMISSION_STATE_DIR', state_dir),
+        max_inflight=int(os.environ.get('ADMISSION_MAX_INFLIGHT', 2)),
+        rate=float(os.environ.get('ADMISSION_RATE', 0.2)),
+        burst=float(os.environ.get('ADMISSION_BURST', 5)),
+        retry_after=int(os.environ.get('ADMISSION_RETRY_AFTER', 10)),
+    )
+
+
+def client_id(request, trust_proxy=False):
+    """IP client; sau nginx (TRUST_PROXY=1) lấy từ X-Real-IP / X-Forwarded-For"""
+    if trust_proxy:
+        real_ip = request.headers.get('X-Real-IP')
+        if real_ip:
+            return real_ip.strip()
+        if request.access_route:
+            return request.access_route[0]
+    return request.remote_addr or 'unknown'
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đếm lượt quét QR (/q/<code>) và lượt nghe audio với chi phí gần như bằng 0 trên request:
+- Mỗi worker cộng dồn trong bộ nhớ (một dict + lock)
+- Thread nền gộp các bộ đếm vào qr_data.json mỗi flush_interval giây, một transaction
+  cho cả đợt (cộng thêm, nên nhiều worker/process ghi cùng lúc vẫn đúng)
+
+Record có thêm: plays, last_played, scans, last_scanned.
+"""
+
+import os
+import time
+import atexit
+import threading
+from pathlib import Path
+
+
+def is_play_start(range_header) -> bool:
+    """
+    Request có phải bắt đầu một lượt nghe không: không có Range, hoặc Range mở từ byte 0
+    (bytes=0-). Range có byte cuối (Safari/iOS dò bytes=0-1 trước khi phát bytes=0-),
+    tua (bytes=12345-) và các request Range tiếp theo không tính.
+    """
+    if not range_header:
+        return True
+    return range_header.replace(' ', '').lower() == 'bytes=0-'
+
+
+class PlayCounter:
+    """Bộ đếm trong bộ nhớ của một worker, flush định kỳ vào QRStore"""
+
+    def __init__(self, store, flush_interval=30.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._pending = {}  # stem của audio_filename -> [plays, scans, last_played, last_scanned]
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def _ensure_started(self):
+        # Khởi động thread sau fork (gunicorn) - thread không sống qua fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+            threading.Thread(target=self._run, name='play-counter', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _add(self, audio_filename, index):
+        self._ensure_started()
+        key = Path(audio_filename).stem
+        now = time.time()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = [0, 0, None, None]
+            entry[index] += 1
+            entry[index + 2] = now
+
+    def record_play(self, audio_filename):
+        self._add(audio_filename, 0)
+
+    def record_scan(self, audio_filename):
+        self._add(audio_filename, 1)
+
+    def pending(self):
+        """Bản sao các bộ đếm chưa flush"""
+        with self._lock:
+            return {key: list(entry) for key, entry in self._pending.items()}
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # Lỗi ghi (đĩa đầy, ...): flush đã trả bộ đếm lại, thử lại lần sau
+                pass
+
+    def flush(self):
+        """Gộp bộ đếm vào record store (một transaction); trả số record được cập nhật"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        updated = 0
+        try:
+            with self.store.transaction() as data:
+                for record in data:
+                    entry = batch.get(Path(record.get('audio_filename') or '').stem)
+                    if entry is None:
+                        continue
+                    plays, scans, last_played, last_scanned = entry
+                    if plays:
+                        record['plays'] = record.get('plays', 0) + plays
+                        record['last_played'] = _iso(last_played)
+                    if scans:
+                        record['scans'] = record.get('scans', 0) + scans
+                        record['last_scanned'] = _iso(last_scanned)
+                    updated += 1
+        except Exception:
+            # Trả bộ đếm lại để lần flush sau ghi tiếp
+            with self._lock:
+                for key, entry in batch.items():
+                    current = self._pending.setdefault(key, [0, 0, None, None])
+                    current[0] += entry[0]
+                    current[1] += entry[1]
+                    current[2] = max(filter(None, (current[2], entry[2])), default=None)
+                    current[3] = max(filter(None, (current[3], entry[3])), default=None)
+            raise
+        return updated
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp))
+
+
+def top_records(records, pending=None, by='plays', limit=10):
+    """
+    Các record được nghe/quét nhiều nhất
+
+    Args:
+        records: Danh sách record (snapshot của store)
+        pending: PlayCounter.pending() của worker hiện tại (cộng thêm phần chưa flush)
+        by: 'plays' hoặc 'scans'
+        limit: Số record trả về
+    """
+    pending = pending or {}
+    rows = []
+    for record in records:
+        extra = pending.get(Path(record.get('audio_filename') or '').stem)
+        plays = record.get('plays', 0) + (extra[0] if extra else 0)
+        scans = record.get('scans', 0) + (extra[1] if extra else 0)
+        if not (plays or scans):
+            continue
+        rows.append({
+            'id': record.get('id'),
+            'title': record.get('title'),
+            'short_code': record.get('short_code'),
+            'plays': plays,
+            'scans': scans,
+            'last_played': _iso(extra[2]) if extra and extra[2] else record.get('last_played'),
+            'last_scanned': _iso(extra[3]) if extra and extra[3] else record.get('last_scanned'),
+        })
+    other = 'scans' if by == 'plays' else 'plays'
+    rows.sort(key=lambda row: (row[by], row[other]), reverse=True)
+    return rows[:limit]
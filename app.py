@@ -4,593 +4,265 @@
 Web server để serve audio và generate QR code
 """
 
+import io
 import os
-import uuid
 import json
+import uuid
+import time
+import functools
+import hashlib
+from zlib import adler32
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, request, send_file, jsonify, render_template_string
+from urllib.parse import quote
+from flask import Flask, Response, request, send_file, jsonify, redirect, stream_with_context
 from werkzeug.utils import secure_filename
-import qrcode
-from io import BytesIO
-import base64
-from txt_to_audio import convert_txt_to_audio
-
-app = Flask(__name__)
+from werkzeug.wsgi import FileWrapper
+from txt_to_audio import synthesize_text
+from tts_limiter import get_limiter, TTSUnavailableError
+from qr_store import QRStore
+from http_cache import versioned_response
+from assets import AssetManifest
+from blob_store import create_blob_store
+from audio_paths import is_public_name
+from qr_render import qr_params, render_qr_base64, render_record_png, record_png_version
+from hls import package_hls, hls_key, PLAYLIST_MIMETYPE
+from analytics import PlayCounter, is_play_start, top_records
+from admission import AdmissionRejected, create_admission, client_id
+from idempotency import IdempotencyStore, IdempotencyConflict
+from library_archive import iter_export
+from search_index import SearchIndex, model_txt_source
+from bulk_ops import record_filter, missing_ids, delete_records, update_records, run_parallel, apply_updates
+import cancellation
+from cancellation import Cancelled, request_token
+from hot_cache import create_hot_cache, MemoryReader, iter_view
+import tracing
+from tracing import span, submit
+
+app = Flask(__name__, static_folder=None)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
 app.config['DATA_FILE'] = 'qr_data.json'
+app.config['TEMP_FOLDER'] = 'temp'  # Scratch local của node (TXT tạm, audio đang tạo)
+
+# Trace request (TRACE_SAMPLE_RATE, xem tracing.py)
+tracing.init_app(app)
 
 # Tạo thư mục uploads và temp nếu chưa có
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
-Path('temp').mkdir(exist_ok=True)
+Path(app.config['TEMP_FOLDER']).mkdir(exist_ok=True)
+
+# Audio lưu qua blob store (local: shard uploads/ab/cd/, hoặc S3 - BLOB_BACKEND)
+blobs = create_blob_store(app.config['UPLOAD_FOLDER'])
+
+# Audio được nghe nhiều: mmap trong bộ nhớ (HOT_CACHE_MB, mặc định 0 = tắt), xem hot_cache.py
+hot_cache = create_hot_cache()
+SEND_CHUNK_SIZE = 1024 * 1024
 
 # Load/Save QR data
+store = QRStore(app.config['DATA_FILE'])
+
+# Chỉ mục tìm kiếm (qr_data.search.db): cập nhật khi thêm/xoá, đồng bộ nền theo version của store
+search_index = SearchIndex(Path(app.config['DATA_FILE']).with_suffix('.search.db'))
+source_text = model_txt_source('model_txt')
+
+# Giới hạn convert: token bucket theo client + số convert đồng thời toàn server
+# (ADMISSION_MAX_INFLIGHT nên nhỏ hơn số worker để route phát audio luôn còn worker rảnh)
+admission = create_admission(Path(app.config['TEMP_FOLDER']) / 'admission')
+TRUST_PROXY = os.environ.get('TRUST_PROXY') == '1'
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = jsonify({'error': str(e)})
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def admitted(view):
+    """Route convert: xin slot trước khi đọc/convert (từ chối nhanh khi quá tải)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with admission.admit(client_id(request, TRUST_PROXY)):
+            return view(*args, **kwargs)
+    return wrapper
+
+# Idempotency: request lặp lại (retry sau timeout) nhận lại kết quả cũ thay vì convert lần hai.
+# Key từ header Idempotency-Key, không có thì lấy hash nội dung (giữ ngắn hơn: chỉ để bắt retry)
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_CONTENT_TTL = int(os.environ.get('IDEMPOTENCY_CONTENT_TTL', 600))
+idempotency = IdempotencyStore(
+    Path(app.config['TEMP_FOLDER']) / 'idempotency',
+    ttl=IDEMPOTENCY_TTL,
+    wait_timeout=int(os.environ.get('IDEMPOTENCY_WAIT', 60)),
+)
+
+@app.errorhandler(IdempotencyConflict)
+def idempotency_conflict(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 409
+
+def idempotency_key():
+    """Key của request hiện tại và thời gian giữ kết quả: (key, ttl)"""
+    header = request.headers.get('Idempotency-Key', '').strip()
+    if header:
+        return f'{request.endpoint}:key:{header[:255]}', IDEMPOTENCY_TTL
+    digest = hashlib.sha256()
+    for name, value in sorted(request.form.items(multi=True)):
+        digest.update(f'{name}={value}\0'.encode('utf-8'))
+    for name, file in request.files.items(multi=True):
+        digest.update(f'{name}:{file.filename}\0'.encode('utf-8'))
+        for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+        file.stream.seek(0)
+    # Theo từng client: người khác gửi cùng nội dung vẫn có record riêng (audio dùng chung qua segment cache)
+    client = client_id(request, TRUST_PROXY)
+    return f'{request.endpoint}:content:{client}:{digest.hexdigest()}', IDEMPOTENCY_CONTENT_TTL
+
+def _replayed(response):
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def cancelled_response(error, filename=None):
+    """Convert bị huỷ: ghi nhận (đếm trong /health) và trả 499 (client đã đi) hoặc 504 (quá hạn)"""
+    cancellation.record_cancellation(error.reason)
+    app.logger.info('Huy convert %s: %s', filename, error.reason)
+    status = 499 if error.reason == 'disconnect' else 504
+    return jsonify({'error': str(error)}), status
+
+def idempotent(view):
+    """Route tạo record: trả lại kết quả đã lưu cho request lặp lại, chờ request trùng đang chạy"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key, ttl = idempotency_key()
+        result, claim = idempotency.begin(key)
+        if result is not None:
+            return _replayed(jsonify(result['body'])), result['status']
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            # Chỉ lưu kết quả thành công; lỗi (503, 500...) thì lần sau chạy lại
+            if 200 <= response.status_code < 300 and response.is_json:
+                claim.complete(response.status_code, response.get_json(), ttl)
+            return response
+        finally:
+            claim.release()
+    return wrapper
+
+# Lượt quét/nghe: đếm trong bộ nhớ, ghi vào qr_data.json theo đợt
+plays = PlayCounter(store, flush_interval=float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 30)))
+
 def load_qr_data():
     """Load danh sách QR codes từ file JSON"""
-    if Path(app.config['DATA_FILE']).exists():
-        try:
-            with open(app.config['DATA_FILE'], 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    return store.load()
 
 def save_qr_data(data):
     """Lưu danh sách QR codes vào file JSON"""
-    with open(app.config['DATA_FILE'], 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    store.save(data)
 
-def add_qr_record(audio_filename, audio_url, full_url, qr_base64, title=None):
-    """Thêm record QR code vào database"""
-    data = load_qr_data()
+def new_qr_record(audio_filename, audio_url, title=None, qr=None, hls=None):
+    """Record QR code mới (chỉ lưu tham số QR, ảnh render khi cần), chưa có short link"""
     record = {
         'id': str(uuid.uuid4()),
         'title': title or audio_filename,
         'audio_filename': audio_filename,
         'audio_url': audio_url,
-        'full_url': full_url,
-        'qr_base64': qr_base64,
+        'qr': qr_params(**(qr or {})),
         'created_at': datetime.now().isoformat()
     }
-    data.append(record)
-    save_qr_data(data)
+    if hls:
+        record['hls'] = hls
     return record
 
-# HTML template
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="vi">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>QR Code Audio Generator</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 20px;
-        }
-        .container {
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            max-width: 600px;
-            width: 100%;
-            box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-        }
-        h1 {
-            color: #333;
-            margin-bottom: 30px;
-            text-align: center;
-        }
-        .upload-area {
-            border: 3px dashed #667eea;
-            border-radius: 10px;
-            padding: 40px;
-            text-align: center;
-            margin-bottom: 20px;
-            cursor: pointer;
-            transition: all 0.3s;
-        }
-        .upload-area:hover {
-            background: #f0f0ff;
-            border-color: #764ba2;
-        }
-        .upload-area.dragover {
-            background: #e0e0ff;
-            border-color: #764ba2;
-        }
-        input[type="file"] {
-            display: none;
-        }
-        .btn {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 12px 30px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 16px;
-            margin: 10px 5px;
-            transition: transform 0.2s;
-        }
-        .btn:hover {
-            transform: scale(1.05);
-        }
-        .btn:disabled {
-            opacity: 0.6;
-            cursor: not-allowed;
-        }
-        .qr-container {
-            text-align: center;
-            margin-top: 30px;
-            display: none;
-        }
-        .qr-container.active {
-            display: block;
-        }
-        .qr-code {
-            background: white;
-            padding: 20px;
-            border-radius: 10px;
-            display: inline-block;
-            margin: 20px 0;
-        }
-        .qr-code img {
-            max-width: 300px;
-            height: auto;
-        }
-        .audio-link {
-            margin-top: 20px;
-            padding: 15px;
-            background: #f5f5f5;
-            border-radius: 10px;
-            word-break: break-all;
-        }
-        .audio-link a {
-            color: #667eea;
-            text-decoration: none;
-        }
-        .audio-link a:hover {
-            text-decoration: underline;
-        }
-        .status {
-            margin: 10px 0;
-            padding: 10px;
-            border-radius: 5px;
-            display: none;
-        }
-        .status.success {
-            background: #d4edda;
-            color: #155724;
-            display: block;
-        }
-        .status.error {
-            background: #f8d7da;
-            color: #721c24;
-            display: block;
-        }
-        .audio-preview {
-            margin: 20px 0;
-            text-align: center;
-        }
-        audio {
-            width: 100%;
-            max-width: 400px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🎵 QR Code Audio Generator</h1>
-        
-        <div class="status" id="status"></div>
-        
-        <div style="margin-bottom: 20px; text-align: center;">
-            <a href="/manage" class="btn" style="background: #28a745; text-decoration: none; margin-right: 10px;">📋 Quản Lý QR Codes</a>
-            <button class="btn" onclick="switchMode('audio')" id="btnAudio" style="background: #667eea;">Upload Audio</button>
-            <button class="btn" onclick="switchMode('txt')" id="btnTxt" style="background: #ccc;">Upload TXT</button>
-        </div>
-        
-        <div style="margin-bottom: 15px; text-align: center;">
-            <label style="display: inline-block; margin: 0 10px;">
-                <input type="checkbox" id="multipleFiles" onchange="toggleMultiple()"> Upload nhiều file
-            </label>
-        </div>
-        
-        <form id="uploadForm" enctype="multipart/form-data">
-            <div class="upload-area" id="uploadArea">
-                <p style="font-size: 18px; margin-bottom: 10px;" id="uploadText">📁 Kéo thả file audio vào đây</p>
-                <p style="color: #666;">hoặc click để chọn file</p>
-                <input type="file" id="audioFile" name="audio" accept="audio/*">
-                <input type="file" id="audioFiles" name="audio_files" accept="audio/*" multiple style="display: none;">
-                <input type="file" id="txtFile" name="txt_file" accept=".txt" style="display: none;">
-                <input type="file" id="txtFiles" name="txt_files" accept=".txt" multiple style="display: none;">
-            </div>
-            <div style="text-align: center;">
-                <button type="submit" class="btn" id="submitBtn">Tạo QR Code</button>
-            </div>
-        </form>
-        
-        <div class="qr-container" id="qrContainer">
-            <h2 style="margin-bottom: 20px;">QR Code của bạn:</h2>
-            <div class="qr-code" id="qrCode"></div>
-            <div class="audio-link" id="audioLink"></div>
-            <div class="audio-preview" id="audioPreview"></div>
-            <button class="btn" onclick="downloadQR()">Tải QR Code</button>
-        </div>
-    </div>
-
-    <script>
-        let currentMode = 'audio';
-        const uploadArea = document.getElementById('uploadArea');
-        const audioInput = document.getElementById('audioFile');
-        const txtInput = document.getElementById('txtFile');
-        const form = document.getElementById('uploadForm');
-        const status = document.getElementById('status');
-        const qrContainer = document.getElementById('qrContainer');
-        const submitBtn = document.getElementById('submitBtn');
-        const uploadText = document.getElementById('uploadText');
-
-        let multipleMode = false;
-        
-        function toggleMultiple() {
-            multipleMode = document.getElementById('multipleFiles').checked;
-            updateFileInputs();
-        }
-        
-        function updateFileInputs() {
-            if (currentMode === 'audio') {
-                if (multipleMode) {
-                    audioInput.style.display = 'none';
-                    document.getElementById('audioFiles').style.display = 'block';
-                    audioInput.required = false;
-                    document.getElementById('audioFiles').required = true;
-                } else {
-                    audioInput.style.display = 'block';
-                    document.getElementById('audioFiles').style.display = 'none';
-                    audioInput.required = true;
-                    document.getElementById('audioFiles').required = false;
-                }
-            } else {
-                if (multipleMode) {
-                    txtInput.style.display = 'none';
-                    document.getElementById('txtFiles').style.display = 'block';
-                    txtInput.required = false;
-                    document.getElementById('txtFiles').required = true;
-                } else {
-                    txtInput.style.display = 'block';
-                    document.getElementById('txtFiles').style.display = 'none';
-                    txtInput.required = true;
-                    document.getElementById('txtFiles').required = false;
-                }
-            }
-        }
-        
-        function switchMode(mode) {
-            currentMode = mode;
-            if (mode === 'audio') {
-                document.getElementById('btnAudio').style.background = '#667eea';
-                document.getElementById('btnTxt').style.background = '#ccc';
-                uploadText.textContent = '📁 Kéo thả file audio vào đây';
-            } else {
-                document.getElementById('btnAudio').style.background = '#ccc';
-                document.getElementById('btnTxt').style.background = '#667eea';
-                uploadText.textContent = '📄 Kéo thả file TXT vào đây';
-            }
-            updateFileInputs();
-        }
-
-        uploadArea.addEventListener('click', () => {
-            if (currentMode === 'audio') {
-                if (multipleMode) {
-                    document.getElementById('audioFiles').click();
-                } else {
-                    audioInput.click();
-                }
-            } else {
-                if (multipleMode) {
-                    document.getElementById('txtFiles').click();
-                } else {
-                    txtInput.click();
-                }
-            }
-        });
-        
-        uploadArea.addEventListener('dragover', (e) => {
-            e.preventDefault();
-            uploadArea.classList.add('dragover');
-        });
-        
-        uploadArea.addEventListener('dragleave', () => {
-            uploadArea.classList.remove('dragover');
-        });
-        
-        uploadArea.addEventListener('drop', (e) => {
-            e.preventDefault();
-            uploadArea.classList.remove('dragover');
-            const files = e.dataTransfer.files;
-            if (files.length > 0) {
-                if (currentMode === 'audio') {
-                    if (multipleMode) {
-                        document.getElementById('audioFiles').files = files;
-                    } else {
-                        audioInput.files = files;
-                    }
-                } else {
-                    if (multipleMode) {
-                        document.getElementById('txtFiles').files = files;
-                    } else {
-                        txtInput.files = files;
-                    }
-                }
-                const fileCount = files.length;
-                showStatus(`Đã chọn ${fileCount} file${fileCount > 1 ? 's' : ''}: ${files[0].name}${fileCount > 1 ? '...' : ''}`, 'success');
-            }
-        });
-
-        form.addEventListener('submit', async (e) => {
-            e.preventDefault();
-            const formData = new FormData(form);
-            
-            submitBtn.disabled = true;
-            submitBtn.textContent = 'Đang xử lý...';
-            showStatus('Đang tạo QR code...', 'success');
-
-            try {
-                let endpoint, response, data;
-                
-                if (multipleMode) {
-                    endpoint = '/api/batch-upload';
-                    response = await fetch(endpoint, {
-                        method: 'POST',
-                        body: formData
-                    });
-                    data = await response.json();
-                    
-                    if (response.ok) {
-                        const count = data.count || 0;
-                        showStatus(`Đã tạo thành công ${count} QR code${count > 1 ? 's' : ''}!`, 'success');
-                        setTimeout(() => {
-                            window.location.href = '/manage';
-                        }, 2000);
-                    } else {
-                        showStatus('Lỗi: ' + (data.error || 'Unknown error'), 'error');
-                    }
-                } else {
-                    endpoint = currentMode === 'audio' ? '/upload' : '/txt-to-qr';
-                    response = await fetch(endpoint, {
-                        method: 'POST',
-                        body: formData
-                    });
-                    data = await response.json();
-                    
-                    if (response.ok) {
-                        showStatus('Tạo QR code thành công!', 'success');
-                        displayQR(data.qr_code, data.audio_url, data.audio_path);
-                    } else {
-                        showStatus('Lỗi: ' + data.error, 'error');
-                    }
-                }
-            } catch (error) {
-                showStatus('Lỗi: ' + error.message, 'error');
-            } finally {
-                submitBtn.disabled = false;
-                submitBtn.textContent = 'Tạo QR Code';
-            }
-        });
-
-        function showStatus(message, type) {
-            status.textContent = message;
-            status.className = 'status ' + type;
-        }
-
-        function displayQR(qrBase64, audioUrl, audioPath) {
-            qrContainer.classList.add('active');
-            document.getElementById('qrCode').innerHTML = 
-                '<img src="data:image/png;base64,' + qrBase64 + '" alt="QR Code">';
-            
-            const fullUrl = window.location.origin + audioUrl;
-            document.getElementById('audioLink').innerHTML = 
-                '<strong>Link audio:</strong><br><a href="' + fullUrl + '" target="_blank">' + fullUrl + '</a>';
-            
-            document.getElementById('audioPreview').innerHTML = 
-                '<audio controls><source src="' + audioUrl + '" type="audio/mpeg">Trình duyệt không hỗ trợ audio.</audio>';
-            
-            window.qrImageBase64 = qrBase64;
-        }
-
-        function downloadQR() {
-            if (window.qrImageBase64) {
-                const link = document.createElement('a');
-                link.href = 'data:image/png;base64,' + window.qrImageBase64;
-                link.download = 'qrcode.png';
-                link.click();
-            }
-        }
-    </script>
-</body>
-</html>
-"""
+def add_qr_records(items, base_url):
+    """
+    Lưu nhiều record trong một lần ghi qr_data.json và một transaction chỉ mục
+    QR encode short link base_url/q/<code> thay vì URL audio đầy đủ.
+    
+    Args:
+        items: [(record, nội dung TXT gốc hoặc None)] - text dùng để index tìm kiếm
+    """
+    with store.transaction() as data:
+        for record, _ in items:
+            store.assign_short_link(record, base_url)
+            data.append(record)
+    try:
+        with span('search.add', count=len(items)):
+            search_index.add_many(items)
+    except Exception as e:
+        # Chỉ mục lỗi không làm hỏng upload; lần tìm sau đồng bộ lại record (không có nội dung TXT)
+        app.logger.warning('Khong index duoc %d record: %s', len(items), e)
+    return [record for record, _ in items]
 
+def add_qr_record(audio_filename, audio_url, base_url, title=None, qr=None, hls=None, text=None):
+    """
+    Thêm record QR code vào database
+    text: nội dung TXT gốc (nếu có) để index tìm kiếm
+    """
+    record = new_qr_record(audio_filename, audio_url, title, qr, hls)
+    add_qr_records([(record, text)], base_url)
+    return record
 
-# HTML template cho trang quản lý
-MANAGE_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="vi">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Quản Lý QR Codes</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            padding: 40px;
-            box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-        }
-        h1 {
-            color: #333;
-            margin-bottom: 30px;
-            text-align: center;
-        }
-        .header-actions {
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        .btn {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 12px 30px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 16px;
-            margin: 5px;
-            text-decoration: none;
-            display: inline-block;
-        }
-        .qr-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }
-        .qr-card {
-            background: #f8f9fa;
-            border-radius: 10px;
-            padding: 20px;
-            text-align: center;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
-        .qr-card h3 {
-            color: #333;
-            margin-bottom: 15px;
-            font-size: 18px;
-        }
-        .qr-card img {
-            max-width: 200px;
-            height: auto;
-            margin: 10px 0;
-        }
-        .qr-card audio {
-            width: 100%;
-            margin: 10px 0;
-        }
-        .qr-card .actions {
-            margin-top: 15px;
-        }
-        .btn-small {
-            padding: 8px 15px;
-            font-size: 14px;
-            margin: 5px;
-        }
-        .btn-danger {
-            background: #dc3545;
-        }
-        .empty-state {
-            text-align: center;
-            padding: 60px 20px;
-            color: #666;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>📋 Quản Lý QR Codes</h1>
-        <div class="header-actions">
-            <a href="/" class="btn">➕ Tạo QR Code Mới</a>
-            <button class="btn" onclick="location.reload()">🔄 Làm Mới</button>
-        </div>
-        <div class="qr-grid" id="qrGrid">
-            <div class="empty-state">
-                <p>Chưa có QR code nào. <a href="/">Tạo QR code mới</a></p>
-            </div>
-        </div>
-    </div>
-    <script>
-        async function loadQRList() {
-            const response = await fetch('/api/qr-list');
-            const data = await response.json();
-            const grid = document.getElementById('qrGrid');
-            
-            if (data.length === 0) {
-                grid.innerHTML = '<div class="empty-state"><p>Chưa có QR code nào. <a href="/">Tạo QR code mới</a></p></div>';
-                return;
-            }
-            
-            grid.innerHTML = data.map(item => `
-                <div class="qr-card">
-                    <h3>${escapeHtml(item.title)}</h3>
-                    <img src="data:image/png;base64,${item.qr_base64}" alt="QR Code">
-                    <audio controls><source src="${item.audio_url}" type="audio/mpeg"></audio>
-                    <div class="actions">
-                        <a href="${item.audio_url}" target="_blank" class="btn btn-small">🔗 Link</a>
-                        <a href="/qr-download/${item.id}" class="btn btn-small" download>⬇️ Tải QR (Chất lượng cao)</a>
-                        <button class="btn btn-small" onclick="downloadQR('${item.qr_base64}', '${escapeHtml(item.title)}')">⬇️ Tải QR (Nhanh)</button>
-                        <button class="btn btn-small btn-danger" onclick="deleteQR('${item.id}')">🗑️ Xóa</button>
-                    </div>
-                </div>
-            `).join('');
-        }
-        
-        function escapeHtml(text) {
-            const div = document.createElement('div');
-            div.textContent = text;
-            return div.innerHTML;
-        }
-        
-        function downloadQR(base64, title) {
-            const link = document.createElement('a');
-            link.href = 'data:image/png;base64,' + base64;
-            link.download = title.replace(/[^a-z0-9]/gi, '_') + '.png';
-            link.click();
-        }
-        
-        async function deleteQR(id) {
-            if (!confirm('Bạn có chắc muốn xóa QR code này?')) return;
-            
-            const response = await fetch(`/api/qr-delete/${id}`, { method: 'DELETE' });
-            if (response.ok) {
-                loadQRList();
-            } else {
-                alert('Lỗi khi xóa');
-            }
-        }
-        
-        loadQRList();
-    </script>
-</body>
-</html>
-"""
+def read_txt_upload(file):
+    """Nội dung file TXT upload (UTF-8), đọc trong bộ nhớ"""
+    try:
+        return file.read().decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Loi khi doc file TXT (can UTF-8): {e}")
+
+def store_synthesized(text, voice, format_type, cancel=None):
+    """
+    Convert text sang audio trong bộ nhớ, đóng gói HLS rồi ghi audio vào blob store
+    (ghi atomic: local ghi file tạm cùng thư mục rồi rename, S3 chỉ hiện object khi upload xong)
+    
+    Returns:
+        (tên file audio, thông tin HLS hoặc None)
+    """
+    audio = synthesize_text(text, voice, format_type, cancel=cancel, verbose=True)
+    audio_filename = f"{uuid.uuid4()}.{format_type}"
+    hls = package_audio(audio_filename, audio)
+    with span('blob.put', key=audio_filename):
+        blobs.put_stream(audio_filename, io.BytesIO(audio))
+    return audio_filename, hls
+
+def package_audio(audio_filename, source=None, version=None):
+    """Đóng gói HLS cho audio vừa lưu; lỗi thì bỏ qua (vẫn phát được MP3 thường)"""
+    try:
+        with span('hls.package'):
+            return package_hls(blobs, audio_filename, source, version=version)
+    except Exception as e:
+        app.logger.warning('Khong dong goi HLS duoc %s: %s', audio_filename, e)
+        return None
+
+# Templates (templates/) được compile một lần lúc khởi động;
+# CSS/JS nằm trong static/ và được serve qua URL có fingerprint
+assets = AssetManifest(Path(app.root_path) / 'static')
+assets.init_app(app)
+INDEX_PAGE = app.jinja_env.get_template('index.html')
+MANAGE_PAGE = app.jinja_env.get_template('manage.html')
+PLAY_PAGE = app.jinja_env.get_template('play.html')
+
+def _static_page(template):
+    """Render template không phụ thuộc request một lần; ETag = hash nội dung"""
+    html = template.render().encode('utf-8')
+    return html, hashlib.sha256(html).hexdigest()[:12]
+
+INDEX_HTML, INDEX_ETAG = _static_page(INDEX_PAGE)
+MANAGE_HTML, MANAGE_ETAG = _static_page(MANAGE_PAGE)
 
 @app.route('/')
 def index():
     """Trang chủ"""
-    return render_template_string(HTML_TEMPLATE)
+    return versioned_response('page-index', INDEX_ETAG, lambda: INDEX_HTML, mimetype='text/html')
 
 @app.route('/manage')
 def manage():
     """Trang quản lý QR codes"""
-    return render_template_string(MANAGE_TEMPLATE)
+    return versioned_response('page-manage', MANAGE_ETAG, lambda: MANAGE_HTML, mimetype='text/html')
 
 
 @app.route('/upload', methods=['POST'])
+@idempotent
 def upload_audio():
     """Upload audio file và generate QR code"""
     if 'audio' not in request.files:
@@ -606,59 +278,144 @@ def upload_audio():
         file_id = str(uuid.uuid4())
         file_ext = Path(filename).suffix
         saved_filename = f"{file_id}{file_ext}"
-        file_path = Path(app.config['UPLOAD_FOLDER']) / saved_filename
-        
-        file.save(file_path)
+        blobs.put_stream(saved_filename, file.stream, file.mimetype or 'audio/mpeg')
+        hls = package_audio(saved_filename)
         
         # Tạo URL cho audio
         audio_url = f'/audio/{saved_filename}'
-        full_url = request.url_root.rstrip('/') + audio_url
-        
-        # Generate QR code với chất lượng cao để in (High error correction)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction cho in
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(full_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert QR code to base64 (chất lượng cao)
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='PNG', optimize=False)
-        img_str = base64.b64encode(img_buffer.getvalue()).decode()
         
         # Lưu vào database
         title = request.form.get('title', filename)
-        add_qr_record(saved_filename, audio_url, full_url, img_str, title)
+        record = add_qr_record(saved_filename, audio_url, request.url_root, title, hls=hls)
+        
+        # QR code chất lượng cao để in (High error correction)
+        img_str = render_qr_base64(record['full_url'], **record['qr'])
         
         return jsonify({
             'qr_code': img_str,
+            'qr_url': f"/qr/{record['id']}.png",
             'audio_url': audio_url,
             'audio_path': saved_filename,
-            'full_url': full_url
+            'full_url': record['full_url']
         })
 
 
+def _found(response):
+    return not isinstance(response, tuple)
+
+def _send_blob(key, mimetype, max_age=None):
+    """Gửi blob: redirect tới URL của backend (S3), từ cache bộ nhớ (file hot) hoặc send_file từ đĩa"""
+    # Backend S3: client tải thẳng từ S3 (presigned URL), không qua worker
+    playback_url = blobs.playback_url(key)
+    if playback_url:
+        return redirect(playback_url, code=302)
+    
+    file_path = blobs.local_path(key)
+    # Range (trình phát audio luôn gửi, kể cả bytes=0-) serve từ bộ nhớ; request cả file
+    # để send_file dùng sendfile() của gunicorn (copy trong kernel, nhanh hơn)
+    if hot_cache is not None and 'Range' in request.headers:
+        entry = hot_cache.get(key, file_path)
+        if entry is not None:
+            return _send_cached(entry, file_path, mimetype, max_age)
+    if not file_path.is_file():
+        return jsonify({'error': 'File khong ton tai'}), 404
+    
+    return send_file(file_path, mimetype=mimetype, max_age=max_age)
+
+def _send_cached(entry, file_path, mimetype, max_age=None):
+    """Như send_file nhưng đọc từ bản mmap (cùng ETag/Last-Modified, hỗ trợ Range, 304)"""
+    response = app.response_class(FileWrapper(MemoryReader(entry.view), SEND_CHUNK_SIZE),
+                                  mimetype=mimetype, direct_passthrough=True)
+    response.content_length = entry.size
+    response.last_modified = entry.mtime
+    response.cache_control.no_cache = True
+    if max_age is not None:
+        if max_age > 0:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.expires = int(time.time() + max_age)
+    # ETag giống hệt send_file để If-None-Match/If-Range đúng dù request rơi vào worker nào
+    path = os.path.join(app.root_path, file_path)
+    response.set_etag(f"{entry.mtime}-{entry.size}-{adler32(path.encode()) & 0xFFFFFFFF}")
+    response = response.make_conditional(request.environ, accept_ranges=True, complete_length=entry.size)
+    if response.status_code == 206:
+        # Cắt đúng đoạn được yêu cầu từ vùng map (không đọc thừa theo buffer của FileWrapper)
+        content_range = response.content_range
+        response.response = iter_view(entry.view, content_range.start, content_range.stop, SEND_CHUNK_SIZE)
+    return response
+
+
 @app.route('/audio/<filename>')
 def serve_audio(filename):
-    """Serve audio file từ uploads hoặc audio_stories"""
-    # Thử tìm trong uploads folder trước
-    file_path = Path(app.config['UPLOAD_FOLDER']) / filename
-    if not file_path.exists():
-        # Thử tìm trong audio_stories folder
-        file_path = Path('audio_stories') / filename
-    
-    if not file_path.exists():
+    """Serve audio file (vị trí thật tra qua blob store, không dò thư mục)"""
+    # Không dùng secure_filename: file cũ trong audio_stories/ có dấu cách, tiếng Việt có dấu
+    if not is_public_name(filename):
+        return jsonify({'error': 'File khong ton tai'}), 404
+    response = _send_blob(filename, 'audio/mpeg')
+    if is_play_start(request.headers.get('Range')) and _found(response):
+        plays.record_play(filename)
+    return response
+
+
+@app.route('/audio/<stem>/index.m3u8')
+def serve_hls_playlist(stem):
+    """Playlist HLS của audio (luôn serve qua app: đoạn được tham chiếu theo URL tương đối)"""
+    key = f'{stem}/index.m3u8'
+    if not is_public_name(stem) or not blobs.exists(key):
+        return jsonify({'error': 'File khong ton tai'}), 404
+    with blobs.open(key) as f:
+        body = f.read()
+    response = app.response_class(body, mimetype=PLAYLIST_MIMETYPE)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+@app.route('/audio/<stem>/<segment>')
+def serve_hls_segment(stem, segment):
+    """Đoạn HLS (không đổi sau khi tạo nên cache lâu)"""
+    # Như serve_audio: stem của audio cũ có dấu cách, tiếng Việt có dấu
+    if not is_public_name(stem) or not is_public_name(segment):
         return jsonify({'error': 'File khong ton tai'}), 404
+    response = _send_blob(f'{stem}/{segment}', 'audio/mpeg', max_age=86400)
+    # Tua trong HLS tải đoạn giữa, chỉ đoạn đầu tính là một lượt nghe
+    if segment == 'seg_00000.mp3' and is_play_start(request.headers.get('Range')) and _found(response):
+        plays.record_play(stem)
+    return response
+
+
+@app.route('/q/<code>')
+def short_link(code):
+    """
+    Short link trong QR code (tra index trong bộ nhớ, O(1))
+    Trình duyệt nhận trang nghe (ưu tiên HLS nếu phát được), client khác được redirect tới audio.
+    """
+    qr_item = store.snapshot().by_code.get(code)
+    if not qr_item:
+        return jsonify({'error': 'QR code khong ton tai'}), 404
+    plays.record_scan(qr_item['audio_filename'])
+    # Backend S3: chuyển thẳng tới URL playback, bớt một lần redirect
+    audio_src = blobs.playback_url(qr_item['audio_filename']) or qr_item['audio_url']
     
-    return send_file(file_path, mimetype='audio/mpeg')
+    # Accept: */* (curl, app nghe nhạc) vẫn được redirect như cũ
+    if request.accept_mimetypes.best_match(['audio/mpeg', 'text/html']) == 'text/html':
+        hls_src = None
+        if qr_item.get('hls'):
+            hls_src = '/audio/' + quote(hls_key(qr_item['audio_filename']))
+        response = app.response_class(
+            PLAY_PAGE.render(title=qr_item.get('title'), audio_src=audio_src, hls_src=hls_src),
+            mimetype='text/html'
+        )
+    else:
+        response = redirect(audio_src, code=302)
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    response.headers['Vary'] = 'Accept'
+    return response
 
 
 @app.route('/txt-to-qr', methods=['POST'])
+@idempotent
+@admitted
 def txt_to_qr():
     """
     Upload TXT file -> Convert to Audio -> Generate QR Code
@@ -675,64 +432,41 @@ def txt_to_qr():
     format_type = request.form.get('format', 'mp3')
     
     try:
-        # Lưu file TXT tạm
         filename = secure_filename(file.filename)
-        temp_dir = Path('temp')
-        temp_dir.mkdir(exist_ok=True)
-        
-        file_id = str(uuid.uuid4())
-        temp_txt = temp_dir / f"{file_id}.txt"
-        file.save(temp_txt)
-        
-        # Convert TXT to Audio
-        audio_path = convert_txt_to_audio(
-            str(temp_txt),
-            output_path=None,
-            voice=voice,
-            format=format_type
-        )
+        text = read_txt_upload(file)
         
-        # Di chuyển audio file vào uploads folder
-        audio_filename = Path(audio_path).name
-        final_audio_path = Path(app.config['UPLOAD_FOLDER']) / audio_filename
-        Path(audio_path).rename(final_audio_path)
+        # Convert trong bộ nhớ rồi ghi thẳng vào blob store
+        # (huỷ khi client ngắt kết nối hoặc quá CONVERT_TIMEOUT)
+        audio_filename, hls = store_synthesized(text, voice, format_type, request_token(request.environ))
         
         # Tạo URL cho audio
         audio_url = f'/audio/{audio_filename}'
-        full_url = request.url_root.rstrip('/') + audio_url
-        
-        # Generate QR code với chất lượng cao để in (High error correction)
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction cho in
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(full_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert QR code to base64 (chất lượng cao)
-        img_buffer = BytesIO()
-        img.save(img_buffer, format='PNG', optimize=False)
-        img_str = base64.b64encode(img_buffer.getvalue()).decode()
         
         # Lưu vào database
         title = request.form.get('title', filename)
-        add_qr_record(audio_filename, audio_url, full_url, img_str, title)
+        with span('store.add'):
+            record = add_qr_record(audio_filename, audio_url, request.url_root, title, hls=hls, text=text)
         
-        # Xóa file TXT tạm
-        temp_txt.unlink()
+        # QR code chất lượng cao để in (High error correction)
+        with span('qr.render_base64'):
+            img_str = render_qr_base64(record['full_url'], **record['qr'])
         
         return jsonify({
             'qr_code': img_str,
+            'qr_url': f"/qr/{record['id']}.png",
             'audio_url': audio_url,
             'audio_path': audio_filename,
-            'full_url': full_url,
+            'full_url': record['full_url'],
             'message': 'Convert thanh cong'
         })
     
+    except TTSUnavailableError as e:
+        # TTS đang bị throttle/sập: báo client thử lại sau thay vì lỗi 500
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(int(e.retry_after or 30))
+        return response, 503
+    except Cancelled as e:
+        return cancelled_response(e, file.filename)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -740,128 +474,454 @@ def txt_to_qr():
 @app.route('/api/qr-list')
 def qr_list():
     """API: Lấy danh sách tất cả QR codes"""
-    data = load_qr_data()
-    # Sắp xếp theo thời gian tạo mới nhất
-    data.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return jsonify(data)
+    version = store.version()
+
+    def build():
+        data = list(store.snapshot().records)
+        # Sắp xếp theo thời gian tạo mới nhất
+        data.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        return app.json.dumps(data).encode('utf-8')
+
+    return versioned_response('qr-list', version, build)
 
 @app.route('/api/qr-delete/<qr_id>', methods=['DELETE'])
 def qr_delete(qr_id):
     """API: Xóa QR code"""
-    data = load_qr_data()
-    data = [item for item in data if item['id'] != qr_id]
-    save_qr_data(data)
+    with store.transaction() as data:
+        data[:] = [item for item in data if item['id'] != qr_id]
+    try:
+        search_index.remove(qr_id)
+    except Exception as e:
+        app.logger.warning('Khong xoa duoc record %s khoi chi muc: %s', qr_id, e)
     return jsonify({'status': 'ok'})
 
+BULK_ACTIONS = ('delete', 'retitle', 'base-url', 'resynthesize')
+
+def _update_index(func, items):
+    """Cập nhật chỉ mục tìm kiếm hàng loạt; lỗi không làm hỏng thao tác (lần tìm sau đồng bộ lại)"""
+    try:
+        with span('search.bulk'):
+            func(items)
+    except Exception as e:
+        app.logger.warning('Khong cap nhat duoc chi muc (%d record): %s', len(items), e)
+
+def _resynthesize(record, voice, cancel=None):
+    """
+    Tạo lại audio của record từ TXT gốc trong model_txt (giữ tên file, URL và QR)
+
+    Returns:
+        (các trường cần cập nhật trong record, nội dung TXT)
+    """
+    text = (source_text(record) or '').strip()
+    if not text:
+        raise ValueError('Khong co noi dung TXT goc (chi tao lai duoc record tu model_txt)')
+    audio_filename = record['audio_filename']
+    audio = synthesize_text(text, voice, Path(audio_filename).suffix.lstrip('.').lower(), cancel=cancel)
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    # Đổi version trong playlist để player không dùng đoạn HLS cũ đã cache
+    hls = package_audio(audio_filename, audio, version=digest[:8])
+    with span('blob.put', key=audio_filename):
+        blobs.put_stream(audio_filename, io.BytesIO(audio))
+    return {'hls': hls, 'text_sha256': digest, 'updated_at': datetime.now().isoformat()}, text
+
+@app.route('/api/bulk/<action>', methods=['POST'])
+def bulk(action):
+    """
+    API: Thao tác hàng loạt, ghi qr_data.json một lần (xem bulk_ops.py)
+    POST /api/bulk/<delete|retitle|base-url|resynthesize>, body JSON chọn record bằng
+    {"ids": [...]} hoặc {"collection": "<thư mục trong model_txt>"} (thư mục gốc "" cần thêm
+    "all": true), kèm:
+      retitle: "title" (cho mọi record) hoặc "titles": {id: tiêu đề} (thay cho ids)
+      base-url: "base_url" (QR trỏ về base_url/q/<code>, short code giữ nguyên)
+      resynthesize: "voice" (tuỳ chọn); chỉ record có TXT gốc trong model_txt
+    """
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': f'Thao tac khong ho tro: {action}'}), 404
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Can body JSON'}), 400
+    titles = body.get('titles') if action == 'retitle' else None
+    if titles is not None and not (isinstance(titles, dict) and all(
+            isinstance(title, str) and title.strip() for title in titles.values())):
+        return jsonify({'error': 'titles phai la {id: tieu de}'}), 400
+    # titles chọn luôn các record cần đổi
+    ids = list(titles) if titles else body.get('ids')
+    collection = body.get('collection')
+    if ids is not None and not (isinstance(ids, list) and ids and all(isinstance(i, str) for i in ids)):
+        return jsonify({'error': 'ids phai la danh sach id khong rong'}), 400
+    if ids is None and not isinstance(collection, str):
+        return jsonify({'error': 'Can ids hoac collection'}), 400
+    # Collection gốc ("" hoặc "/") là mọi record của model_txt: phải xác nhận bằng "all": true
+    if ids is None and not collection.strip('/') and body.get('all') is not True:
+        return jsonify({'error': 'collection goc chon toan bo model_txt, gui kem "all": true de xac nhan'}), 400
+    match = record_filter(ids, collection)
+    result = {'action': action}
+
+    if action == 'delete':
+        with span('store.bulk_delete'):
+            records = delete_records(store, match)
+        _update_index(search_index.remove_many, [record['id'] for record in records])
+
+    elif action == 'retitle':
+        title = body.get('title')
+        if titles is None and not (isinstance(title, str) and title.strip()):
+            return jsonify({'error': 'Can title hoac titles'}), 400
+
+        def retitle(record):
+            record['title'] = (titles or {}).get(record['id'], title).strip()
+
+        with span('store.bulk_update'):
+            records = update_records(store, match, retitle)
+        _update_index(search_index.retitle_many, records)
+
+    elif action == 'base-url':
+        base_url = body.get('base_url')
+        if not isinstance(base_url, str) or not base_url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'base_url phai bat dau bang http:// hoac https://'}), 400
+
+        def rebase(record):
+            # Ảnh QR render lại từ full_url khi được yêu cầu (cache theo version của store)
+            if record.get('short_code'):
+                record['full_url'] = f"{base_url.rstrip('/')}/q/{record['short_code']}"
+            else:
+                store.assign_short_link(record, base_url)
+
+        with span('store.bulk_update'):
+            records = update_records(store, match, rebase)
+
+    else:
+        voice = body.get('voice') or 'vi-VN-HoaiMyNeural'
+        selected = [record for record in store.snapshot().records if match(record)]
+        environ = request.environ
+        # Mỗi record tốn một token của client; cả lệnh giữ một slot convert.
+        # Audio tạo song song ngoài lock của store, rồi ghi mọi record trong một transaction
+        with admission.admit(client_id(request, TRUST_PROXY), max(1, len(selected))):
+            outcomes = run_parallel(selected, lambda record: _resynthesize(record, voice, request_token(environ)))
+        updates, texts, errors = {}, {}, []
+        for record, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                if isinstance(outcome, Cancelled):
+                    cancellation.record_cancellation(outcome.reason)
+                errors.append({'id': record['id'], 'title': record.get('title'), 'error': str(outcome)})
+            else:
+                updates[record['id']], texts[record['id']] = outcome
+        result['missing'] = missing_ids(ids, selected) if ids is not None else []
+        with span('store.bulk_update'):
+            records = apply_updates(store, updates)
+        _update_index(search_index.add_many, [(record, texts[record['id']]) for record in records])
+        result['errors'] = errors
+
+    result.update(count=len(records), ids=[record['id'] for record in records])
+    result.setdefault('missing', missing_ids(ids, records) if ids is not None else [])
+    return jsonify(result)
+
+@app.route('/api/search')
+def search():
+    """
+    API: Tìm QR theo tiêu đề, collection, nội dung TXT (không phân biệt dấu)
+    ?q=<từ khoá>&collection=<thư mục>&page=1&per_page=20
+    """
+    query = request.args.get('q', '')
+    collection = request.args.get('collection') or None
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(100, max(1, int(request.args.get('per_page', 20))))
+    except ValueError:
+        return jsonify({'error': 'page/per_page khong hop le'}), 400
+    
+    snapshot = store.snapshot()
+    # Record do process khác ghi (merge, import) được index ở thread nền, không chặn request
+    search_index.sync_in_background(store, source_text)
+    with span('search.query'):
+        total, hits = search_index.search(query, limit=per_page, offset=(page - 1) * per_page,
+                                          collection=collection)
+    results = []
+    for record_id, score in hits:
+        record = snapshot.by_id.get(record_id)
+        if record is not None:
+            results.append(dict(record, score=score))
+    return jsonify({'query': query, 'collection': collection, 'total': total,
+                    'page': page, 'per_page': per_page, 'results': results})
+
+@app.route('/qr/<qr_id>.png')
+def qr_image(qr_id):
+    """Ảnh QR code của record (render từ tham số, có cache; ETag theo nội dung ảnh của record)"""
+    qr_item = store.snapshot().by_id.get(qr_id)
+    
+    if not qr_item:
+        return jsonify({'error': 'QR code khong ton tai'}), 404
+    
+    return versioned_response(f'qr-{qr_id}', record_png_version(qr_item),
+                              lambda: render_record_png(qr_item),
+                              mimetype='image/png', compressible=False)
+
 @app.route('/qr-download/<qr_id>')
 def qr_download(qr_id):
     """Download QR code với chất lượng cao để in"""
-    data = load_qr_data()
-    qr_item = next((item for item in data if item['id'] == qr_id), None)
+    qr_item = store.snapshot().by_id.get(qr_id)
     
     if not qr_item:
         return jsonify({'error': 'QR code khong ton tai'}), 404
     
-    # Tạo QR code với kích thước lớn hơn để in
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=20,  # Kích thước lớn hơn để in
-        border=4,
-    )
-    qr.add_data(qr_item['full_url'])
-    qr.make(fit=True)
+    filename = secure_filename(qr_item['title']) + '_qrcode.png'
+    # Kích thước lớn hơn để in; tên file nằm trong header nên cũng vào version
+    response = versioned_response(f'qr-download-{qr_id}',
+                                  record_png_version(qr_item, filename, box_size=20),
+                                  lambda: render_record_png(qr_item, box_size=20),
+                                  mimetype='image/png', compressible=False)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Số file của một batch xử lý song song (số lời gọi TTS thực sự do tts_limiter điều tiết)
+BATCH_MAX_WORKERS = max(1, int(os.environ.get('BATCH_MAX_WORKERS', 4)))
+
+def _stage_batch():
+    """
+    Giữ lại các file của batch ngay trong request (file upload bị đóng khi view trả về,
+    trước khi response NDJSON chạy xong): TXT đọc vào bộ nhớ, audio lưu ra thư mục tạm
+    
+    Returns:
+        (tham số chung của batch, danh sách job: dict kind, filename, text hoặc path, mimetype)
+    """
+    options = {
+        'title': request.form.get('title'),
+        'base_url': request.url_root,
+        'voice': request.form.get('voice', 'vi-VN-HoaiMyNeural'),
+        'format': request.form.get('format', 'mp3'),
+        'environ': request.environ,
+    }
+    temp_dir = Path(app.config['TEMP_FOLDER'])
+    jobs = []
+    for field, kind in (('audio_files', 'audio'), ('txt_files', 'txt')):
+        for file in request.files.getlist(field):
+            if not file.filename:
+                continue
+            job = {'kind': kind, 'filename': file.filename, 'mimetype': file.mimetype or 'audio/mpeg'}
+            if kind == 'txt':
+                try:
+                    job['text'] = read_txt_upload(file)
+                except ValueError as e:
+                    job['error'] = str(e)
+            else:
+                job['path'] = temp_dir / f"{uuid.uuid4()}{Path(secure_filename(file.filename)).suffix}"
+                file.save(job['path'])
+            jobs.append(job)
+    return options, jobs
+
+def _discard_staged(jobs):
+    """Xoá file tạm còn sót (batch bị ngắt giữa chừng)"""
+    for job in jobs:
+        if 'path' in job:
+            job['path'].unlink(missing_ok=True)
+
+def _batch_audio_file(job, title):
+    """Lưu một file audio của batch vào blob store, trả (record chưa lưu, None)"""
+    filename = secure_filename(job['filename'])
+    saved_filename = f"{uuid.uuid4()}{Path(filename).suffix}"
+    hls = package_audio(saved_filename, job['path'])
+    with span('blob.put', key=saved_filename):
+        blobs.put_file(saved_filename, job['path'], job['mimetype'])
+    
+    audio_url = f'/audio/{saved_filename}'
+    return new_qr_record(saved_filename, audio_url, title or filename, hls=hls), None
+
+def _batch_txt_file(job, title, voice, format_type, cancel=None):
+    """Convert một file TXT của batch sang audio, trả (record chưa lưu, text)"""
+    filename = secure_filename(job['filename'])
+    if 'error' in job:
+        raise ValueError(job['error'])
+    audio_filename, hls = store_synthesized(job['text'], voice, format_type, cancel)
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    audio_url = f'/audio/{audio_filename}'
+    return new_qr_record(audio_filename, audio_url, title or filename, hls=hls), job['text']
+
+def _prepare_batch_file(job, options):
+    """Xử lý một file của batch (chạy trong pool): audio vào blob store, record chưa lưu"""
+    with span('batch.file', kind=job['kind']):
+        if job['kind'] == 'audio':
+            return _batch_audio_file(job, options['title'])
+        return _batch_txt_file(job, options['title'], options['voice'], options['format'],
+                               request_token(options['environ']))
+
+def _commit_batch(done, base_url):
+    """
+    Lưu các file đã xong trong một lần ghi
     
-    # Save to BytesIO
-    img_buffer = BytesIO()
-    img.save(img_buffer, format='PNG', optimize=False)
-    img_buffer.seek(0)
+    Args:
+        done: [(job, (record, text) hoặc dict lỗi)] theo thứ tự upload
     
-    filename = secure_filename(qr_item['title']) + '_qrcode.png'
-    return send_file(img_buffer, mimetype='image/png', as_attachment=True, download_name=filename)
+    Returns:
+        Kết quả (record hoặc lỗi) theo cùng thứ tự
+    """
+    items = [result for _, result in done if isinstance(result, tuple)]
+    if items:
+        try:
+            with span('store.add', count=len(items)):
+                add_qr_records(items, base_url)
+        except Exception as e:
+            return [{'error': str(e), 'filename': job['filename']} if isinstance(result, tuple) else result
+                    for job, result in done]
+    return [result[0] if isinstance(result, tuple) else result for _, result in done]
+
+def _iter_batch_results(options, jobs, progressive=False):
+    """
+    Xử lý song song các file của batch (tối đa BATCH_MAX_WORKERS file), yield record
+    (hoặc lỗi) theo đúng thứ tự upload; lỗi của một file không ảnh hưởng file khác
+    
+    Record của cả batch được lưu vào qr_data.json trong một lần ghi. progressive=True (NDJSON):
+    mỗi khi file kế tiếp theo thứ tự xong thì lưu (một lần ghi) và yield mọi file liền sau đã xong,
+    để client thấy kết quả dần dần.
+    Mỗi file TXT có deadline CONVERT_TIMEOUT riêng; client ngắt kết nối thì dừng cả batch
+    (file đã convert xong nhưng chưa lưu thì bỏ).
+    """
+    if not jobs:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(jobs)))
+    try:
+        futures = [submit(executor, _prepare_batch_file, job, options) for job in jobs]
+        done = []
+        for i, (job, future) in enumerate(zip(jobs, futures)):
+            try:
+                done.append((job, future.result()))
+            except Cancelled as e:
+                cancellation.record_cancellation(e.reason)
+                app.logger.info('Huy convert %s: %s', job['filename'], e.reason)
+                # Có dòng lỗi nên batch dở không được lưu làm kết quả idempotency
+                done.append((job, {'error': str(e), 'filename': job['filename']}))
+                if e.reason == 'disconnect':
+                    break
+            except Exception as e:
+                done.append((job, {'error': str(e), 'filename': job['filename']}))
+            if progressive and i + 1 < len(futures) and not futures[i + 1].done():
+                yield from _commit_batch(done, options['base_url'])
+                done = []
+        yield from _commit_batch(done, options['base_url'])
+    finally:
+        # Huỷ/ngắt giữa chừng: bỏ file chưa chạy; file TXT đang convert tự dừng khi thấy token bị huỷ
+        executor.shutdown(wait=True, cancel_futures=True)
 
 @app.route('/api/batch-upload', methods=['POST'])
 def batch_upload():
-    """API: Upload nhiều file cùng lúc"""
-    results = []
+    """
+    API: Upload nhiều file cùng lúc
     
-    # Xử lý upload audio
-    if 'audio_files' in request.files:
-        files = request.files.getlist('audio_files')
-        for file in files:
-            if file.filename:
-                try:
-                    filename = secure_filename(file.filename)
-                    file_id = str(uuid.uuid4())
-                    file_ext = Path(filename).suffix
-                    saved_filename = f"{file_id}{file_ext}"
-                    file_path = Path(app.config['UPLOAD_FOLDER']) / saved_filename
-                    file.save(file_path)
-                    
-                    audio_url = f'/audio/{saved_filename}'
-                    full_url = request.url_root.rstrip('/') + audio_url
-                    
-                    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
-                    qr.add_data(full_url)
-                    qr.make(fit=True)
-                    img = qr.make_image(fill_color="black", back_color="white")
-                    img_buffer = BytesIO()
-                    img.save(img_buffer, format='PNG', optimize=False)
-                    img_str = base64.b64encode(img_buffer.getvalue()).decode()
-                    
-                    title = request.form.get('title', filename)
-                    record = add_qr_record(saved_filename, audio_url, full_url, img_str, title)
-                    results.append(record)
-                except Exception as e:
-                    results.append({'error': str(e), 'filename': file.filename})
-    
-    # Xử lý upload TXT
-    if 'txt_files' in request.files:
-        files = request.files.getlist('txt_files')
-        voice = request.form.get('voice', 'vi-VN-HoaiMyNeural')
-        format_type = request.form.get('format', 'mp3')
-        
-        for file in files:
-            if file.filename:
-                try:
-                    filename = secure_filename(file.filename)
-                    temp_dir = Path('temp')
-                    file_id = str(uuid.uuid4())
-                    temp_txt = temp_dir / f"{file_id}.txt"
-                    file.save(temp_txt)
-                    
-                    audio_path = convert_txt_to_audio(str(temp_txt), output_path=None, voice=voice, format=format_type)
-                    audio_filename = Path(audio_path).name
-                    final_audio_path = Path(app.config['UPLOAD_FOLDER']) / audio_filename
-                    Path(audio_path).rename(final_audio_path)
-                    
-                    audio_url = f'/audio/{audio_filename}'
-                    full_url = request.url_root.rstrip('/') + audio_url
-                    
-                    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
-                    qr.add_data(full_url)
-                    qr.make(fit=True)
-                    img = qr.make_image(fill_color="black", back_color="white")
-                    img_buffer = BytesIO()
-                    img.save(img_buffer, format='PNG', optimize=False)
-                    img_str = base64.b64encode(img_buffer.getvalue()).decode()
-                    
-                    title = request.form.get('title', filename)
-                    record = add_qr_record(audio_filename, audio_url, full_url, img_str, title)
-                    results.append(record)
-                    
-                    temp_txt.unlink()
-                except Exception as e:
-                    results.append({'error': str(e), 'filename': file.filename})
-    
-    return jsonify({'results': results, 'count': len(results)})
+    Mặc định trả một JSON khi xong cả batch. Với ?stream=1 hoặc
+    Accept: application/x-ndjson, trả NDJSON: mỗi dòng là record (hoặc lỗi) của một file,
+    theo thứ tự upload, ngay khi file đó và các file trước nó xong; dòng cuối là
+    {"done": true, "count": ...}. Các file được xử lý song song (BATCH_MAX_WORKERS).
+    """
+    stream = (request.args.get('stream') == '1'
+              or 'application/x-ndjson' in request.headers.get('Accept', ''))
+    
+    key, ttl = idempotency_key()
+    result, claim = idempotency.begin(key)
+    if result is not None:
+        return _replayed(_batch_response(iter(result['body']['results']), stream))
+    
+    try:
+        # Mỗi file TXT tốn một token của client; cả batch giữ một slot convert
+        cost = max(1, len([f for f in request.files.getlist('txt_files') if f.filename]))
+        slot = admission.admit(client_id(request, TRUST_PROXY), cost)
+    except Exception:
+        claim.release()
+        raise
+    try:
+        options, jobs = _stage_batch()
+    except Exception:
+        slot.release()
+        claim.release()
+        raise
+    
+    def finish(results):
+        # Batch có file lỗi không lưu: gửi lại thì làm lại
+        if results and not any('error' in r for r in results):
+            claim.complete(200, {'results': results, 'count': len(results)}, ttl)
+    
+    if not stream:
+        try:
+            with slot:
+                results = list(_iter_batch_results(options, jobs))
+            finish(results)
+        finally:
+            _discard_staged(jobs)
+            claim.release()
+        return jsonify({'results': results, 'count': len(results)})
+    
+    def collect():
+        results = []
+        for result in _iter_batch_results(options, jobs, progressive=True):
+            results.append(result)
+            yield result
+        finish(results)
+    
+    response = _batch_response(collect(), stream)
+    # Giữ slot và khoá idempotency tới khi stream xong (hoặc client ngắt kết nối)
+    response.call_on_close(lambda: _discard_staged(jobs))
+    response.call_on_close(slot.release)
+    response.call_on_close(claim.release)
+    return response
+
+def _batch_response(results, stream):
+    """Kết quả batch dạng JSON, hoặc NDJSON (mỗi kết quả một dòng ngay khi có)"""
+    if not stream:
+        results = list(results)
+        return jsonify({'results': results, 'count': len(results)})
+    
+    def generate():
+        count = errors = 0
+        for result in results:
+            count += 1
+            if 'error' in result:
+                errors += 1
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+        yield json.dumps({'done': True, 'count': count, 'errors': errors}) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Nginx: không buffer response, gửi từng dòng ngay cho client
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/stats')
+def stats():
+    """
+    API: Các QR được nghe/quét nhiều nhất
+    ?by=plays|scans (mặc định plays), ?limit=N (mặc định 10)
+    """
+    by = request.args.get('by', 'plays')
+    if by not in ('plays', 'scans'):
+        return jsonify({'error': 'by phai la plays hoac scans'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 1000))
+    except ValueError:
+        return jsonify({'error': 'limit khong hop le'}), 400
+    # Số liệu đã ghi + phần chưa flush của worker này (worker khác ghi sau tối đa một chu kỳ flush)
+    rows = top_records(store.snapshot().records, plays.pending(), by=by, limit=limit)
+    return jsonify({'by': by, 'results': rows, 'flush_interval': plays.flush_interval})
+
+@app.route('/api/export')
+def export_library():
+    """Tải toàn bộ thư viện (record + audio) dạng tar, stream không qua file tạm (xem library_archive.py)"""
+    stats = {}
+    
+    def generate():
+        yield from iter_export(store, blobs, stats)
+        if stats['missing']:
+            app.logger.warning('Export thieu %d blob: %s', len(stats['missing']), stats['missing'][:10])
+        if stats['invalid']:
+            app.logger.warning('Export bo qua %d blob ten khong hop le: %s', len(stats['invalid']), stats['invalid'][:10])
+    
+    response = Response(generate(), mimetype='application/x-tar')
+    filename = f"library-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tar"
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'tts': get_limiter().snapshot(), 'admission': admission.snapshot(),
+                    'cancelled': cancellation.snapshot(),
+                    'hot_cache': hot_cache.snapshot() if hot_cache is not None else None})
 
 
 if __name__ == '__main__':
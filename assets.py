@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static assets có fingerprint theo nội dung (css/index.css -> css/index.3fa9c2d1.css)
+Manifest được build một lần lúc khởi động; URL đổi khi nội dung đổi nên có thể
+cache vĩnh viễn phía client (Cache-Control: immutable).
+"""
+
+import hashlib
+from pathlib import Path
+from flask import send_from_directory, abort
+
+# Một năm - URL có hash nên không bao giờ bị stale
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetManifest:
+    """Ánh xạ tên gốc <-> tên có hash cho các file trong static/"""
+
+    def __init__(self, static_dir, url_prefix='/assets'):
+        self.static_dir = Path(static_dir)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.hashed = {}   # 'css/index.css' -> 'css/index.3fa9c2d1.css'
+        self.original = {}  # ngược lại
+        self.build()
+
+    def build(self):
+        """Tính hash cho mọi file trong static/"""
+        self.hashed.clear()
+        self.original.clear()
+        if not self.static_dir.exists():
+            return
+        for path in sorted(self.static_dir.rglob('*')):
+            if not path.is_file():
+                continue
+            logical = path.relative_to(self.static_dir).as_posix()
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()[:8]
+            hashed = path.with_name(f'{path.stem}.{digest}{path.suffix}')
+            hashed = hashed.relative_to(self.static_dir).as_posix()
+            self.hashed[logical] = hashed
+            self.original[hashed] = logical
+
+    def url_for(self, logical):
+        """URL có fingerprint cho một asset (dùng trong template: asset_url(...))"""
+        return f'{self.url_prefix}/{self.hashed[logical]}'
+
+    def send(self, hashed):
+        """Serve asset theo tên có hash với header immutable"""
+        logical = self.original.get(hashed)
+        if logical is None:
+            abort(404)
+        response = send_from_directory(self.static_dir, logical, max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        return response
+
+    def init_app(self, app):
+        """Đăng ký route /assets/<path> và hàm asset_url cho template"""
+        app.add_url_rule(f'{self.url_prefix}/<path:hashed>', 'assets', self.send)
+        app.jinja_env.globals['asset_url'] = self.url_for
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bố cục thư mục chia shard cho audio: uploads/ab/cd/<filename>
+(ab/cd lấy từ hash của tên file nên phân bố đều, mỗi thư mục ít file).
+
+File cũ nằm phẳng trong uploads/ hoặc audio_stories/ được ghi trong path index
+(uploads/.path_index.json: tên public -> đường dẫn thật) cho tới khi được
+migrate_uploads.py chuyển sang vị trí shard. /audio/<filename> chỉ cần tra
+index trong bộ nhớ, không phải thử lần lượt từng thư mục; file cũ được thêm vào
+thư mục cũ sau khi tạo index thì tra thẳng đĩa khi không thấy ở vị trí shard.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+LEGACY_DIRS = ('uploads', 'audio_stories')
+INDEX_NAME = '.path_index.json'
+
+
+def shard_dirs(filename):
+    """Hai cấp thư mục shard của một tên file ('ab', 'cd')"""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def is_public_name(filename) -> bool:
+    """
+    Tên public dùng được làm tên file: nằm gọn trong thư mục chứa nó (không '/', '..'),
+    không phải file ẩn. Cho phép dấu cách, tiếng Việt có dấu (tên file cũ trong audio_stories/)
+    """
+    if not filename or filename.startswith('.') or '\0' in filename or '\\' in filename:
+        return False
+    base = os.path.abspath(os.sep)
+    path = os.path.normpath(os.path.join(base, filename))
+    return os.path.dirname(path) == base and os.path.basename(path) == filename
+
+
+class AudioPathIndex:
+    """Tra đường dẫn thật của audio từ tên public"""
+
+    def __init__(self, root='uploads', legacy_dirs=LEGACY_DIRS):
+        self.root = Path(root)
+        self.legacy_dirs = [Path(d) for d in legacy_dirs]
+        self.index_file = self.root / INDEX_NAME
+        self._entries = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    # -- Index ------------------------------------------------------------
+
+    def _load(self):
+        """Load lại index khi file index đổi (một stat mỗi lần tra)"""
+        try:
+            mtime = self.index_file.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return self._entries
+        with self._lock:
+            entries = {}
+            if mtime is not None:
+                try:
+                    with open(self.index_file, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                except (OSError, ValueError):
+                    entries = {}
+            self._entries, self._mtime = entries, mtime
+        return entries
+
+    def entries(self):
+        """Bản sao các file đang nằm ngoài vị trí shard"""
+        return dict(self._load())
+
+    def save_entries(self, entries):
+        """Ghi index (atomic)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_name(f'{INDEX_NAME}.tmp{os.getpid()}')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp, self.index_file)
+
+    def scan_legacy(self):
+        """Liệt kê file audio nằm phẳng trong các thư mục cũ"""
+        entries = {}
+        # Thư mục đứng sau không ghi đè thư mục đứng trước (uploads ưu tiên)
+        for directory in reversed(self.legacy_dirs):
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        entries[entry.name] = (directory / entry.name).as_posix()
+        return entries
+
+    def ensure(self):
+        """Tạo index lần đầu từ các thư mục cũ (nếu chưa có)"""
+        if not self.index_file.exists():
+            self.save_entries(self.scan_legacy())
+
+    # -- Tra cứu -------------------------------------------------------------
+
+    def shard_path(self, filename):
+        """Vị trí shard của một tên file"""
+        a, b = shard_dirs(filename)
+        return self.root / a / b / filename
+
+    def resolve(self, filename):
+        """Đường dẫn thật của audio (file cũ theo index, còn lại theo shard)"""
+        legacy = self._load().get(filename)
+        if legacy is not None:
+            return Path(legacy).absolute()
+        path = self.shard_path(filename)
+        if not path.exists() and is_public_name(filename):
+            # Index chỉ quét thư mục cũ một lần: file thêm vào sau đó tra thẳng đĩa
+            for directory in self.legacy_dirs:
+                candidate = directory / filename
+                if candidate.is_file():
+                    return candidate.absolute()
+        return path.absolute()
+
+    def path_for_new(self, filename):
+        """Đường dẫn để ghi audio mới (tạo thư mục shard nếu chưa có)"""
+        path = self.shard_path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lưu trữ audio qua một lớp blob storage thay cho đường dẫn local cố định:
+- LocalBlobStore: đĩa local, bố cục shard uploads/ab/cd/ (xem audio_paths.py)
+- S3BlobStore: S3 hoặc dịch vụ tương thích S3 (MinIO, ...), upload multipart
+  streaming, phát audio bằng presigned URL (client tải thẳng từ S3)
+
+Key của blob là tên file public của audio (phần <filename> trong /audio/<filename>).
+Chọn backend bằng biến môi trường BLOB_BACKEND=local|s3.
+"""
+
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from audio_paths import AudioPathIndex, shard_dirs
+
+# Kích thước mỗi phần khi upload multipart lên S3
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class BlobStore(ABC):
+    """Giao diện chung của các backend"""
+
+    @abstractmethod
+    def put_stream(self, key, stream, content_type='audio/mpeg'):
+        """Ghi blob từ một stream (file upload), không đọc hết vào bộ nhớ"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_file(self, key, local_path, content_type='audio/mpeg'):
+        """Ghi blob từ file local; file local bị chuyển đi/xoá sau khi ghi"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, key) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def size(self, key) -> int:
+        """Kích thước blob (byte)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, key):
+        """Mở blob để đọc (file-like, nhị phân)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key):
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Đường dẫn trên đĩa nếu backend là local, ngược lại None"""
+        return None
+
+    def playback_url(self, key):
+        """URL để client tải thẳng (không qua Python worker), None nếu không có"""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """Blob trên đĩa local, chia shard uploads/ab/cd/<key>"""
+
+    def __init__(self, root='uploads'):
+        self.paths = AudioPathIndex(root)
+        self.paths.ensure()
+
+    def put_stream(self, key, stream, content_type='audio/mpeg'):
+        path = self.paths.path_for_new(key)
+        # Tên tạm duy nhất (nhiều thread/process có thể ghi cùng key)
+        fd, tmp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+            os.chmod(tmp, 0o644)  # mkstemp tạo 0600
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        return key
+
+    def put_file(self, key, local_path, content_type='audio/mpeg'):
+        path = self.paths.path_for_new(key)
+        try:
+            os.replace(local_path, path)
+        except OSError:
+            # Khác filesystem: copy rồi xoá
+            with open(local_path, 'rb') as src:
+                self.put_stream(key, src, content_type)
+            Path(local_path).unlink()
+        return key
+
+    def exists(self, key):
+        return self.paths.resolve(key).is_file()
+
+    def size(self, key):
+        return self.paths.resolve(key).stat().st_size
+
+    def open(self, key):
+        return open(self.paths.resolve(key), 'rb')
+
+    def delete(self, key):
+        path = self.paths.resolve(key)
+        if path.is_file():
+            path.unlink()
+
+    def local_path(self, key):
+        return self.paths.resolve(key)
+
+
+class S3BlobStore(BlobStore):
+    """Blob trên S3 / dịch vụ tương thích S3"""
+
+    def __init__(self, bucket, prefix='audio/', endpoint_url=None, region=None,
+                 presign_expires=3600, public_base_url=None, client=None):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            if client is None:
+                raise ImportError("Can cai dat boto3 de dung S3: pip install boto3")
+            boto3 = TransferConfig = None
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        # client: truyền sẵn client tương thích boto3 (test), mặc định tạo từ boto3
+        self.client = client or boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        # Upload theo từng phần 8MB, không cần biết trước kích thước stream
+        self.transfer_kwargs = {}
+        if TransferConfig is not None:
+            self.transfer_kwargs['Config'] = TransferConfig(
+                multipart_threshold=MULTIPART_CHUNK_SIZE,
+                multipart_chunksize=MULTIPART_CHUNK_SIZE,
+            )
+
+    def _object_key(self, key):
+        a, b = shard_dirs(key)
+        return f'{self.prefix}{a}/{b}/{key}'
+
+    def put_stream(self, key, stream, content_type='audio/mpeg'):
+        self.client.upload_fileobj(
+            stream, self.bucket, self._object_key(key),
+            ExtraArgs={'ContentType': content_type},
+            **self.transfer_kwargs,
+        )
+        return key
+
+    def put_file(self, key, local_path, content_type='audio/mpeg'):
+        self.client.upload_file(
+            str(local_path), self.bucket, self._object_key(key),
+            ExtraArgs={'ContentType': content_type},
+            **self.transfer_kwargs,
+        )
+        Path(local_path).unlink()
+        return key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, key):
+        response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response['ContentLength']
+
+    def open(self, key):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def playback_url(self, key):
+        if self.public_base_url:
+            # Bucket public / CDN: URL cố định, cache được
+            return f'{self.public_base_url}/{self._object_key(key)}'
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._object_key(key)},
+            ExpiresIn=self.presign_expires,
+        )
+
+
+def create_blob_store(upload_folder='uploads'):
+    """Tạo blob store theo biến môi trường BLOB_BACKEND"""
+    backend = os.environ.get('BLOB_BACKEND', 'local').lower()
+    if backend == 's3':
+        return S3BlobStore(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', 'audio/'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            region=os.environ.get('S3_REGION') or None,
+            presign_expires=int(os.environ.get('S3_PRESIGN_EXPIRES', 3600)),
+            public_base_url=os.environ.get('S3_PUBLIC_BASE_URL') or None,
+        )
+    if backend != 'local':
+        raise ValueError(f"BLOB_BACKEND khong hop le: {backend} (local hoac s3)")
+    return LocalBlobStore(upload_folder)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thao tác hàng loạt trên record QR (xoá, đổi tiêu đề, đổi base URL, tạo lại audio):
+- Chọn record theo danh sách id hoặc theo collection (thư mục trong model_txt, gồm thư mục con)
+- Mọi thay đổi của một lệnh ghi vào qr_data.json trong một transaction: một lần đọc, một lần ghi,
+  một version (thay vì mỗi record một lần ghi lại cả file)
+- Việc chậm (tạo lại audio) chạy song song trong thread pool trước khi khoá store;
+  số lời gọi TTS thực sự do tts_limiter điều tiết
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import submit
+
+# Số record xử lý song song khi tạo lại audio
+MAX_WORKERS = int(os.environ.get('BULK_MAX_WORKERS', os.environ.get('TTS_MAX_CONCURRENCY', 8)))
+
+
+def in_collection(record, collection) -> bool:
+    """
+    Record thuộc collection (hoặc thư mục con của nó); collection '' là thư mục gốc, tức mọi
+    record của model_txt (route phải bắt xác nhận trước khi dùng)
+    """
+    value = record.get('collection')
+    if value is None:
+        return False
+    collection = collection.strip('/')
+    return not collection or value == collection or value.startswith(collection + '/')
+
+
+def record_filter(ids=None, collection=None):
+    """Hàm record -> bool chọn record theo danh sách id hoặc collection"""
+    if ids is not None:
+        wanted = set(ids)
+        return lambda record: record.get('id') in wanted
+    return lambda record: in_collection(record, collection)
+
+
+def missing_ids(ids, records):
+    """Các id được yêu cầu nhưng không có record (giữ thứ tự yêu cầu)"""
+    found = {record.get('id') for record in records}
+    return [record_id for record_id in dict.fromkeys(ids or []) if record_id not in found]
+
+
+def delete_records(store, match):
+    """
+    Xoá mọi record khớp trong một transaction
+
+    Returns:
+        Danh sách record đã xoá
+    """
+    with store.transaction() as data:
+        removed = [record for record in data if match(record)]
+        if removed:
+            data[:] = [record for record in data if not match(record)]
+    return removed
+
+
+def update_records(store, match, update):
+    """
+    Sửa mọi record khớp trong một transaction
+
+    Args:
+        store: QRStore
+        match: Hàm record -> bool
+        update: Hàm sửa record tại chỗ (gọi khi đang giữ lock của store)
+
+    Returns:
+        Bản sao các record sau khi sửa
+    """
+    updated = []
+    with store.transaction() as data:
+        for record in data:
+            if match(record):
+                update(record)
+                updated.append(dict(record))
+    return updated
+
+
+def run_parallel(records, func, max_workers=None):
+    """
+    Gọi func(record) song song cho từng record (span con vẫn thuộc trace hiện tại)
+
+    Returns:
+        [(record, kết quả hoặc exception)] theo đúng thứ tự records
+    """
+    if not records:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers or MAX_WORKERS, len(records))) as executor:
+        futures = [submit(executor, func, record) for record in records]
+        results = []
+        for record, future in zip(records, futures):
+            try:
+                results.append((record, future.result()))
+            except Exception as e:
+                results.append((record, e))
+    return results
+
+
+def apply_updates(store, updates):
+    """
+    Ghi các thay đổi {id: fields} vào store trong một transaction (record đã bị xoá
+    trong lúc xử lý thì bỏ qua)
+
+    Returns:
+        Bản sao các record đã được cập nhật
+    """
+    if not updates:
+        return []
+    return update_records(store, lambda record: record.get('id') in updates,
+                          lambda record: record.update(updates[record['id']]))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Huỷ convert khi client ngắt kết nối hoặc quá hạn (deadline) của request:
+- CancelToken được truyền vào convert_txt_to_audio(cancel=...) và tts_limiter; các chỗ chờ
+  (slot TTS, backoff, khoá đoạn, lời gọi TTS đang chạy) kiểm tra token mỗi POLL_INTERVAL giây
+- Client ngắt kết nối: socket của request đọc được EOF (gunicorn/werkzeug đưa socket vào environ)
+- Số lần huỷ theo lý do xem ở /health (mỗi worker đếm riêng)
+"""
+
+import os
+import time
+import select
+import socket
+import threading
+
+# Chu kỳ kiểm tra token khi đang chờ (giây): thời gian tối đa từ lúc huỷ tới lúc worker rảnh
+POLL_INTERVAL = 0.2
+
+
+class Cancelled(Exception):
+    """Convert bị huỷ; reason: 'disconnect' (client ngắt kết nối) hoặc 'deadline' (quá hạn)"""
+
+    def __init__(self, reason):
+        super().__init__(f'Convert bi huy ({reason})')
+        self.reason = reason
+
+
+def socket_closed(sock) -> bool:
+    """Client đã đóng kết nối (đọc được EOF hoặc lỗi) mà không chặn"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        # Socket TLS không hỗ trợ MSG_PEEK: không biết được, coi như còn kết nối
+        return False
+    except OSError:
+        return True
+
+
+class CancelToken:
+    """Trạng thái huỷ của một request: huỷ thủ công, quá deadline, hoặc client ngắt kết nối"""
+
+    def __init__(self, timeout=None, sock=None):
+        """
+        Args:
+            timeout: Số giây tối đa (None: không giới hạn)
+            sock: Socket của client để phát hiện ngắt kết nối (None: không kiểm tra)
+        """
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.sock = sock
+        self.reason = None
+        self._lock = threading.Lock()
+
+    def cancel(self, reason='cancelled'):
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+
+    def is_cancelled(self) -> bool:
+        if self.reason is None:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel('deadline')
+            elif self.sock is not None and socket_closed(self.sock):
+                self.cancel('disconnect')
+        return self.reason is not None
+
+    def check(self):
+        """Raise Cancelled nếu đã bị huỷ"""
+        if self.is_cancelled():
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds):
+        """time.sleep nhưng dừng sớm (raise Cancelled) khi bị huỷ"""
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+
+def request_token(environ, timeout=None):
+    """
+    CancelToken cho request WSGI hiện tại
+
+    Args:
+        environ: WSGI environ (request.environ)
+        timeout: Deadline (giây); None: CONVERT_TIMEOUT (mặc định 300, 0 = không giới hạn)
+    """
+    if timeout is None:
+        timeout = float(os.environ.get('CONVERT_TIMEOUT', 300))
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    return CancelToken(timeout=timeout or None, sock=sock)
+
+
+# Số convert bị huỷ theo lý do (của process này)
+_counts = {}
+_counts_lock = threading.Lock()
+
+
+def record_cancellation(reason):
+    with _counts_lock:
+        _counts[reason] = _counts.get(reason, 0) + 1
+
+
+def snapshot():
+    """Số lần huỷ theo lý do (cho /health)"""
+    with _counts_lock:
+        return dict(_counts)
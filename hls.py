@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đóng gói audio MP3 thành HLS (playlist + các đoạn ngắn) để điện thoại phát được ngay
+sau khi tải đoạn đầu, không phải chờ file MP3 dài.
+
+Cắt theo ranh giới frame MP3 (không encode lại, không cần ffmpeg). Mỗi đoạn là
+MPEG audio thuần, mở đầu bằng ID3 PRIV timestamp theo đặc tả HLS packed audio.
+
+Bố cục blob: <stem>/index.m3u8, <stem>/seg_00000.mp3, ...
+phục vụ qua /audio/<stem>/index.m3u8.
+
+Đóng gói audio cũ chưa có HLS:
+    python hls.py
+"""
+
+import io
+import sys
+import math
+import struct
+import argparse
+from pathlib import Path
+
+# Đoạn đầu ngắn để phát sớm, các đoạn sau dài hơn để ít request
+FIRST_SEGMENT_SECONDS = 2.0
+SEGMENT_SECONDS = 6.0
+PLAYLIST_NAME = 'index.m3u8'
+PLAYLIST_MIMETYPE = 'application/vnd.apple.mpegurl'
+
+# Bảng bitrate (kbps) theo (MPEG-1?, layer)
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Tần số lấy mẫu theo version (bits 3=MPEG-1, 2=MPEG-2, 0=MPEG-2.5)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def parse_frame_header(header: bytes):
+    """
+    Đọc header 4 byte của một frame MPEG audio
+
+    Returns:
+        (độ dài frame tính bằng byte, số sample, sample rate), hoặc None nếu không hợp lệ
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    padding = (header[2] >> 1) & 1
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def _skip_id3v2(f):
+    """Bỏ qua tag ID3v2 ở đầu stream (nếu có), trả các byte đã đọc thừa"""
+    head = f.read(10)
+    if len(head) == 10 and head[:3] == b'ID3':
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        if head[5] & 0x10:  # có footer
+            size += 10
+        # Đọc bỏ thay vì seek: stream từ S3 không seek được
+        while size > 0:
+            chunk = f.read(min(size, 65536))
+            if not chunk:
+                break
+            size -= len(chunk)
+        return b''
+    return head
+
+
+def iter_mp3_frames(f, chunk_size=65536):
+    """
+    Duyệt các frame của stream MP3 (đọc tuần tự, không load cả file)
+
+    Yields:
+        (bytes của frame, số sample, sample rate)
+    """
+    buffer = _skip_id3v2(f)
+    pos = 0
+    while True:
+        if len(buffer) - pos < 4:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        info = parse_frame_header(buffer[pos:pos + 4])
+        if info is None:
+            # Mất đồng bộ (tag ID3v1, rác): tìm byte sync kế tiếp
+            index = buffer.find(b'\xff', pos + 1)
+            pos = index if index != -1 else len(buffer)
+            continue
+        length, samples, sample_rate = info
+        if len(buffer) - pos < length:
+            chunk = f.read(max(chunk_size, length))
+            if not chunk:
+                return
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield buffer[pos:pos + length], samples, sample_rate
+        pos += length
+
+
+def _timestamp_tag(pts: int) -> bytes:
+    """ID3 PRIV com.apple.streaming.transportStreamTimestamp (PTS 90kHz, 33 bit)"""
+    owner = b'com.apple.streaming.transportStreamTimestamp\x00'
+    payload = owner + struct.pack('>Q', pts & ((1 << 33) - 1))
+    frame = b'PRIV' + _syncsafe(len(payload)) + b'\x00\x00' + payload
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frame)) + frame
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def segment_mp3(f, segment_seconds=SEGMENT_SECONDS, first_segment_seconds=FIRST_SEGMENT_SECONDS):
+    """
+    Cắt stream MP3 thành các đoạn theo ranh giới frame
+
+    Yields:
+        (thời lượng giây, bytes của đoạn kèm ID3 timestamp)
+    """
+    frames = []
+    samples_in_segment = 0
+    total_samples = 0
+    sample_rate = None
+    target = first_segment_seconds
+
+    def flush():
+        pts = total_samples * 90000 // sample_rate
+        return samples_in_segment / sample_rate, _timestamp_tag(pts) + b''.join(frames)
+
+    for frame, samples, rate in iter_mp3_frames(f):
+        sample_rate = sample_rate or rate
+        frames.append(frame)
+        samples_in_segment += samples
+        if samples_in_segment >= target * sample_rate:
+            yield flush()
+            total_samples += samples_in_segment
+            frames, samples_in_segment = [], 0
+            target = segment_seconds
+    if frames:
+        yield flush()
+
+
+def build_playlist(durations, segment_name='seg_{:05d}.mp3') -> str:
+    """Playlist HLS VOD cho danh sách thời lượng đoạn"""
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{math.ceil(max(durations))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for i, duration in enumerate(durations):
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(segment_name.format(i))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+def hls_key(audio_filename, name=PLAYLIST_NAME):
+    """Key blob của playlist/đoạn HLS cho một audio"""
+    return f'{Path(audio_filename).stem}/{name}'
+
+
+def package_hls(blobs, audio_filename, source=None, version=None):
+    """
+    Đóng gói một audio MP3 thành HLS trong blob store
+
+    Args:
+        blobs: BlobStore
+        audio_filename: Key của audio trong blob store
+        source: File MP3 local hoặc bytes audio (nếu có, khỏi phải đọc lại từ blob store)
+        version: Khi đóng gói lại audio đã đổi nội dung: thêm ?v=<version> vào URL đoạn
+                 trong playlist để client không dùng đoạn cũ đã cache
+
+    Returns:
+        {'segments': số đoạn, 'duration': tổng giây}, hoặc None nếu không phải MP3
+    """
+    if Path(audio_filename).suffix.lower() != '.mp3':
+        return None
+    if isinstance(source, (bytes, bytearray)):
+        f = io.BytesIO(source)
+    else:
+        f = open(source, 'rb') if source is not None else blobs.open(audio_filename)
+    durations = []
+    try:
+        for i, (duration, data) in enumerate(segment_mp3(f)):
+            blobs.put_stream(hls_key(audio_filename, f'seg_{i:05d}.mp3'), io.BytesIO(data), 'audio/mpeg')
+            durations.append(duration)
+    finally:
+        f.close()
+    if not durations:
+        return None
+    # Playlist ghi sau cùng: có playlist nghĩa là mọi đoạn đã sẵn sàng
+    segment_name = 'seg_{:05d}.mp3' + (f'?v={version}' if version else '')
+    playlist = build_playlist(durations, segment_name).encode('utf-8')
+    blobs.put_stream(hls_key(audio_filename), io.BytesIO(playlist), PLAYLIST_MIMETYPE)
+    return {'segments': len(durations), 'duration': round(sum(durations), 3)}
+
+
+def main():
+    """Đóng gói HLS cho các record cũ chưa có"""
+    from qr_store import QRStore
+    from blob_store import create_blob_store
+
+    parser = argparse.ArgumentParser(description='Dong goi HLS cho audio chua co')
+    parser.add_argument('data_file', nargs='?', default='qr_data.json', help='File du lieu (mac dinh: qr_data.json)')
+    parser.add_argument('--upload-folder', default='uploads', help='Thu muc audio (mac dinh: uploads)')
+    args = parser.parse_args()
+
+    store = QRStore(args.data_file)
+    blobs = create_blob_store(args.upload_folder)
+
+    packaged = {}
+    for record in store.load():
+        name = record.get('audio_filename')
+        if record.get('hls') or not name or not blobs.exists(name):
+            continue
+        try:
+            hls = package_hls(blobs, name)
+        except Exception as e:
+            print(f"  Loi {name}: {str(e)}", file=sys.stderr)
+            continue
+        if hls:
+            packaged[record['id']] = hls
+            print(f"  {name}: {hls['segments']} doan, {hls['duration']:.1f}s")
+
+    if packaged:
+        with store.transaction() as data:
+            for record in data:
+                if record.get('id') in packaged:
+                    record['hls'] = packaged[record['id']]
+    print(f"Hoan thanh! Da dong goi {len(packaged)} audio")
+
+
+if __name__ == '__main__':
+    main()
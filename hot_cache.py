@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache audio "nóng" trong bộ nhớ cho các QR được quét dồn dập (sự kiện, triển lãm):
+- File được yêu cầu từ HOT_CACHE_ADMIT lần trở lên được mmap (read-only) và giữ lại;
+  request sau serve thẳng từ bộ nhớ (cả full lẫn Range) không cần open/read
+- mmap dùng page cache của hệ điều hành nên các worker map cùng một file dùng chung
+  bộ nhớ vật lý, không mỗi worker một bản
+- Giới hạn tổng dung lượng map (HOT_CACHE_MB); đầy thì bỏ file ít được yêu cầu nhất.
+  Số lượt yêu cầu giảm một nửa định kỳ nên cache theo kịp file đang "hot" hiện tại
+- Mỗi lần dùng kiểm tra lại stat của file (inode, mtime, size): file bị thay (convert lại,
+  migrate) thì bản cũ bị bỏ. Blob store luôn thay file bằng rename, không ghi đè tại chỗ
+  (ghi đè/cắt ngắn file đang map sẽ làm hỏng dữ liệu đang gửi)
+"""
+
+import os
+import mmap
+import threading
+from collections import namedtuple
+
+# Số request giữa hai lần giảm một nửa số lượt yêu cầu
+DECAY_EVERY = 1000
+
+Entry = namedtuple('Entry', ['view', 'size', 'mtime', 'signature'])
+
+
+class MemoryReader:
+    """File-like chỉ đọc trên một memoryview, mỗi response một reader (vị trí đọc riêng)"""
+
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(len(self.view), self.pos + size)
+        # WSGI server chỉ nhận bytes: copy từ vùng map (không syscall, không chạm đĩa)
+        chunk = self.view[self.pos:end].tobytes()
+        self.pos = end
+        return chunk
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: len(self.view)}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        pass
+
+
+def iter_view(view, start, stop, chunk_size=1024 * 1024):
+    """Các chunk bytes của view[start:stop]"""
+    for offset in range(start, stop, chunk_size):
+        yield view[offset:min(offset + chunk_size, stop)].tobytes()
+
+
+class HotCache:
+    """Cache mmap theo key, giới hạn tổng byte, ưu tiên file được yêu cầu nhiều"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_file_bytes=64 * 1024 * 1024, admit_after=2):
+        """
+        Args:
+            max_bytes: Tổng dung lượng file được map tối đa (mỗi worker)
+            max_file_bytes: File lớn hơn không cache
+            admit_after: Số lượt yêu cầu (gần đây) trước khi file được đưa vào cache
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.admit_after = admit_after
+        self._entries = {}
+        self._counts = {}
+        self._bytes = 0
+        self._requests = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.evicted = 0
+
+    def _decay(self):
+        self._counts = {key: count // 2 for key, count in self._counts.items()
+                        if count > 1 or key in self._entries}
+
+    def _make_room(self, size, count):
+        """
+        Bỏ các file ít lượt yêu cầu nhất cho đủ chỗ; False (không bỏ gì) nếu phải bỏ
+        file được yêu cầu nhiều hơn file mới. Không đóng mmap: response đang gửi vẫn giữ
+        memoryview, mmap tự giải phóng khi không còn ai dùng
+        """
+        victims, freed = [], 0
+        for key in sorted(self._entries, key=lambda key: self._counts.get(key, 0)):
+            if self._bytes - freed + size <= self.max_bytes:
+                break
+            if self._counts.get(key, 0) > count:
+                return False
+            victims.append(key)
+            freed += self._entries[key].size
+        for key in victims:
+            self._drop(key)
+            self.evicted += 1
+        return True
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def get(self, key, path):
+        """
+        Bản trong bộ nhớ của file path (key dùng để đếm lượt và định danh trong cache)
+
+        Returns:
+            Entry (view, size, mtime, signature) nếu file đang/vừa được cache, None nếu không
+            (file không tồn tại, chưa đủ lượt, quá lớn) - khi đó người gọi đọc từ đĩa
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._drop(key)
+            return None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            self._requests += 1
+            if self._requests % DECAY_EVERY == 0:
+                self._decay()
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                return entry
+            self._drop(key)
+            self.misses += 1
+            if count < self.admit_after or not 0 < stat.st_size <= min(self.max_file_bytes, self.max_bytes):
+                return None
+
+        # Map ngoài lock; nếu nhiều thread cùng map một file thì bản ghi sau cùng được giữ
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if os.fstat(f.fileno()).st_ino != stat.st_ino:
+                    return None
+        except (OSError, ValueError):
+            return None
+        if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            mapped.madvise(mmap.MADV_WILLNEED)
+        entry = Entry(memoryview(mapped), stat.st_size, stat.st_mtime, signature)
+        with self._lock:
+            self._drop(key)
+            # Không đủ chỗ thì vẫn serve request này từ bản vừa map, chỉ không giữ lại
+            if self._make_room(entry.size, count):
+                self._entries[key] = entry
+                self._bytes += entry.size
+                self.admitted += 1
+        return entry
+
+    def snapshot(self):
+        """Thống kê của worker này (cho /health)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'admitted': self.admitted,
+                'evicted': self.evicted,
+            }
+
+
+def create_hot_cache():
+    """
+    HotCache cấu hình qua biến môi trường; mặc định tắt (trả None), bật bằng HOT_CACHE_MB > 0
+    khi đo được lợi ích trên máy thật
+    """
+    max_mb = float(os.environ.get('HOT_CACHE_MB', 0))
+    if max_mb <= 0:
+        return None
+    return HotCache(
+        max_bytes=int(max_mb * 1024 * 1024),
+        max_file_bytes=int(float(os.environ.get('HOT_CACHE_MAX_FILE_MB', 64)) * 1024 * 1024),
+        admit_after=int(os.environ.get('HOT_CACHE_ADMIT', 2)),
+    )
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conditional GET (ETag/304) và nén gzip/brotli cho các response đọc
+Body đã nén được cache theo version của dữ liệu nên request lặp lại không phải
+serialize/nén lại.
+"""
+
+import gzip
+import threading
+from flask import request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response nhỏ hơn ngưỡng này thì không nén
+MIN_COMPRESS_SIZE = 1024
+# Số tài nguyên tối đa giữ trong cache (bỏ tài nguyên cũ nhất khi đầy)
+MAX_CACHED_NAMES = 256
+
+_cache = {}  # name -> (version, {encoding: body})
+_cache_lock = threading.Lock()
+
+
+def _choose_encoding():
+    """Chọn encoding tốt nhất client chấp nhận"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def _encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def _get_body(name, version, encoding, build):
+    """
+    Lấy body đã encode từ cache, build lại nếu version đã đổi
+
+    Returns:
+        (body, encoding thực sự áp dụng) - body nhỏ thì để nguyên 'identity'
+    """
+    with _cache_lock:
+        cached_version, bodies = _cache.get(name, (None, {}))
+        if cached_version != version:
+            bodies = {}
+        if encoding in bodies:
+            return bodies[encoding]
+        raw = bodies.get('identity', (None,))[0]
+    if raw is None:
+        raw = build()
+    entry = (raw, 'identity')
+    if encoding != 'identity' and len(raw) >= MIN_COMPRESS_SIZE:
+        entry = (_encode(raw, encoding), encoding)
+    with _cache_lock:
+        cached_version, bodies = _cache.get(name, (None, {}))
+        if cached_version != version:
+            bodies = {}
+            _cache.pop(name, None)
+            while len(_cache) >= MAX_CACHED_NAMES:
+                _cache.pop(next(iter(_cache)))
+            _cache[name] = (version, bodies)
+        bodies['identity'] = (raw, 'identity')
+        bodies[encoding] = entry
+    return entry
+
+
+def versioned_response(name, version, build, mimetype='application/json', max_age=0,
+                       compressible=True):
+    """
+    Trả response cho dữ liệu có version
+
+    Args:
+        name: Tên tài nguyên (mỗi tên cache một version)
+        version: Version dữ liệu, đổi khi dữ liệu đổi
+        build: Hàm () -> bytes, chỉ được gọi khi cache trượt
+        mimetype: Content-Type
+        max_age: Số giây client được dùng lại không cần hỏi lại server
+        compressible: False với dữ liệu đã nén sẵn (PNG, MP3)
+
+    Returns:
+        Response 200 (body có thể đã nén) hoặc 304
+    """
+    etag = f'{name}-{version}'
+    headers = {
+        'ETag': f'W/"{etag}"',
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': f'private, max-age={max_age}, must-revalidate' if max_age else 'no-cache',
+    }
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    encoding = _choose_encoding() if compressible else 'identity'
+    body, encoding = _get_body(name, version, encoding, build)
+    response = Response(body, mimetype=mimetype, headers=headers)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
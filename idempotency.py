@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Idempotency key cho các endpoint tạo record (upload, convert):
+- Request lặp lại cùng key nhận lại kết quả đã lưu, không convert/ghi record lần hai
+- Request trùng đến khi request đầu còn đang chạy thì chờ request đó xong rồi dùng kết quả
+  (khoá flock theo key, dùng chung giữa các worker; worker chết thì kernel nhả khoá
+  và request đang chờ chạy lại từ đầu)
+
+Kết quả lưu ở <root>/<hash>.json, hết hạn sau ttl giây.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+
+class IdempotencyConflict(Exception):
+    """Request cùng key vẫn đang chạy sau thời gian chờ"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Claim:
+    """Quyền thực thi một key; complete() lưu kết quả, release() nhả khoá"""
+
+    def __init__(self, store, key, fd=None, lock=None):
+        self.store = store
+        self.key = key
+        self.fd = fd
+        self.lock = lock
+        self._released = False
+
+    def complete(self, status, body, ttl=None):
+        """Lưu kết quả (JSON) cho các request lặp lại"""
+        now = time.time()
+        result = {'status': status, 'body': body, 'created': now,
+                  'expires': now + (ttl if ttl is not None else self.store.ttl)}
+        path = self.store._result_path(self.key)
+        tmp = path.with_name(f'{path.name}.tmp{os.getpid()}-{threading.get_ident()}')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self.fd is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self.fd)
+        elif self.lock is not None:
+            self.lock.release()
+
+
+class IdempotencyStore:
+    """Kết quả theo idempotency key, dùng chung giữa các worker qua filesystem"""
+
+    def __init__(self, root='temp/idempotency', ttl=86400, wait_timeout=60):
+        """
+        Args:
+            root: Thư mục lưu kết quả
+            ttl: Số giây giữ kết quả mặc định
+            wait_timeout: Số giây tối đa chờ request trùng đang chạy
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._locks = {}  # dùng khi không có fcntl
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _result_path(self, key):
+        return self.root / f'{self._digest(key)}.json'
+
+    def _lock_path(self, key):
+        return self.root / f'{self._digest(key)}.lock'
+
+    def lookup(self, key):
+        """Kết quả đã lưu còn hạn của key, None nếu không có"""
+        try:
+            with open(self._result_path(key), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if result.get('expires', 0) < time.time():
+            return None
+        return result
+
+    def _lock(self, key, deadline):
+        """Khoá độc quyền key, chờ tối đa tới deadline; trả Claim hoặc None"""
+        if fcntl is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+            if lock.acquire(timeout=max(0, deadline - time.time())):
+                return Claim(self, key, lock=lock)
+            return None
+
+        fd = os.open(self._lock_path(key), os.O_CREAT | os.O_RDWR)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return Claim(self, key, fd=fd)
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    os.close(fd)
+                    return None
+                time.sleep(0.1)
+
+    def begin(self, key):
+        """
+        Bắt đầu xử lý một request có key
+
+        Returns:
+            (kết quả đã lưu, None) nếu là request lặp lại,
+            (None, Claim) nếu request này phải thực thi (gọi claim.release() khi xong)
+
+        Raises:
+            IdempotencyConflict: Request cùng key vẫn đang chạy sau wait_timeout giây
+        """
+        result = self.lookup(key)
+        if result is not None:
+            return result, None
+
+        claim = self._lock(key, time.time() + self.wait_timeout)
+        if claim is None:
+            raise IdempotencyConflict('Yeu cau giong het dang duoc xu ly, vui long thu lai sau',
+                                      retry_after=10)
+        # Có thể request trùng vừa xong trong lúc chờ khoá
+        result = self.lookup(key)
+        if result is not None:
+            claim.release()
+            return result, None
+        if random.random() < 0.01:
+            self.cleanup()
+        return None, claim
+
+    def cleanup(self):
+        """Xoá kết quả hết hạn và file khoá cũ"""
+        now = time.time()
+        for path in self.root.iterdir():
+            try:
+                if path.suffix == '.json':
+                    with open(path, 'r', encoding='utf-8') as f:
+                        expired = json.load(f).get('expires', 0) < now
+                else:
+                    expired = path.stat().st_mtime < now - max(self.ttl, self.wait_timeout * 2)
+                if expired:
+                    path.unlink()
+            except (OSError, ValueError):
+                continue
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chia việc giữa nhiều node dùng chung một thư mục (NFS, ...) bằng lease file:
+
+    <root>/leases/<key>/<gen>   lease thế hệ gen, mtime được heartbeat làm mới
+    <root>/done/<key>           file đã xử lý xong
+    <root>/results/<node>.jsonl kết quả (record) của từng node, merge sau
+
+Claim = tạo file thế hệ kế tiếp bằng O_EXCL nên tại mỗi thế hệ chỉ một node thắng.
+Lease không được heartbeat quá ttl giây (node chết) thì node khác claim thế hệ mới;
+node cũ khi sống lại thấy mình không còn là chủ và bỏ kết quả.
+"""
+
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+from pathlib import Path
+
+
+def default_node_id():
+    """hostname-pid, đủ để phân biệt các node/process"""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class LeaseQueue:
+    """Claim/heartbeat/hoàn thành từng item (chuỗi định danh, vd đường dẫn file)"""
+
+    def __init__(self, root, node_id=None, ttl=60.0):
+        self.root = Path(root)
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.lease_dir = self.root / 'leases'
+        self.done_dir = self.root / 'done'
+        self.results_dir = self.root / 'results'
+        for directory in (self.lease_dir, self.done_dir, self.results_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self._held = {}  # key -> đường dẫn lease đang giữ
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @staticmethod
+    def key(item):
+        return hashlib.sha1(item.encode('utf-8')).hexdigest()
+
+    # -- Lease ----------------------------------------------------------------
+
+    def _generations(self, key):
+        try:
+            return sorted(int(name) for name in os.listdir(self.lease_dir / key) if name.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def is_done(self, item):
+        return (self.done_dir / self.key(item)).exists()
+
+    def try_claim(self, item) -> bool:
+        """Claim item; False nếu đã xong hoặc node khác đang giữ lease còn hạn"""
+        key = self.key(item)
+        if self.is_done(item):
+            return False
+        gens = self._generations(key)
+        if gens:
+            current = self.lease_dir / key / str(gens[-1])
+            try:
+                if time.time() - current.stat().st_mtime < self.ttl:
+                    return False
+            except FileNotFoundError:
+                pass
+        gen = (gens[-1] if gens else 0) + 1
+        path = self.lease_dir / key / str(gen)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'node': self.node_id, 'item': item, 'claimed_at': time.time()}, f)
+        # Có thể node khác vừa xong ngay trước khi ta claim
+        if self.is_done(item):
+            path.unlink()
+            return False
+        for old in gens:
+            try:
+                (self.lease_dir / key / str(old)).unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._held[key] = path
+        return True
+
+    def still_owner(self, item) -> bool:
+        """Lease của ta vẫn là thế hệ mới nhất (chưa bị node khác reclaim)"""
+        key = self.key(item)
+        with self._lock:
+            path = self._held.get(key)
+        gens = self._generations(key)
+        return path is not None and bool(gens) and path.name == str(gens[-1])
+
+    def release(self, item):
+        key = self.key(item)
+        with self._lock:
+            path = self._held.pop(key, None)
+        if path is not None:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # -- Heartbeat ---------------------------------------------------------
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 3):
+            with self._lock:
+                paths = list(self._held.values())
+            for path in paths:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+
+    def start(self):
+        """Bắt đầu thread heartbeat"""
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name='lease-heartbeat', daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+
+    # -- Kết quả --------------------------------------------------------------
+
+    def complete(self, item, record):
+        """Ghi record vào shard của node, đánh dấu xong và trả lease"""
+        shard = self.results_dir / f'{self.node_id}.jsonl'
+        with self._lock:
+            with open(shard, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        (self.done_dir / self.key(item)).touch()
+        self.release(item)
+
+
+def merge_results(root, store, base_url, settle=1.0):
+    """
+    Gộp các shard kết quả vào record store trong một transaction
+
+    Args:
+        root: Thư mục dùng chung của LeaseQueue
+        store: QRStore
+        base_url: Base URL cho short link
+        settle: Số giây chờ sau khi đổi tên shard (cho lần ghi đang dở)
+
+    Returns:
+        Số record mới được thêm (record đã có mà shard mang text_sha256 mới thì được
+        cập nhật hls/text_sha256/source_txt/collection/updated_at tại chỗ, giữ id và short link)
+    """
+    results_dir = Path(root) / 'results'
+    merging_dir = results_dir / 'merging'
+    merged_dir = results_dir / 'merged'
+    merging_dir.mkdir(parents=True, exist_ok=True)
+    merged_dir.mkdir(parents=True, exist_ok=True)
+
+    # Đổi tên trước: node đang chạy sẽ ghi tiếp vào shard mới.
+    # Shard còn sót trong merging/ (lần merge trước lỗi) được gộp lại, record trùng bị bỏ qua.
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    for shard in sorted(results_dir.glob('*.jsonl')):
+        os.replace(shard, merging_dir / f'{shard.stem}.{stamp}.jsonl')
+    claimed = sorted(merging_dir.glob('*.jsonl'))
+    if not claimed:
+        return 0
+    time.sleep(settle)
+
+    added = 0
+    with store.transaction() as data:
+        known = {item.get('audio_filename'): item for item in data}
+        for shard in claimed:
+            with open(shard, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    current = known.get(record.get('audio_filename'))
+                    if current is not None:
+                        # Audio được tạo lại vì file TXT đã sửa
+                        if record.get('text_sha256') and record['text_sha256'] != current.get('text_sha256'):
+                            for field in ('hls', 'text_sha256', 'updated_at', 'source_txt', 'collection'):
+                                if field in record:
+                                    current[field] = record[field]
+                        continue
+                    store.assign_short_link(record, base_url)
+                    data.append(record)
+                    known[record.get('audio_filename')] = record
+                    added += 1
+    for shard in claimed:
+        os.replace(shard, merged_dir / shard.name)
+    return added
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Export / import toàn bộ thư viện (record + audio) dạng tar, để chuyển server:
+
+    python library_archive.py export -o library.tar
+    python library_archive.py import library.tar
+    curl http://old-server/api/export | python library_archive.py import -
+
+Export ghi tar theo kiểu streaming (header tự dựng, đọc blob từng chunk), bộ nhớ
+không phụ thuộc dung lượng thư viện. Cấu trúc archive:
+    manifest.json
+    blobs/<key>       audio, playlist/đoạn HLS (theo thứ tự record)
+    sha256/<key>      sha256 của blob ngay trước, tính trong lúc stream
+    records.jsonl     các record, cuối cùng
+
+Import đọc tuần tự (stdin được), ghi blob ra file tạm và chỉ đưa vào blob store khi
+sha256 khớp; blob đã có thì bỏ qua, record đã có (theo id / audio_filename) thì bỏ qua.
+Chạy lại sau khi bị ngắt giữa chừng sẽ tiếp tục từ phần còn thiếu.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import tarfile
+import argparse
+from pathlib import Path
+from audio_paths import is_public_name
+from hls import hls_key, PLAYLIST_MIMETYPE
+
+# Fix encoding cho Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+ARCHIVE_FORMAT = 1
+CHUNK_SIZE = 1024 * 1024
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def record_blob_keys(record):
+    """Các blob record tham chiếu: audio, các đoạn HLS rồi playlist (playlist sau cùng)"""
+    name = record.get('audio_filename')
+    if not name:
+        return []
+    keys = [name]
+    hls = record.get('hls')
+    if hls:
+        keys += [hls_key(name, f'seg_{i:05d}.mp3') for i in range(hls.get('segments', 0))]
+        keys.append(hls_key(name))
+    return keys
+
+
+def _valid_key(key):
+    """
+    Key blob hợp lệ: <file> hoặc <stem>/<file>, mỗi phần là một tên file nằm gọn trong thư mục
+    (như /audio/<filename>: tên cũ trong audio_stories/ có dấu cách, tiếng Việt có dấu)
+    """
+    parts = key.split('/')
+    return 0 < len(parts) <= 2 and all(is_public_name(part) for part in parts)
+
+
+def _header(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def _padding(size):
+    return b'\0' * (-size % BLOCK_SIZE)
+
+
+def _member(name, data: bytes):
+    return _header(name, len(data)) + data + _padding(len(data))
+
+
+def iter_export(store, blobs, stats=None, chunk_size=CHUNK_SIZE):
+    """
+    Archive tar của thư viện, yield từng chunk bytes (cho stdout hoặc HTTP response)
+
+    Args:
+        store: QRStore
+        blobs: BlobStore
+        stats: dict (tuỳ chọn) nhận số liệu: records, blobs, bytes, missing (key không có trong
+            blob store), invalid (key không hợp lệ, không export)
+    """
+    stats = stats if stats is not None else {}
+    stats.update(records=0, blobs=0, bytes=0, missing=[], invalid=[])
+    records = store.snapshot().records
+
+    manifest = {'format': ARCHIVE_FORMAT, 'created': time.time(), 'records': len(records)}
+    yield _member('manifest.json', json.dumps(manifest).encode('utf-8'))
+
+    seen = set()
+    for record in records:
+        for key in record_blob_keys(record):
+            if key in seen:
+                continue
+            seen.add(key)
+            if not _valid_key(key):
+                stats['invalid'].append(key)
+                continue
+            if not blobs.exists(key):
+                stats['missing'].append(key)
+                continue
+            size = blobs.size(key)
+            digest = hashlib.sha256()
+            yield _header(f'blobs/{key}', size)
+            remaining = size
+            f = blobs.open(key)
+            try:
+                while remaining:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                f.close()
+            # Blob bị cắt ngắn trong lúc đọc: điền 0 cho đúng header, hash sẽ không khớp nên import bỏ qua
+            while remaining:
+                filler = min(chunk_size, remaining)
+                remaining -= filler
+                yield b'\0' * filler
+            yield _padding(size)
+            yield _member(f'sha256/{key}', digest.hexdigest().encode('ascii'))
+            stats['blobs'] += 1
+            stats['bytes'] += size
+
+    # records.jsonl: tính kích thước trước (header tar cần), rồi serialize lại từng dòng
+    def lines():
+        for record in records:
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    size = sum(len(line) for line in lines())
+    yield _header('records.jsonl', size)
+    yield from lines()
+    yield _padding(size)
+    stats['records'] = len(records)
+    # Kết thúc archive: hai block rỗng
+    yield b'\0' * (2 * BLOCK_SIZE)
+
+
+def export_archive(store, blobs, out, stats=None):
+    """Ghi archive vào file nhị phân out; trả stats"""
+    stats = stats if stats is not None else {}
+    for chunk in iter_export(store, blobs, stats):
+        out.write(chunk)
+    out.flush()
+    return stats
+
+
+def _content_type(key):
+    return PLAYLIST_MIMETYPE if key.endswith('.m3u8') else 'audio/mpeg'
+
+
+def import_archive(fileobj, store, blobs, temp_dir='temp', log=None):
+    """
+    Nhập archive từ file nhị phân (đọc tuần tự, không cần seek)
+
+    Returns:
+        dict: blobs (đã ghi), skipped (đã có), failed (sai hash / thiếu hash),
+              records (đã thêm), records_skipped (đã có hoặc thiếu audio)
+    """
+    log = log or (lambda message: print(message, file=sys.stderr))
+    temp_dir = Path(temp_dir)
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    stats = {'blobs': 0, 'skipped': 0, 'failed': 0, 'records': 0, 'records_skipped': 0}
+    pending = None  # (key, file tạm, sha256) chờ member sha256/<key>
+    failed_keys = set()
+
+    def drop_pending():
+        nonlocal pending
+        if pending is not None:
+            pending[1].unlink(missing_ok=True)
+            stats['failed'] += 1
+            failed_keys.add(pending[0])
+            log(f"  Thieu hash, bo qua: {pending[0]}")
+            pending = None
+
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                name = member.name
+                if name == 'manifest.json':
+                    manifest = json.load(tar.extractfile(member))
+                    if manifest.get('format') != ARCHIVE_FORMAT:
+                        raise ValueError(f"Dinh dang archive khong ho tro: {manifest.get('format')}")
+                    log(f"Archive: {manifest.get('records')} record")
+
+                elif name.startswith('blobs/'):
+                    drop_pending()
+                    key = name[len('blobs/'):]
+                    if not member.isfile() or not _valid_key(key):
+                        stats['failed'] += 1
+                        log(f"  Ten blob khong hop le, bo qua: {name}")
+                        continue
+                    if blobs.exists(key):
+                        stats['skipped'] += 1
+                        continue
+                    temp_path = temp_dir / f'.import-{uuid.uuid4()}'
+                    digest = hashlib.sha256()
+                    src = tar.extractfile(member)
+                    try:
+                        with open(temp_path, 'wb') as dst:
+                            while True:
+                                chunk = src.read(CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                digest.update(chunk)
+                                dst.write(chunk)
+                    except BaseException:
+                        # Archive bị cắt giữa blob: bỏ file dở, lần chạy sau tải lại
+                        temp_path.unlink(missing_ok=True)
+                        raise
+                    pending = (key, temp_path, digest.hexdigest())
+
+                elif name.startswith('sha256/'):
+                    key = name[len('sha256/'):]
+                    if pending is None or pending[0] != key:
+                        continue  # blob đã có (bỏ qua ở trên)
+                    _, temp_path, actual = pending
+                    pending = None
+                    expected = tar.extractfile(member).read().decode('ascii').strip()
+                    if expected != actual:
+                        temp_path.unlink(missing_ok=True)
+                        stats['failed'] += 1
+                        failed_keys.add(key)
+                        log(f"  Sai sha256, bo qua: {key}")
+                        continue
+                    blobs.put_file(key, temp_path, _content_type(key))
+                    stats['blobs'] += 1
+
+                elif name == 'records.jsonl':
+                    drop_pending()
+                    lines = (line.decode('utf-8') for line in tar.extractfile(member))
+                    _import_records(lines, store, blobs, stats, failed_keys, log)
+    finally:
+        if pending is not None:
+            pending[1].unlink(missing_ok=True)
+    return stats
+
+
+def _import_records(lines, store, blobs, stats, failed_keys, log):
+    """Thêm record chưa có (một transaction); record thiếu audio để lần chạy sau"""
+    incoming = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not record.get('id') or not record.get('audio_filename'):
+            stats['records_skipped'] += 1
+            continue
+        if not blobs.exists(record['audio_filename']):
+            stats['records_skipped'] += 1
+            log(f"  Thieu audio, chua nhap record: {record['id']} ({record['audio_filename']})")
+            continue
+        if record.get('hls') and failed_keys.intersection(record_blob_keys(record)[1:]):
+            # Thiếu đoạn HLS: phát MP3 thường, đóng gói lại sau bằng python hls.py
+            record.pop('hls')
+            log(f"  Thieu doan HLS, bo hls cua record: {record['id']}")
+        incoming.append(record)
+
+    with store.transaction() as data:
+        ids = {item.get('id') for item in data}
+        files = {item.get('audio_filename') for item in data}
+        codes = {item.get('short_code') for item in data if item.get('short_code')}
+        # Giữ short code gốc (QR đã in trỏ tới /q/<code>); bộ đếm đi qua các code này
+        store.reserve_short_codes(r['short_code'] for r in incoming if r.get('short_code'))
+        for record in incoming:
+            if record['id'] in ids or record['audio_filename'] in files:
+                stats['records_skipped'] += 1
+                continue
+            code = record.get('short_code')
+            if code and code in codes:
+                # Code đã bị record khác dùng ở server này: cấp code mới
+                base_url = (record.get('full_url') or '').rsplit('/q/', 1)[0]
+                store.assign_short_link(record, base_url)
+                log(f"  Trung short code {code}, doi thanh {record['short_code']}: {record['id']}")
+            data.append(record)
+            ids.add(record['id'])
+            files.add(record['audio_filename'])
+            if record.get('short_code'):
+                codes.add(record['short_code'])
+            stats['records'] += 1
+
+
+def main():
+    from qr_store import QRStore
+    from blob_store import create_blob_store
+
+    parser = argparse.ArgumentParser(description='Export/import thu vien (record + audio) dang tar')
+    parser.add_argument('--data-file', default=os.environ.get('DATA_FILE', 'qr_data.json'),
+                        help='File du lieu (mac dinh: qr_data.json)')
+    parser.add_argument('--upload-folder', default='uploads', help='Thu muc audio (mac dinh: uploads)')
+    sub = parser.add_subparsers(dest='command')
+    export = sub.add_parser('export', help='Ghi archive')
+    export.add_argument('-o', '--output', default='-', help='File tar, - la stdout (mac dinh: -)')
+    restore = sub.add_parser('import', help='Nhap archive (chay lai duoc neu bi ngat)')
+    restore.add_argument('archive', help='File tar (.tar/.tar.gz), - la stdin')
+    restore.add_argument('--temp', default='temp', help='Thu muc tam (mac dinh: temp)')
+    args = parser.parse_args()
+
+    if args.command not in ('export', 'import'):
+        parser.print_help()
+        sys.exit(1)
+
+    store = QRStore(args.data_file)
+    blobs = create_blob_store(args.upload_folder)
+    started = time.perf_counter()
+
+    if args.command == 'export':
+        stats = {}
+        if args.output == '-':
+            export_archive(store, blobs, sys.stdout.buffer, stats)
+        else:
+            tmp = Path(f'{args.output}.tmp')
+            with open(tmp, 'wb') as out:
+                export_archive(store, blobs, out, stats)
+            os.replace(tmp, args.output)
+        for key in stats['missing']:
+            print(f"  Khong tim thay blob: {key}", file=sys.stderr)
+        for key in stats['invalid']:
+            print(f"  Ten blob khong hop le, khong export: {key}", file=sys.stderr)
+        print(f"Da export {stats['records']} record, {stats['blobs']} blob "
+              f"({stats['bytes'] / 1024 / 1024:.1f} MB) trong {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        return
+
+    try:
+        if args.archive == '-':
+            stats = import_archive(sys.stdin.buffer, store, blobs, args.temp)
+        else:
+            with open(args.archive, 'rb') as f:
+                stats = import_archive(f, store, blobs, args.temp)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"\nLoi: {str(e)} (chay lai de tiep tuc)", file=sys.stderr)
+        sys.exit(1)
+    print(f"Hoan thanh trong {time.perf_counter() - started:.1f}s: "
+          f"{stats['blobs']} blob moi, {stats['skipped']} da co, {stats['failed']} loi; "
+          f"{stats['records']} record moi, {stats['records_skipped']} bo qua", file=sys.stderr)
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test: nhiều client convert (/txt-to-qr) cùng lúc trong khi đo độ trễ phát audio.
+Dùng để kiểm tra admission control (admission.py): audio vẫn nhanh khi convert quá tải.
+
+    python load_test.py http://localhost:5000 --audio /audio/<file>.mp3 --converters 20 --duration 30
+
+Mỗi client convert gửi X-Real-IP riêng (server cần TRUST_PROXY=1 để tính là các client khác nhau).
+"""
+
+import sys
+import time
+import uuid
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from collections import Counter
+
+
+def _multipart(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: text/plain\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def _request(url, data=None, headers=None, timeout=120):
+    """Gửi request, trả (status, giây)"""
+    started = time.perf_counter()
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except Exception:
+        status = 'error'
+    return status, time.perf_counter() - started
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test convert + do do tre phat audio')
+    parser.add_argument('base_url', help='Vi du: http://localhost:5000')
+    parser.add_argument('--audio', required=True, help='Duong dan audio de do, vi du /audio/abc.mp3')
+    parser.add_argument('--converters', type=int, default=20, help='So client convert dong thoi (mac dinh: 20)')
+    parser.add_argument('--duration', type=float, default=30, help='So giay chay (mac dinh: 30)')
+    parser.add_argument('--audio-interval', type=float, default=0.2, help='Giay giua hai lan do audio (mac dinh: 0.2)')
+    args = parser.parse_args()
+
+    base = args.base_url.rstrip('/')
+    deadline = time.time() + args.duration
+    convert_status = Counter()
+    convert_times = []
+    audio_status = Counter()
+    audio_times = []
+    lock = threading.Lock()
+
+    def converter(n):
+        headers = {'X-Real-IP': f'10.0.0.{n + 1}'}
+        while time.time() < deadline:
+            body, content_type = _multipart('txt_file', 'load.txt', f'Noi dung thu {n} {time.time()}'.encode('utf-8'))
+            status, seconds = _request(f'{base}/txt-to-qr', body, dict(headers, **{'Content-Type': content_type}))
+            with lock:
+                convert_status[status] += 1
+                if status == 200:
+                    convert_times.append(seconds)
+            if status != 200:
+                time.sleep(0.5)
+
+    def listener():
+        while time.time() < deadline:
+            status, seconds = _request(base + args.audio, headers={'Range': 'bytes=0-65535'})
+            with lock:
+                audio_status[status] += 1
+                audio_times.append(seconds)
+            time.sleep(args.audio_interval)
+
+    threads = [threading.Thread(target=converter, args=(i,)) for i in range(args.converters)]
+    threads.append(threading.Thread(target=listener))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"Convert: {dict(convert_status)}")
+    if convert_times:
+        print(f"  thanh cong p50 {percentile(convert_times, 0.5):.2f}s  p95 {percentile(convert_times, 0.95):.2f}s")
+    print(f"Audio:   {dict(audio_status)}")
+    print(f"  p50 {percentile(audio_times, 0.5) * 1000:.0f}ms  p95 {percentile(audio_times, 0.95) * 1000:.0f}ms  "
+          f"max {max(audio_times, default=0) * 1000:.0f}ms")
+    if any(status != 206 and status != 200 for status in audio_status):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrate qr_data.json sang schema mới theo kiểu streaming:
+- Bỏ trường qr_base64 (ảnh QR render lại từ full_url khi cần)
+- Thêm trường qr (tham số QR)
+- Tuỳ chọn: gán short link /q/<code> cho record chưa có (--short-links BASE_URL)
+Đọc và ghi từng record một, không load cả file vào bộ nhớ.
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from qr_store import QRStore
+from qr_render import qr_params
+
+# Fix encoding cho Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Đọc lần lượt từng phần tử của một JSON array từ file
+
+    Args:
+        f: File text đã mở
+        chunk_size: Số ký tự đọc mỗi lần
+
+    Yields:
+        Từng phần tử của array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    # Đang chờ gì: '[' mở đầu, phần tử đầu hoặc ']', ',' hoặc ']' sau phần tử, phần tử sau ','
+    expect = 'open'
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        # Bỏ khoảng trắng
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+
+        if pos >= len(buffer):
+            if expect != 'open':
+                raise ValueError('JSON array khong dong (thieu "]")')
+            return
+        char = buffer[pos]
+        if expect == 'open':
+            if char != '[':
+                raise ValueError('File khong phai JSON array')
+            expect = 'first'
+            pos += 1
+            continue
+        if char == ']' and expect in ('first', 'separator'):
+            return
+        if expect == 'separator':
+            if char != ',':
+                raise ValueError(f'JSON array thieu "," truoc ky tu {char!r}')
+            expect = 'item'
+            pos += 1
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # Số có thể bị cắt ở cuối chunk ("12" của "123"): đọc thêm cho chắc
+        if end == len(buffer) and not eof:
+            fill()
+            continue
+        pos = end
+        expect = 'separator'
+        yield item
+
+
+def migrate_record(record, store=None, base_url=None):
+    """Chuyển một record sang schema mới"""
+    record.pop('qr_base64', None)
+    record['qr'] = qr_params(record)
+    if base_url and not record.get('short_code'):
+        store.assign_short_link(record, base_url)
+    return record
+
+
+def migrate(data_file, base_url=None):
+    """
+    Ghi lại data_file theo schema mới
+
+    Args:
+        data_file: File dữ liệu
+        base_url: Nếu có, đổi full_url của record cũ sang base_url/q/<code>
+
+    Returns:
+        (số record, số byte trước, số byte sau)
+    """
+    store = QRStore(data_file)
+    tmp_path = Path(f'{data_file}.migrate.tmp')
+    count = 0
+    with store.lock():
+        if not store.data_file.exists():
+            return 0, 0, 0
+        size_before = store.data_file.stat().st_size
+        with open(store.data_file, 'r', encoding='utf-8') as src, \
+                open(tmp_path, 'w', encoding='utf-8') as dst:
+            dst.write('[')
+            for record in iter_json_array(src):
+                text = json.dumps(migrate_record(record, store, base_url), ensure_ascii=False, indent=2)
+                dst.write(',\n  ' if count else '\n  ')
+                dst.write(text.replace('\n', '\n  '))
+                count += 1
+            dst.write('\n]' if count else ']')
+        size_after = tmp_path.stat().st_size
+        store.replace_file(tmp_path)
+    return count, size_before, size_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate qr_data.json (bo qr_base64)')
+    parser.add_argument(
+        'data_file',
+        nargs='?',
+        default=os.environ.get('DATA_FILE', 'qr_data.json'),
+        help='File du lieu (mac dinh: qr_data.json)'
+    )
+    parser.add_argument(
+        '--short-links',
+        dest='base_url',
+        help='Gan short link BASE_URL/q/<code> cho record chua co (QR cu da in van dung duoc)'
+    )
+    args = parser.parse_args()
+
+    count, before, after = migrate(args.data_file, args.base_url)
+    print(f"Da migrate {count} record: {before:,} -> {after:,} bytes")
+
+
+if __name__ == '__main__':
+    main()
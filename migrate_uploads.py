@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chuyển audio nằm phẳng trong uploads/ và audio_stories/ sang bố cục shard
+uploads/ab/cd/<filename> trong khi server vẫn đang chạy:
+1. Hard link (hoặc copy) file sang vị trí shard
+2. Bỏ file khỏi path index -> server tra sang vị trí mới
+3. Chờ một khoảng ngắn cho các request đang dở rồi mới xoá file cũ
+Chạy lại nhiều lần được; dừng giữa chừng không làm mất file.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+from pathlib import Path
+from audio_paths import AudioPathIndex
+
+# Fix encoding cho Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+
+def _link_or_copy(src, dst):
+    """Đưa file tới dst mà không làm mất src (atomic với người đọc dst)"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Khác filesystem hoặc không hỗ trợ hard link
+        tmp = dst.with_name(dst.name + '.tmp')
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+
+def migrate(index, batch_size=500, grace=2.0):
+    """
+    Chuyển toàn bộ file trong index sang vị trí shard
+
+    Args:
+        index: AudioPathIndex
+        batch_size: Số file mỗi lần ghi index
+        grace: Số giây chờ trước khi xoá file cũ
+
+    Returns:
+        Số file đã chuyển
+    """
+    index.ensure()
+    entries = index.entries()
+    names = list(entries)
+    moved = 0
+
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        done = []
+        for name in batch:
+            src = Path(entries[name])
+            if not src.exists():
+                # File đã bị xoá: chỉ bỏ khỏi index
+                done.append((name, None))
+                continue
+            _link_or_copy(src, index.shard_path(name))
+            done.append((name, src))
+
+        for name, _ in done:
+            entries.pop(name, None)
+        index.save_entries(entries)
+
+        time.sleep(grace)
+        for name, src in done:
+            if src is not None and src.exists():
+                src.unlink()
+                moved += 1
+        print(f"  Da chuyen {moved}/{len(names)} file")
+
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chuyen audio sang bo cuc shard uploads/ab/cd/')
+    parser.add_argument('--root', default='uploads', help='Thu muc goc (mac dinh: uploads)')
+    parser.add_argument('--batch-size', type=int, default=500, help='So file moi dot (mac dinh: 500)')
+    parser.add_argument('--grace', type=float, default=2.0,
+                        help='So giay cho truoc khi xoa file cu (mac dinh: 2)')
+    args = parser.parse_args()
+
+    index = AudioPathIndex(args.root)
+    moved = migrate(index, args.batch_size, args.grace)
+    print(f"Hoan thanh! Da chuyen {moved} file sang {args.root}/ab/cd/")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,21 +3,36 @@
 """
 Script xử lý tất cả file TXT trong model_txt:
 - Convert TXT sang Audio
-- Lưu audio vào uploads
-- Tạo QR code và lưu vào qr_data.json
+- Lưu audio vào blob store (uploads/ab/cd/ hoặc S3)
+- Tạo record QR code (tham số QR) và lưu vào qr_data.json
+
+Chế độ phân tán (nhiều node dùng chung filesystem):
+    python process_model_txt.py --distributed /shared/run1   # chạy trên mỗi node
+    python process_model_txt.py --merge /shared/run1         # gộp kết quả vào qr_data.json
+
+Chạy liên tục, xử lý file TXT mới/bị sửa ngay khi được thả vào model_txt (xem txt_watcher.py):
+    python process_model_txt.py --watch
 """
 
 import os
 import sys
-import json
 import uuid
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from io import BytesIO
-import base64
-import qrcode
 from werkzeug.utils import secure_filename
 from txt_to_audio import convert_txt_to_audio
+from tts_limiter import get_limiter
+from qr_store import QRStore
+from qr_render import qr_params
+from blob_store import create_blob_store
+from lease_queue import LeaseQueue, merge_results
+from tracing import get_tracer, span
+from hls import package_hls
+from search_index import SearchIndex
+from txt_watcher import TxtWatcher
 
 # Fix encoding cho Windows
 if sys.platform == 'win32':
@@ -31,91 +46,150 @@ QR_DATA_FILE = 'qr_data.json'
 BASE_URL = os.environ.get('BASE_URL', 'http://localhost:5000')
 VOICE = 'vi-VN-HoaiMyNeural'
 AUDIO_FORMAT = 'mp3'
+# Số file xử lý song song; số lời gọi TTS thực sự do tts_limiter điều tiết (AIMD)
+MAX_WORKERS = int(os.environ.get('TTS_MAX_CONCURRENCY', 8))
+
+# qr_data.json dùng chung với app.py (khoá file, ghi atomic)
+store = QRStore(QR_DATA_FILE)
+# Chỉ mục tìm kiếm dùng chung với app.py (/api/search)
+search_index = SearchIndex(Path(QR_DATA_FILE).with_suffix('.search.db'))
 
 # Tạo thư mục uploads nếu chưa có
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 
+# Audio lưu qua blob store dùng chung với app.py (local shard hoặc S3 - BLOB_BACKEND)
+blobs = create_blob_store(UPLOAD_FOLDER)
+TEMP_FOLDER = Path('temp')
+TEMP_FOLDER.mkdir(exist_ok=True)
+
 
 def load_qr_data():
     """Load danh sách QR codes từ file JSON"""
-    if Path(QR_DATA_FILE).exists():
-        try:
-            with open(QR_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    return store.load()
 
 
 def save_qr_data(data):
     """Lưu danh sách QR codes vào file JSON"""
-    with open(QR_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    store.save(data)
 
 
-def add_qr_record(audio_filename, audio_url, full_url, qr_base64, title=None):
-    """Thêm record QR code vào database"""
-    data = load_qr_data()
+def new_qr_record(audio_filename, audio_url, title=None, hls=None, text_sha256=None, source_txt=None):
+    """Tạo record QR code (chưa có short link / full_url)"""
     record = {
         'id': str(uuid.uuid4()),
         'title': title or audio_filename,
         'audio_filename': audio_filename,
         'audio_url': audio_url,
-        'full_url': full_url,
-        'qr_base64': qr_base64,
+        'qr': qr_params(),
         'created_at': datetime.now().isoformat()
     }
-    data.append(record)
-    save_qr_data(data)
+    if hls:
+        record['hls'] = hls
+    if text_sha256:
+        record['text_sha256'] = text_sha256
+    if source_txt:
+        record.update(source_fields(source_txt))
     return record
 
 
-def generate_qr_code(url):
-    """Tạo QR code từ URL"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert QR code to base64
-    img_buffer = BytesIO()
-    img.save(img_buffer, format='PNG', optimize=False)
-    img_str = base64.b64encode(img_buffer.getvalue()).decode()
-    
-    return img_str
+def add_qr_record(audio_filename, audio_url, title=None, hls=None, text_sha256=None, source_txt=None, text=None):
+    """
+    Thêm record QR code vào database (ảnh QR được app render từ full_url)
+    full_url là short link BASE_URL/q/<code>.
+    """
+    record = store.add(new_qr_record(audio_filename, audio_url, title, hls, text_sha256, source_txt),
+                       base_url=BASE_URL)
+    index_record(record, text)
+    return record
+
+
+def index_record(record, text=None):
+    """
+    Index record vừa ghi vào store; lỗi chỉ mục (SQLite bận/khoá) không làm file bị tính là lỗi
+    (record và audio đã có), lần tìm kiếm sau app đồng bộ lại record
+    """
+    try:
+        search_index.add(record, text)
+    except Exception as e:
+        print(f"  ⚠ Không index được {record.get('title')}: {e}")
+
 
+def update_qr_record(record_id, **fields):
+    """Cập nhật record đã có (giữ id, short link, QR); trả record sau khi cập nhật"""
+    with store.transaction() as data:
+        for record in data:
+            if record.get('id') == record_id:
+                record.update(fields)
+                return dict(record)
+    return None
+
+
+def source_fields(source_txt):
+    """collection (thư mục con trong model_txt) và source_txt (đường dẫn TXT gốc) của record"""
+    relative = Path(source_txt)
+    return {
+        'source_txt': relative.as_posix(),
+        'collection': relative.parent.as_posix() if relative.parent != Path('.') else '',
+    }
 
-def process_txt_file(txt_path: Path):
-    """Xử lý một file TXT: convert sang audio, tạo QR code"""
+
+# Kết quả của process_txt_file khi file đang do node khác xử lý
+SKIPPED = 'skipped'
+
+
+def process_txt_file(txt_path: Path, queue: LeaseQueue = None):
+    """
+    Xử lý một file TXT: convert sang audio, tạo QR code
+
+    Args:
+        txt_path: File TXT
+        queue: Nếu có (chế độ phân tán), claim lease trước khi xử lý và ghi
+               record vào shard kết quả thay vì qr_data.json
+    """
+    item = txt_path.relative_to(MODEL_TXT_DIR).as_posix()
+    if queue is not None and not queue.try_claim(item):
+        return SKIPPED
+    
     try:
         print(f"\n{'='*60}")
         print(f"Đang xử lý: {txt_path}")
         
         # Đặt tên file audio giống tên file txt (chỉ đổi extension)
         audio_filename = secure_filename(txt_path.stem + f'.{AUDIO_FORMAT}')
-        output_audio_path = UPLOAD_FOLDER / audio_filename
+        # sha256 nội dung (đã strip, như khi convert) để phát hiện file TXT bị sửa
+        text = txt_path.read_text(encoding='utf-8').strip()
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        
+        hls = None
+        existing = None
         
         # Kiểm tra nếu file audio đã tồn tại
-        if output_audio_path.exists():
+        if blobs.exists(audio_filename):
             print(f"  ⚠ File audio đã tồn tại: {audio_filename}")
             # Kiểm tra xem đã có trong qr_data.json chưa
-            data = load_qr_data()
-            existing = next((item for item in data if item.get('audio_filename') == audio_filename), None)
-            if existing:
+            existing = next((r for r in store.snapshot().records
+                             if r.get('audio_filename') == audio_filename), None)
+            if existing and existing.get('text_sha256') in (None, digest):
                 print(f"  ✓ Đã có trong qr_data.json, bỏ qua")
+                if 'text_sha256' not in existing and queue is None:
+                    # Record cũ chưa có hash: ghi lại để lần sau phát hiện được file bị sửa
+                    existing = update_qr_record(existing['id'], text_sha256=digest,
+                                                **source_fields(item)) or existing
+                    index_record(existing, text)
+                if queue is not None:
+                    queue.complete(item, existing)
                 return existing
+            if existing:
+                # File TXT đã sửa: tạo lại audio, chỉ các đoạn bị đổi gọi TTS (segment_cache)
+                print(f"  → File TXT đã thay đổi, tạo lại audio (giữ nguyên URL và QR)...")
             else:
                 # File audio có nhưng chưa có trong qr_data, tạo QR code
                 print(f"  → File audio có nhưng chưa có QR, tạo QR code...")
-        else:
+        
+        if existing or not blobs.exists(audio_filename):
             # Convert TXT to Audio
             print(f"  → Đang convert sang audio...")
+            output_audio_path = TEMP_FOLDER / f"{uuid.uuid4()}.{AUDIO_FORMAT}"
             temp_audio_path = convert_txt_to_audio(
                 str(txt_path),
                 output_path=str(output_audio_path),
@@ -126,72 +200,178 @@ def process_txt_file(txt_path: Path):
             # Đảm bảo file đã được tạo
             if not Path(temp_audio_path).exists():
                 raise Exception(f"Không tạo được file audio: {temp_audio_path}")
+            
+            # Lease đã bị node khác lấy lại (heartbeat bị trễ): bỏ kết quả
+            if queue is not None and not queue.still_owner(item):
+                Path(temp_audio_path).unlink()
+                print(f"  ⚠ Mất lease, bỏ kết quả")
+                return SKIPPED
+            
+            # Cắt HLS từ file local trước khi chuyển vào blob store
+            # (tạo lại thì đổi version trong playlist để player không dùng đoạn HLS cũ đã cache)
+            with span('hls.package'):
+                hls = package_hls(blobs, audio_filename, temp_audio_path,
+                                  version=digest[:8] if existing else None)
+            
+            # Lưu audio vào blob store
+            with span('blob.put', key=audio_filename):
+                blobs.put_file(audio_filename, temp_audio_path)
         
         # Tạo URL cho audio
         audio_url = f'/audio/{audio_filename}'
-        full_url = BASE_URL.rstrip('/') + audio_url
-        
-        # Generate QR code
-        print(f"  → Đang tạo QR code...")
-        qr_base64 = generate_qr_code(full_url)
         
         # Tạo title từ tên file (bỏ extension)
         title = txt_path.stem
         
+        if existing:
+            updates = {'hls': hls, 'text_sha256': digest, 'updated_at': datetime.now().isoformat(),
+                       **source_fields(item)}
+            if queue is not None:
+                # merge_results cập nhật record đã có theo audio_filename
+                record = dict(existing, **updates)
+                queue.complete(item, record)
+                print(f"  ✓ Đã tạo lại: {title} (chờ merge)")
+                return record
+            with span('store.update'):
+                record = update_qr_record(existing['id'], **updates) or dict(existing, **updates)
+            index_record(record, text)
+            print(f"  ✓ Đã tạo lại: {title}")
+            print(f"    URL: {record.get('full_url')}")
+            return record
+        
+        if queue is not None:
+            # Ghi vào shard kết quả của node, merge sau
+            record = new_qr_record(audio_filename, audio_url, title, hls, digest, item)
+            queue.complete(item, record)
+            print(f"  ✓ Hoàn thành: {title} (chờ merge)")
+            return record
+        
         # Lưu vào qr_data.json
         print(f"  → Đang lưu vào qr_data.json...")
-        record = add_qr_record(audio_filename, audio_url, full_url, qr_base64, title)
+        with span('store.add'):
+            record = add_qr_record(audio_filename, audio_url, title, hls, digest, item, text)
         
         print(f"  ✓ Hoàn thành: {title}")
         print(f"    Audio: {audio_filename}")
-        print(f"    URL: {full_url}")
+        print(f"    URL: {record['full_url']}")
         
         return record
         
     except Exception as e:
         print(f"  ✗ Lỗi: {str(e)}")
+        if queue is not None:
+            queue.release(item)
         return None
 
 
+def process_txt_file_traced(txt_path: Path, queue: LeaseQueue = None):
+    """process_txt_file trong một trace riêng (nếu được sample, TRACE_SAMPLE_RATE)"""
+    with get_tracer().start_trace('process_txt_file', file=txt_path.as_posix()):
+        return process_txt_file(txt_path, queue)
+
+
 def main():
     """Xử lý tất cả file TXT trong model_txt"""
+    parser = argparse.ArgumentParser(description='Xu ly tat ca file TXT trong model_txt')
+    parser.add_argument(
+        '--distributed',
+        metavar='DIR',
+        help='Che do phan tan: thu muc dung chung giua cac node (lease, ket qua)'
+    )
+    parser.add_argument(
+        '--merge',
+        metavar='DIR',
+        help='Gop ket qua cua che do phan tan vao qr_data.json'
+    )
+    parser.add_argument('--node-id', help='Ten node (mac dinh: hostname-pid)')
+    parser.add_argument('--lease-ttl', type=float, default=60.0,
+                        help='So giay lease het han neu node khong heartbeat (mac dinh: 60)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Chay lien tuc: xu ly file TXT moi/bi sua ngay khi xuat hien (inotify)')
+    parser.add_argument('--poll', action='store_true',
+                        help='--watch bang cach quet dinh ky thay vi inotify (thu muc mang NFS/SMB)')
+    parser.add_argument('--debounce', type=float, default=1.0,
+                        help='--watch: so giay file phai yen truoc khi xu ly (mac dinh: 1)')
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='--watch: so file cho toi da, day thi tam dung nhan su kien (mac dinh: 100)')
+    args = parser.parse_args()
+    
+    if args.merge:
+        added = merge_results(args.merge, store, BASE_URL)
+        print(f"Đã gộp {added} record mới vào {QR_DATA_FILE}")
+        return
+    
     if not MODEL_TXT_DIR.exists():
         print(f"Không tìm thấy thư mục: {MODEL_TXT_DIR}")
         return
     
+    if args.watch:
+        if args.distributed:
+            parser.error('--watch khong dung cung --distributed')
+        watcher = TxtWatcher(MODEL_TXT_DIR, process_txt_file_traced, workers=MAX_WORKERS,
+                             debounce=args.debounce, max_queue=args.queue_size, use_inotify=not args.poll)
+        print(f"Đang theo dõi {MODEL_TXT_DIR} (Ctrl+C để dừng)")
+        print(f"BASE_URL: {BASE_URL}")
+        print(f"Workers: {MAX_WORKERS}")
+        watcher.run()
+        print(f"\nĐã dừng: {watcher.stats}")
+        return
+    
     # Tìm tất cả file .txt
-    txt_files = list(MODEL_TXT_DIR.rglob('*.txt'))
+    txt_files = sorted(MODEL_TXT_DIR.rglob('*.txt'))
     
     if not txt_files:
         print(f"Không tìm thấy file .txt nào trong {MODEL_TXT_DIR}")
         return
     
+    queue = None
+    if args.distributed:
+        queue = LeaseQueue(args.distributed, node_id=args.node_id, ttl=args.lease_ttl).start()
+    
     print(f"Tìm thấy {len(txt_files)} file .txt")
     print(f"BASE_URL: {BASE_URL}")
     print(f"Voice: {VOICE}")
     print(f"Format: {AUDIO_FORMAT}")
+    print(f"Workers: {MAX_WORKERS}")
+    if queue is not None:
+        print(f"Node: {queue.node_id} (lease: {args.distributed})")
     
     # Xử lý từng file
     success_count = 0
     error_count = 0
+    skipped_count = 0
     
-    for i, txt_file in enumerate(txt_files, 1):
-        print(f"\n[{i}/{len(txt_files)}]")
-        result = process_txt_file(txt_file)
-        if result:
-            success_count += 1
-        else:
-            error_count += 1
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(process_txt_file_traced, txt_file, queue) for txt_file in txt_files]
+            for i, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                if result == SKIPPED:
+                    skipped_count += 1
+                    continue
+                print(f"\n[{i}/{len(txt_files)}] đã xong")
+                if result:
+                    success_count += 1
+                else:
+                    error_count += 1
+    finally:
+        if queue is not None:
+            queue.stop()
     
     # Tổng kết
     print(f"\n{'='*60}")
     print(f"Tổng kết:")
     print(f"  ✓ Thành công: {success_count}")
     print(f"  ✗ Lỗi: {error_count}")
+    if queue is not None:
+        print(f"  → Node khác xử lý: {skipped_count}")
     print(f"  Tổng: {len(txt_files)}")
-    print(f"\nDữ liệu QR code đã được lưu vào: {QR_DATA_FILE}")
+    print(f"  TTS: {get_limiter().snapshot()}")
+    if queue is not None:
+        print(f"\nKết quả nằm trong {args.distributed}/results, chạy --merge để gộp vào {QR_DATA_FILE}")
+    else:
+        print(f"\nDữ liệu QR code đã được lưu vào: {QR_DATA_FILE}")
 
 
 if __name__ == '__main__':
     main()
-
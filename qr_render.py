@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render ảnh QR code từ tham số lưu trong record (không lưu ảnh trong qr_data.json)
+Ảnh PNG được cache trong bộ nhớ theo (data, tham số).
+"""
+
+import json
+import base64
+import hashlib
+from io import BytesIO
+from functools import lru_cache
+import qrcode
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Chất lượng cao để in (High error correction)
+DEFAULT_QR_PARAMS = {'error_correction': 'H', 'box_size': 10, 'border': 4}
+
+
+def qr_params(record=None, **overrides):
+    """Tham số QR của record (record cũ không có thì dùng mặc định)"""
+    params = dict(DEFAULT_QR_PARAMS)
+    if record:
+        params.update(record.get('qr') or {})
+    params.update(overrides)
+    return params
+
+
+@lru_cache(maxsize=1024)
+def _render(data, error_correction, box_size, border):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    img_buffer = BytesIO()
+    img.save(img_buffer, format='PNG', optimize=False)
+    return img_buffer.getvalue()
+
+
+def render_qr_png(data, error_correction='H', box_size=10, border=4) -> bytes:
+    """
+    Tạo ảnh QR code PNG
+
+    Args:
+        data: Nội dung encode (URL)
+        error_correction: L/M/Q/H
+        box_size: Kích thước mỗi ô (pixel)
+        border: Số ô viền
+
+    Returns:
+        Bytes ảnh PNG
+    """
+    return _render(data, error_correction, int(box_size), int(border))
+
+
+def render_qr_base64(data, **params) -> str:
+    """Ảnh QR code dạng base64 (cho response JSON)"""
+    return base64.b64encode(render_qr_png(data, **params)).decode()
+
+
+def render_record_png(record, **overrides) -> bytes:
+    """Ảnh QR code của một record"""
+    return render_qr_png(record['full_url'], **qr_params(record, **overrides))
+
+
+def record_png_version(record, *extra, **overrides) -> str:
+    """
+    Version (dùng cho ETag) của ảnh QR một record: chỉ đổi khi full_url hoặc tham số QR đổi,
+    không theo version của cả qr_data.json. extra: giá trị khác của response (vd tên file tải về)
+    """
+    key = json.dumps([record['full_url'], qr_params(record, **overrides), *extra], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
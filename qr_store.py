@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lưu trữ danh sách QR codes (qr_data.json) dùng chung cho app.py và process_model_txt.py
+- Ghi atomic (file tạm + rename), khoá file để nhiều worker/process ghi an toàn
+- Bộ đếm version tăng mỗi lần ghi, dùng làm ETag mà không cần đọc dữ liệu
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+
+BASE62_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Bản đọc trong bộ nhớ: index theo id và theo short code (cho /q/<code>)
+Snapshot = namedtuple('Snapshot', ['version', 'records', 'by_id', 'by_code'])
+
+
+def base62_encode(number: int) -> str:
+    """Số nguyên không âm -> chuỗi base62 ngắn (0 -> '0', 61 -> 'Z', 62 -> '10')"""
+    if number == 0:
+        return BASE62_ALPHABET[0]
+    digits = []
+    while number:
+        number, rem = divmod(number, 62)
+        digits.append(BASE62_ALPHABET[rem])
+    return ''.join(reversed(digits))
+
+
+def base62_decode(text: str) -> int:
+    """Ngược của base62_encode"""
+    number = 0
+    for char in text:
+        number = number * 62 + BASE62_ALPHABET.index(char)
+    return number
+
+
+class QRStore:
+    """Danh sách record QR lưu trong một file JSON"""
+
+    def __init__(self, data_file):
+        self.data_file = Path(data_file)
+        self.version_file = Path(f'{data_file}.version')
+        self.lock_file = Path(f'{data_file}.lock')
+        self.seq_file = Path(f'{data_file}.seq')
+        self._thread_lock = threading.RLock()
+        self._snapshot = Snapshot(None, [], {}, {})
+
+    @contextmanager
+    def lock(self):
+        """Khoá độc quyền giữa các thread và các process"""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def version(self) -> int:
+        """Version hiện tại (0 nếu chưa ghi lần nào)"""
+        try:
+            return int(self.version_file.read_text() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def load(self):
+        """Load danh sách QR codes từ file JSON"""
+        if self.data_file.exists():
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return []
+        return []
+
+    def snapshot(self) -> Snapshot:
+        """
+        Bản đọc cache trong bộ nhớ, chỉ load lại file khi version đổi
+        (records và các index không được sửa trực tiếp)
+        """
+        version = self.version()
+        cached = self._snapshot
+        if cached.version == version:
+            return cached
+        records = self.load()
+        cached = Snapshot(
+            version,
+            records,
+            {item['id']: item for item in records if 'id' in item},
+            {item['short_code']: item for item in records if item.get('short_code')},
+        )
+        self._snapshot = cached
+        return cached
+
+    def _write_atomic(self, path, content):
+        tmp = Path(f'{path}.tmp{os.getpid()}.{threading.get_ident()}')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def save(self, data):
+        """Lưu danh sách QR codes vào file JSON và tăng version"""
+        with self.lock():
+            self._save_unlocked(data)
+
+    def _save_unlocked(self, data):
+        self._write_atomic(self.data_file, json.dumps(data, ensure_ascii=False, indent=2))
+        self._bump_version()
+
+    def _bump_version(self):
+        self._write_atomic(self.version_file, str(self.version() + 1))
+
+    def replace_file(self, path):
+        """Thay file dữ liệu bằng file đã ghi sẵn (gọi khi đang giữ lock())"""
+        os.replace(path, self.data_file)
+        self._bump_version()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Đọc - sửa - ghi trong một lần khoá:
+
+            with store.transaction() as data:
+                data.append(record)
+        """
+        with self.lock():
+            data = self.load()
+            yield data
+            self._save_unlocked(data)
+
+    def _next_short_code(self):
+        """Cấp short code mới từ bộ đếm tăng dần (gọi khi đang giữ lock())"""
+        try:
+            seq = int(self.seq_file.read_text() or 0)
+        except (OSError, ValueError):
+            seq = 0
+        seq += 1
+        self._write_atomic(self.seq_file, str(seq))
+        return base62_encode(seq)
+
+    def reserve_short_codes(self, codes):
+        """
+        Đẩy bộ đếm qua các short code đã có (record nhập từ nơi khác), để code cấp sau
+        không trùng (gọi khi đang giữ lock())
+        """
+        highest = 0
+        for code in codes:
+            try:
+                highest = max(highest, base62_decode(code))
+            except ValueError:
+                continue
+        try:
+            seq = int(self.seq_file.read_text() or 0)
+        except (OSError, ValueError):
+            seq = 0
+        if highest > seq:
+            self._write_atomic(self.seq_file, str(highest))
+
+    def assign_short_link(self, record, base_url):
+        """
+        Gán short code cho record và trỏ full_url (nội dung QR) về /q/<code>
+        (gọi khi đang giữ lock(), ví dụ trong transaction())
+        """
+        record['short_code'] = self._next_short_code()
+        record['full_url'] = f"{base_url.rstrip('/')}/q/{record['short_code']}"
+        return record
+
+    def add(self, record, base_url=None):
+        """
+        Thêm một record
+
+        Args:
+            record: Record mới
+            base_url: Nếu có, gán short link base_url/q/<code> làm full_url
+        """
+        with self.transaction() as data:
+            if base_url is not None:
+                self.assign_short_link(record, base_url)
+            data.append(record)
+        return record
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chỉ mục tìm kiếm toàn văn (SQLite FTS5) trên tiêu đề, thư mục collection và nội dung TXT gốc:
+- Không phân biệt dấu tiếng Việt: "bao tang" khớp "Bảo tàng", "da nang" khớp "Đà Nẵng"
+- Cập nhật từng record khi thêm/xoá (add_qr_record, /api/qr-delete); record do process khác
+  ghi (merge, import) được đồng bộ nền theo version của qr_data.json
+- Xếp hạng BM25, tiêu đề nặng hơn collection, collection nặng hơn nội dung
+
+File chỉ mục: qr_data.search.db (cạnh qr_data.json), dùng chung giữa các worker (WAL).
+
+Gán collection/source_txt cho record cũ theo model_txt/ và dựng lại chỉ mục:
+    python search_index.py rebuild
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from pathlib import Path
+from werkzeug.utils import secure_filename
+
+# Trọng số BM25 theo cột: title, collection, body
+WEIGHTS = (10.0, 5.0, 1.0)
+# Nhóm kết quả lớn hơn thì xếp mới nhất trước thay vì BM25 (BM25 tốn ~2µs mỗi kết quả)
+RANK_LIMIT = 10000
+
+_COMBINING = re.compile(r'[\u0300-\u036f]')
+_TOKEN = re.compile(r'\w+')
+
+
+def fold(text) -> str:
+    """Chữ thường, bỏ dấu (kể cả đ -> d) để so khớp không phân biệt dấu"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFD', text.lower()).replace('đ', 'd')
+    return _COMBINING.sub('', text)
+
+
+def build_match(query, columns=None):
+    """
+    Câu truy vấn FTS5: mọi từ phải có, từ cuối khớp tiền tố (đang gõ dở);
+    None nếu không có từ nào
+    """
+    tokens = _TOKEN.findall(fold(query))
+    if not tokens:
+        return None
+    terms = ' '.join(f'"{token}"' for token in tokens[:-1])
+    terms = f'{terms} "{tokens[-1]}"*'.strip()
+    return f'{{{columns}}} : ({terms})' if columns else f'({terms})'
+
+
+def record_stamp(record) -> str:
+    """Dấu nội dung được index của record; đổi thì record được index lại khi đồng bộ"""
+    return '\0'.join((record.get('title') or '', record.get('collection') or '',
+                      record.get('text_sha256') or ''))
+
+
+class SearchIndex:
+    """Chỉ mục FTS5 trong một file SQLite"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
+        with self._conn() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, stamp TEXT);
+                CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+                    title, collection, body, tokenize = 'unicode61 remove_diacritics 0');
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            ''')
+
+    def _conn(self):
+        # Mỗi thread/process một connection (sqlite3 không chia sẻ connection giữa thread)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _add(self, conn, record, text, keep_body=False):
+        row = conn.execute('SELECT rowid FROM docs WHERE id = ?', (record['id'],)).fetchone()
+        if row:
+            rowid = row[0]
+            if keep_body and text is None:
+                # Không có TXT gốc (upload qua web): giữ nội dung đã index lúc upload
+                text = conn.execute('SELECT body FROM fts WHERE rowid = ?', (rowid,)).fetchone()[0]
+            conn.execute('DELETE FROM fts WHERE rowid = ?', (rowid,))
+            conn.execute('UPDATE docs SET stamp = ? WHERE rowid = ?', (record_stamp(record), rowid))
+        else:
+            rowid = conn.execute('INSERT INTO docs (id, stamp) VALUES (?, ?)',
+                                 (record['id'], record_stamp(record))).lastrowid
+        conn.execute('INSERT INTO fts (rowid, title, collection, body) VALUES (?, ?, ?, ?)',
+                     (rowid, fold(record.get('title')), fold(record.get('collection')), fold(text)))
+
+    def _remove(self, conn, record_id):
+        row = conn.execute('SELECT rowid FROM docs WHERE id = ?', (record_id,)).fetchone()
+        if row:
+            conn.execute('DELETE FROM fts WHERE rowid = ?', row)
+            conn.execute('DELETE FROM docs WHERE rowid = ?', row)
+
+    def add(self, record, text=None):
+        """Index (hoặc index lại) một record; text là nội dung TXT gốc nếu có"""
+        with self._conn() as conn:
+            self._add(conn, record, text)
+
+    def remove(self, record_id):
+        with self._conn() as conn:
+            self._remove(conn, record_id)
+
+    def add_many(self, items):
+        """Index nhiều (record, text) trong một transaction"""
+        with self._conn() as conn:
+            for record, text in items:
+                self._add(conn, record, text)
+
+    def remove_many(self, record_ids):
+        """Xoá nhiều record khỏi chỉ mục trong một transaction"""
+        with self._conn() as conn:
+            for record_id in record_ids:
+                self._remove(conn, record_id)
+
+    def retitle_many(self, records):
+        """Cập nhật tiêu đề/collection của nhiều record, giữ nguyên nội dung TXT đã index"""
+        with self._conn() as conn:
+            for record in records:
+                row = conn.execute('SELECT rowid FROM docs WHERE id = ?', (record['id'],)).fetchone()
+                if row is None:
+                    self._add(conn, record, None)
+                    continue
+                conn.execute('UPDATE fts SET title = ?, collection = ? WHERE rowid = ?',
+                             (fold(record.get('title')), fold(record.get('collection')), row[0]))
+                conn.execute('UPDATE docs SET stamp = ? WHERE rowid = ?', (record_stamp(record), row[0]))
+
+    def clear(self):
+        """Xoá toàn bộ chỉ mục (lần sync sau index lại từ đầu)"""
+        with self._conn() as conn:
+            conn.execute('DELETE FROM fts')
+            conn.execute('DELETE FROM docs')
+            conn.execute('DELETE FROM meta')
+
+    def version(self):
+        """Version của qr_data.json lần đồng bộ gần nhất"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else None
+
+    def sync(self, records, version, source_text=None):
+        """
+        Đồng bộ chỉ mục với danh sách record (thêm/index lại/xoá phần chênh lệch)
+
+        Args:
+            records: Snapshot record của store
+            version: Version của store tương ứng
+            source_text: Hàm record -> nội dung TXT gốc (None nếu không có)
+
+        Returns:
+            Số record đã thay đổi trong chỉ mục (0 nếu chỉ mục đã mới bằng hoặc hơn version)
+        """
+        return self._sync(lambda: (records, version), source_text)
+
+    def sync_store(self, store, source_text=None):
+        """Như sync, với snapshot mới nhất của store đọc sau khi đã khoá ghi chỉ mục"""
+        def load():
+            snapshot = store.snapshot()
+            return snapshot.records, snapshot.version
+        return self._sync(load, source_text)
+
+    def _sync(self, load, source_text):
+        conn = self._conn()
+        # Khoá ghi của SQLite (mọi worker): add_many/remove_many chờ tới khi đồng bộ xong,
+        # nên record vừa upload không bị coi là đã xoá theo một snapshot cũ
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            records, version = load()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is not None and int(row[0]) >= version:
+                conn.rollback()
+                return 0
+            indexed = dict(conn.execute('SELECT id, stamp FROM docs'))
+            wanted = {record['id']: record for record in records if record.get('id')}
+            removed = [record_id for record_id in indexed if record_id not in wanted]
+            changed = [record for record_id, record in wanted.items()
+                       if indexed.get(record_id) != record_stamp(record)]
+            for record_id in removed:
+                self._remove(conn, record_id)
+            for record in changed:
+                self._add(conn, record, source_text(record) if source_text else None, keep_body=True)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(version),))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(removed) + len(changed)
+
+    def sync_in_background(self, store, source_text=None):
+        """
+        Đồng bộ trong thread nền nếu chỉ mục cũ hơn store (mỗi process tối đa một thread),
+        để request tìm kiếm không phải chờ; trả True nếu đã khởi động thread
+        """
+        if self.version() == store.snapshot().version:
+            return False
+        with self._sync_lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return False
+            self._sync_thread = threading.Thread(
+                target=self.sync_store, args=(store, source_text), daemon=True)
+            self._sync_thread.start()
+        return True
+
+    def search(self, query, limit=20, offset=0, collection=None):
+        """
+        Tìm record theo từ khoá (không phân biệt dấu)
+
+        Kết quả khớp ở tiêu đề/collection đứng trước, khớp trong nội dung đứng sau; trong mỗi
+        nhóm xếp theo BM25, nhóm quá RANK_LIMIT kết quả (từ khoá quá phổ biến) xếp mới nhất trước.
+
+        Returns:
+            (tổng số kết quả, [(id, điểm)]; điểm None nếu nhóm không xếp theo BM25)
+        """
+        match = build_match(query)
+        if collection:
+            scope = build_match(collection, 'collection')
+            if scope:
+                match = f'({match}) AND ({scope})' if match else scope
+        if not match:
+            return 0, []
+        conn = self._conn()
+        count = lambda expr: conn.execute('SELECT count(*) FROM fts WHERE fts MATCH ?', (expr,)).fetchone()[0]
+
+        total = count(match)
+        focused = build_match(query, 'title collection')
+        if focused:
+            # NOT ưu tiên cao hơn AND trong FTS5: phải đóng ngoặc hai vế
+            focused = f'({match}) AND ({focused})'
+            focused_total = count(focused)
+            tiers = [(focused, focused_total), (f'({match}) NOT ({focused})', total - focused_total)]
+        else:
+            tiers = [(match, total)]
+
+        hits = []
+        for expr, size in tiers:
+            if offset >= size:
+                offset -= size
+                continue
+            if size <= RANK_LIMIT:
+                rows = conn.execute(
+                    'SELECT docs.id, bm25(fts, ?, ?, ?) AS rank FROM fts JOIN docs ON docs.rowid = fts.rowid '
+                    'WHERE fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?',
+                    (*WEIGHTS, expr, limit - len(hits), offset)).fetchall()
+                hits += [(record_id, round(-rank, 4)) for record_id, rank in rows]
+            else:
+                rows = conn.execute(
+                    'SELECT docs.id FROM fts JOIN docs ON docs.rowid = fts.rowid '
+                    'WHERE fts MATCH ? ORDER BY fts.rowid DESC LIMIT ? OFFSET ?',
+                    (expr, limit - len(hits), offset)).fetchall()
+                hits += [(record_id, None) for record_id, in rows]
+            offset = 0
+            if len(hits) >= limit:
+                break
+        return total, hits
+
+
+def model_txt_source(model_txt_dir='model_txt'):
+    """
+    Hàm record -> nội dung TXT gốc trong model_txt (theo record['source_txt'])
+
+    Trả về text, hoặc None nếu record không có source_txt / file không còn.
+    """
+    root = Path(model_txt_dir)
+
+    def source_text(record):
+        path = record.get('source_txt')
+        if not path:
+            return None
+        try:
+            return (root / path).read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            return None
+    return source_text
+
+
+def backfill_sources(store, model_txt_dir='model_txt'):
+    """
+    Gán collection/source_txt cho record cũ của process_model_txt.py (khớp theo tên audio)
+
+    Returns:
+        Số record được gán
+    """
+    root = Path(model_txt_dir)
+    by_audio = {}
+    for txt_path in sorted(root.rglob('*.txt')):
+        by_audio.setdefault(secure_filename(txt_path.stem + '.mp3'), txt_path.relative_to(root))
+    if not by_audio:
+        return 0
+    updated = 0
+    with store.transaction() as data:
+        for record in data:
+            if record.get('source_txt'):
+                continue
+            relative = by_audio.get(record.get('audio_filename'))
+            if relative is None:
+                continue
+            record['source_txt'] = relative.as_posix()
+            record['collection'] = relative.parent.as_posix() if relative.parent != Path('.') else ''
+            updated += 1
+    return updated
+
+
+def main():
+    from qr_store import QRStore
+
+    parser = argparse.ArgumentParser(description='Chi muc tim kiem cho qr_data.json')
+    parser.add_argument('--data-file', default=os.environ.get('DATA_FILE', 'qr_data.json'),
+                        help='File du lieu (mac dinh: qr_data.json)')
+    parser.add_argument('--model-txt', default='model_txt', help='Thu muc TXT goc (mac dinh: model_txt)')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('rebuild', help='Gan collection cho record cu va dung lai chi muc')
+    query = sub.add_parser('query', help='Tim thu')
+    query.add_argument('q')
+    query.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    store = QRStore(args.data_file)
+    index_path = Path(args.data_file).with_suffix('.search.db')
+
+    if args.command == 'rebuild':
+        print(f"Da gan collection cho {backfill_sources(store, args.model_txt)} record")
+        index = SearchIndex(index_path)
+        index.clear()
+        changed = index.sync_store(store, model_txt_source(args.model_txt))
+        print(f"Da index {changed} record vao {index_path}")
+    elif args.command == 'query':
+        by_id = store.snapshot().by_id
+        total, hits = SearchIndex(index_path).search(args.q, limit=args.limit)
+        print(f"{total} ket qua")
+        for record_id, score in hits:
+            record = by_id.get(record_id, {})
+            score = f'{score:8.3f}' if score is not None else '       -'
+            print(f"  {score}  {record.get('collection') or '-':20} {record.get('title')}")
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache audio theo đoạn văn bản, để convert lại tài liệu đã sửa chỉ tạo mới các đoạn bị đổi:
+- Văn bản được cắt thành đoạn (nhóm đoạn văn / câu); ranh giới đoạn phụ thuộc nội dung
+  nên sửa một dòng chỉ làm đổi đoạn chứa dòng đó
+- Audio mỗi đoạn lưu theo sha256(giọng + nội dung) trong SEGMENT_CACHE_DIR (mặc định temp/segments)
+- File MP3 cuối được ghép từ các frame của các đoạn (không encode lại)
+- Nhiều request convert cùng đoạn (cùng giọng) một lúc, kể cả ở các worker khác nhau, chỉ gọi
+  TTS một lần: khoá file theo key đoạn, request đến sau chờ rồi dùng audio trong cache
+
+Dọn đoạn lâu không dùng:
+    python segment_cache.py prune --days 30
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+from hls import iter_mp3_frames
+from cancellation import POLL_INTERVAL
+
+# Độ dài tối đa một đoạn (ký tự) gửi TTS trong một lần gọi
+SEGMENT_MAX_CHARS = 2000
+# Đoạn ngắn hơn thì luôn gộp tiếp đoạn văn sau (tránh quá nhiều lời gọi TTS nhỏ)
+SEGMENT_MIN_CHARS = 300
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…;:])\s+')
+
+
+def _units(text, max_chars):
+    """Các đoạn văn (dòng không rỗng); đoạn văn quá dài tách theo câu, câu quá dài tách theo khoảng trắng"""
+    for paragraph in text.splitlines():
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                yield sentence[:cut]
+                sentence = sentence[cut:].lstrip()
+            if sentence:
+                yield sentence
+
+
+def _is_boundary(unit):
+    # Ranh giới theo nội dung (như rsync): khoảng 1/4 số đoạn văn kết thúc một đoạn
+    return hashlib.sha1(unit.encode('utf-8')).digest()[0] & 3 == 0
+
+
+def split_segments(text, max_chars=SEGMENT_MAX_CHARS, min_chars=SEGMENT_MIN_CHARS):
+    """
+    Cắt văn bản thành các đoạn để tạo audio riêng
+
+    Returns:
+        Danh sách đoạn (str), theo thứ tự đọc
+    """
+    segments = []
+    group, size = [], 0
+    for unit in _units(text, max_chars):
+        if group and size + len(unit) + 1 > max_chars:
+            segments.append('\n'.join(group))
+            group, size = [], 0
+        group.append(unit)
+        size += len(unit) + 1
+        if size >= min_chars and _is_boundary(unit):
+            segments.append('\n'.join(group))
+            group, size = [], 0
+    if group:
+        segments.append('\n'.join(group))
+    return segments
+
+
+def segment_key(text, voice):
+    """Key cache của một đoạn: sha256 của giọng đọc và nội dung"""
+    return hashlib.sha256(f'{voice}\n{text}'.encode('utf-8')).hexdigest()
+
+
+class SegmentCache:
+    """Audio của các đoạn trên đĩa, <root>/<2 ký tự đầu>/<key>.mp3"""
+
+    def __init__(self, root='temp/segments'):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._stripes = [threading.Lock() for _ in range(64)]  # dùng khi không có fcntl
+
+    def path(self, key):
+        return self.root / key[:2] / f'{key}.mp3'
+
+    @contextmanager
+    def lock(self, key, cancel=None):
+        """
+        Khoá độc quyền một đoạn giữa các thread và các worker, để các request cùng nội dung
+        chỉ gọi TTS một lần: người giữ khoá tạo audio, người chờ thấy đoạn đã có trong cache.
+        cancel: CancelToken; bị huỷ trong lúc chờ thì raise Cancelled
+        """
+        if fcntl is None:
+            stripe = self._stripes[int(key[:2], 16) % len(self._stripes)]
+            while not stripe.acquire(timeout=POLL_INTERVAL):
+                if cancel is not None:
+                    cancel.check()
+            try:
+                yield
+            finally:
+                stripe.release()
+            return
+        path = self.root / key[:2] / f'{key}.lock'
+        while True:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lock = open(path, 'a')
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if cancel is not None:
+                            cancel.check()
+                        time.sleep(POLL_INTERVAL)
+                if _same_file(lock, path):
+                    break
+                # prune đã xoá file khoá sau khi ta mở: khoá trên inode cũ không loại trừ ai
+            except BaseException:
+                lock.close()
+                raise
+            lock.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def get(self, key):
+        """File audio của đoạn nếu đã có (cập nhật mtime để prune giữ lại), None nếu chưa"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_path(self):
+        """File tạm cùng filesystem với cache để put() đổi tên atomic"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f'.tmp-{uuid.uuid4()}.mp3'
+
+    def put(self, key, source):
+        """Chuyển file audio của đoạn vào cache (atomic)"""
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+        return path
+
+    def prune(self, max_age_days):
+        """Xoá đoạn không được dùng trong max_age_days ngày; trả (số file, số byte) đã xoá"""
+        cutoff = time.time() - max_age_days * 86400
+        removed, freed = 0, 0
+        for path in self.root.glob('*/*.mp3'):
+            try:
+                stat = path.stat()
+                if stat.st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+                    freed += stat.st_size
+            except FileNotFoundError:
+                continue
+        # File khoá cũ (rỗng); khoá đang có người giữ thì bỏ qua
+        for path in self.root.glob('*/*.lock'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    self._remove_lock(path)
+            except FileNotFoundError:
+                continue
+        return removed, freed
+
+    def _remove_lock(self, path):
+        """Xoá file khoá nếu không ai giữ (xoá khi đang giữ khoá, lock() mở lại file mới)"""
+        if fcntl is None:
+            path.unlink()
+            return
+        with open(path, 'rb') as lock:  # không tạo lại file đã bị xoá
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            if _same_file(lock, path):
+                path.unlink()
+
+
+def _same_file(lock, path):
+    """File đang mở còn là file ở path không (chưa bị xoá/thay)"""
+    try:
+        return os.path.samestat(os.fstat(lock.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def splice_mp3(sources, output):
+    """
+    Ghép các file MP3 (cùng định dạng) theo frame vào output (đường dẫn hoặc file nhị phân
+    đang mở); trả số byte đã ghi
+    """
+    if not hasattr(output, 'write'):
+        with open(output, 'wb') as out:
+            return splice_mp3(sources, out)
+    written = 0
+    for source in sources:
+        with open(source, 'rb') as f:
+            for frame, _, _ in iter_mp3_frames(f):
+                output.write(frame)
+                written += len(frame)
+    return written
+
+
+_cache = None
+
+
+def get_segment_cache():
+    """
+    Cache dùng chung của process; SEGMENT_CACHE_DIR rỗng thì tắt (trả None): khi đó convert
+    gọi TTS cho cả văn bản và không còn khoá theo đoạn, request trùng nội dung cùng lúc
+    (client khác nhau) mỗi request gọi TTS một lần
+    """
+    global _cache
+    root = os.environ.get('SEGMENT_CACHE_DIR', 'temp/segments')
+    if not root:
+        return None
+    if _cache is None or _cache.root != Path(root):
+        _cache = SegmentCache(root)
+    return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quan ly cache audio theo doan')
+    sub = parser.add_subparsers(dest='command')
+    prune = sub.add_parser('prune', help='Xoa doan lau khong dung')
+    prune.add_argument('--days', type=float, default=30, help='So ngay khong dung (mac dinh: 30)')
+    prune.add_argument('--dir', default=os.environ.get('SEGMENT_CACHE_DIR', 'temp/segments'),
+                       help='Thu muc cache (mac dinh: temp/segments)')
+    args = parser.parse_args()
+
+    if args.command != 'prune':
+        parser.print_help()
+        sys.exit(1)
+
+    removed, freed = SegmentCache(args.dir).prune(args.days)
+    print(f"Da xoa {removed} doan ({freed / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+let currentMode = 'audio';
+const uploadArea = document.getElementById('uploadArea');
+const audioInput = document.getElementById('audioFile');
+const txtInput = document.getElementById('txtFile');
+const form = document.getElementById('uploadForm');
+const status = document.getElementById('status');
+const qrContainer = document.getElementById('qrContainer');
+const submitBtn = document.getElementById('submitBtn');
+const uploadText = document.getElementById('uploadText');
+
+let multipleMode = false;
+
+function toggleMultiple() {
+    multipleMode = document.getElementById('multipleFiles').checked;
+    updateFileInputs();
+}
+
+function updateFileInputs() {
+    if (currentMode === 'audio') {
+        if (multipleMode) {
+            audioInput.style.display = 'none';
+            document.getElementById('audioFiles').style.display = 'block';
+            audioInput.required = false;
+            document.getElementById('audioFiles').required = true;
+        } else {
+            audioInput.style.display = 'block';
+            document.getElementById('audioFiles').style.display = 'none';
+            audioInput.required = true;
+            document.getElementById('audioFiles').required = false;
+        }
+    } else {
+        if (multipleMode) {
+            txtInput.style.display = 'none';
+            document.getElementById('txtFiles').style.display = 'block';
+            txtInput.required = false;
+            document.getElementById('txtFiles').required = true;
+        } else {
+            txtInput.style.display = 'block';
+            document.getElementById('txtFiles').style.display = 'none';
+            txtInput.required = true;
+            document.getElementById('txtFiles').required = false;
+        }
+    }
+}
+
+function switchMode(mode) {
+    currentMode = mode;
+    if (mode === 'audio') {
+        document.getElementById('btnAudio').style.background = '#667eea';
+        document.getElementById('btnTxt').style.background = '#ccc';
+        uploadText.textContent = '📁 Kéo thả file audio vào đây';
+    } else {
+        document.getElementById('btnAudio').style.background = '#ccc';
+        document.getElementById('btnTxt').style.background = '#667eea';
+        uploadText.textContent = '📄 Kéo thả file TXT vào đây';
+    }
+    updateFileInputs();
+}
+
+uploadArea.addEventListener('click', () => {
+    if (currentMode === 'audio') {
+        if (multipleMode) {
+            document.getElementById('audioFiles').click();
+        } else {
+            audioInput.click();
+        }
+    } else {
+        if (multipleMode) {
+            document.getElementById('txtFiles').click();
+        } else {
+            txtInput.click();
+        }
+    }
+});
+
+uploadArea.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    uploadArea.classList.add('dragover');
+});
+
+uploadArea.addEventListener('dragleave', () => {
+    uploadArea.classList.remove('dragover');
+});
+
+uploadArea.addEventListener('drop', (e) => {
+    e.preventDefault();
+    uploadArea.classList.remove('dragover');
+    const files = e.dataTransfer.files;
+    if (files.length > 0) {
+        if (currentMode === 'audio') {
+            if (multipleMode) {
+                document.getElementById('audioFiles').files = files;
+            } else {
+                audioInput.files = files;
+            }
+        } else {
+            if (multipleMode) {
+                document.getElementById('txtFiles').files = files;
+            } else {
+                txtInput.files = files;
+            }
+        }
+        const fileCount = files.length;
+        showStatus(`Đã chọn ${fileCount} file${fileCount > 1 ? 's' : ''}: ${files[0].name}${fileCount > 1 ? '...' : ''}`, 'success');
+    }
+});
+
+form.addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const formData = new FormData(form);
+    
+    submitBtn.disabled = true;
+    submitBtn.textContent = 'Đang xử lý...';
+    showStatus('Đang tạo QR code...', 'success');
+
+    try {
+        let endpoint, response, data;
+        
+        if (multipleMode) {
+            await batchUpload(formData);
+        } else {
+            endpoint = currentMode === 'audio' ? '/upload' : '/txt-to-qr';
+            response = await fetch(endpoint, {
+                method: 'POST',
+                body: formData
+            });
+            data = await response.json();
+            
+            if (response.ok) {
+                showStatus('Tạo QR code thành công!', 'success');
+                displayQR(data.qr_code, data.audio_url, data.audio_path);
+            } else {
+                showStatus('Lỗi: ' + data.error, 'error');
+            }
+        }
+    } catch (error) {
+        showStatus('Lỗi: ' + error.message, 'error');
+    } finally {
+        submitBtn.disabled = false;
+        submitBtn.textContent = 'Tạo QR Code';
+    }
+});
+
+// Batch: server trả NDJSON, mỗi dòng là kết quả của một file ngay khi file đó xong
+async function batchUpload(formData) {
+    const input = document.getElementById(currentMode === 'audio' ? 'audioFiles' : 'txtFiles');
+    const total = input.files.length;
+    const list = document.getElementById('batchResults');
+    list.innerHTML = '';
+    list.classList.add('active');
+    showStatus(`Đang xử lý 0/${total} file...`, 'success');
+
+    const response = await fetch('/api/batch-upload?stream=1', {
+        method: 'POST',
+        headers: { 'Accept': 'application/x-ndjson' },
+        body: formData
+    });
+    if (!response.ok || !response.body) {
+        let message = 'Unknown error';
+        try {
+            message = (await response.json()).error || message;
+        } catch (err) {}
+        showStatus('Lỗi: ' + message, 'error');
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let done = 0;
+    let errors = 0;
+
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+        const item = JSON.parse(line);
+        if (item.done) return;
+        done++;
+        const li = document.createElement('li');
+        if (item.error) {
+            errors++;
+            li.className = 'error';
+            li.textContent = `✗ ${item.filename}: ${item.error}`;
+        } else {
+            li.className = 'success';
+            const link = document.createElement('a');
+            link.href = item.full_url;
+            link.target = '_blank';
+            link.textContent = item.full_url;
+            li.append(`✓ ${item.title} — `, link);
+        }
+        list.appendChild(li);
+        showStatus(`Đang xử lý ${done}/${total} file...`, 'success');
+    };
+
+    while (true) {
+        const { value, done: finished } = await reader.read();
+        if (finished) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffer + decoder.decode());
+
+    const ok = done - errors;
+    if (errors) {
+        showStatus(`Đã tạo ${ok}/${done} QR code, ${errors} file lỗi`, 'error');
+    } else {
+        showStatus(`Đã tạo thành công ${ok} QR code${ok > 1 ? 's' : ''}!`, 'success');
+        setTimeout(() => {
+            window.location.href = '/manage';
+        }, 2000);
+    }
+}
+
+function showStatus(message, type) {
+    status.textContent = message;
+    status.className = 'status ' + type;
+}
+
+function displayQR(qrBase64, audioUrl, audioPath) {
+    qrContainer.classList.add('active');
+    document.getElementById('qrCode').innerHTML = 
+        '<img src="data:image/png;base64,' + qrBase64 + '" alt="QR Code">';
+    
+    const fullUrl = window.location.origin + audioUrl;
+    document.getElementById('audioLink').innerHTML = 
+        '<strong>Link audio:</strong><br><a href="' + fullUrl + '" target="_blank">' + fullUrl + '</a>';
+    
+    document.getElementById('audioPreview').innerHTML = 
+        '<audio controls><source src="' + audioUrl + '" type="audio/mpeg">Trình duyệt không hỗ trợ audio.</audio>';
+    
+    window.qrImageBase64 = qrBase64;
+}
+
+function downloadQR() {
+    if (window.qrImageBase64) {
+        const link = document.createElement('a');
+        link.href = 'data:image/png;base64,' + window.qrImageBase64;
+        link.download = 'qrcode.png';
+        link.click();
+    }
+}
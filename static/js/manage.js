@@ -0,0 +1,97 @@
+const PER_PAGE = 24;
+let searchQuery = '';
+let searchPage = 1;
+
+function renderCard(item) {
+    return `
+        <div class="qr-card">
+            <h3>${escapeHtml(item.title)}</h3>
+            ${item.collection ? `<div class="qr-collection">📁 ${escapeHtml(item.collection)}</div>` : ''}
+            <img src="/qr/${item.id}.png" alt="QR Code" loading="lazy">
+            <div class="qr-stats">▶ ${item.plays || 0} lượt nghe · 📷 ${item.scans || 0} lượt quét</div>
+            <audio controls preload="none"><source src="${item.audio_url}" type="audio/mpeg"></audio>
+            <div class="actions">
+                <a href="${item.audio_url}" target="_blank" class="btn btn-small">🔗 Link</a>
+                <a href="/qr-download/${item.id}" class="btn btn-small" download>⬇️ Tải QR (Chất lượng cao)</a>
+                <button class="btn btn-small" onclick="downloadQR('/qr/${item.id}.png', '${escapeHtml(item.title)}')">⬇️ Tải QR (Nhanh)</button>
+                <button class="btn btn-small btn-danger" onclick="deleteQR('${item.id}')">🗑️ Xóa</button>
+            </div>
+        </div>
+    `;
+}
+
+async function loadQRList() {
+    if (searchQuery) {
+        return search(searchQuery, 1);
+    }
+    const response = await fetch('/api/qr-list');
+    const data = await response.json();
+    const grid = document.getElementById('qrGrid');
+    document.getElementById('searchInfo').textContent = '';
+    document.getElementById('loadMore').style.display = 'none';
+    
+    if (data.length === 0) {
+        grid.innerHTML = '<div class="empty-state"><p>Chưa có QR code nào. <a href="/">Tạo QR code mới</a></p></div>';
+        return;
+    }
+    
+    grid.innerHTML = data.map(renderCard).join('');
+}
+
+async function search(query, page) {
+    const params = new URLSearchParams({ q: query, page: page, per_page: PER_PAGE });
+    const response = await fetch(`/api/search?${params}`);
+    const data = await response.json();
+    // Người dùng đã gõ tiếp: bỏ kết quả cũ
+    if (query !== searchQuery) return;
+    
+    const grid = document.getElementById('qrGrid');
+    const cards = data.results.map(renderCard).join('');
+    if (page === 1) {
+        grid.innerHTML = cards || '<div class="empty-state"><p>Không tìm thấy kết quả phù hợp.</p></div>';
+    } else {
+        grid.insertAdjacentHTML('beforeend', cards);
+    }
+    searchPage = page;
+    document.getElementById('searchInfo').textContent = `${data.total} kết quả cho "${query}"`;
+    document.getElementById('loadMore').style.display = page * PER_PAGE < data.total ? 'inline-block' : 'none';
+}
+
+let searchTimer = null;
+document.getElementById('searchInput').addEventListener('input', (event) => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        searchQuery = event.target.value.trim();
+        loadQRList();
+    }, 250);
+});
+
+document.getElementById('loadMore').addEventListener('click', () => {
+    search(searchQuery, searchPage + 1);
+});
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function downloadQR(url, title) {
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = title.replace(/[^a-z0-9]/gi, '_') + '.png';
+    link.click();
+}
+
+async function deleteQR(id) {
+    if (!confirm('Bạn có chắc muốn xóa QR code này?')) return;
+    
+    const response = await fetch(`/api/qr-delete/${id}`, { method: 'DELETE' });
+    if (response.ok) {
+        loadQRList();
+    } else {
+        alert('Lỗi khi xóa');
+    }
+}
+
+loadQRList();
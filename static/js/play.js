@@ -0,0 +1,19 @@
+// Ưu tiên HLS (tải đoạn đầu ngắn là phát được) khi trình duyệt hỗ trợ sẵn,
+// ngược lại phát file MP3 thường
+const player = document.getElementById('player');
+const hlsSrc = player.dataset.hls;
+
+if (hlsSrc && player.canPlayType('application/vnd.apple.mpegurl')) {
+    player.src = hlsSrc;
+    // HLS lỗi (playlist/đoạn thiếu): chuyển sang MP3, chỉ một lần
+    player.addEventListener('error', () => {
+        player.src = player.dataset.src;
+        player.play().catch(() => {});
+    }, { once: true });
+} else {
+    player.src = player.dataset.src;
+}
+
+player.play().catch(() => {
+    // Trình duyệt chặn autoplay: chờ người dùng bấm play
+});
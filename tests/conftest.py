@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Module của project nằm phẳng ở thư mục gốc
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
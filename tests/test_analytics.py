@@ -0,0 +1,21 @@
+from analytics import is_play_start
+
+
+def test_full_request_and_open_range_count_as_play():
+    assert is_play_start(None)
+    assert is_play_start('')
+    assert is_play_start('bytes=0-')
+    assert is_play_start('Bytes = 0-')
+
+
+def test_safari_probe_sequence_counts_once():
+    # Safari/iOS: dò bytes=0-1, rồi bytes=0- để phát, rồi các đoạn tiếp theo
+    sequence = ['bytes=0-1', 'bytes=0-', 'bytes=65536-', 'bytes=131072-262143']
+    assert sum(is_play_start(value) for value in sequence) == 1
+
+
+def test_bounded_and_seek_ranges_are_not_plays():
+    assert not is_play_start('bytes=0-1023')
+    assert not is_play_start('bytes=0')
+    assert not is_play_start('bytes=12345-')
+    assert not is_play_start('bytes=0-1,5-10')
@@ -0,0 +1,21 @@
+from audio_paths import AudioPathIndex, is_public_name
+
+
+def test_public_names_allow_legacy_spaces_and_unicode():
+    assert is_public_name('Truyện cổ tích số 1.mp3')
+    assert is_public_name('abc_123.mp3')
+    for name in ('', '.', '..', '.path_index.json', '../qr_data.json', 'a/b.mp3', 'a\\b.mp3', 'a\0.mp3'):
+        assert not is_public_name(name), name
+
+
+def test_resolve_finds_legacy_file_added_after_index(tmp_path):
+    legacy = tmp_path / 'audio_stories'
+    legacy.mkdir()
+    index = AudioPathIndex(tmp_path / 'uploads', legacy_dirs=[tmp_path / 'uploads', legacy])
+    index.ensure()
+
+    added = legacy / 'Bài mới.mp3'
+    added.write_bytes(b'mp3')
+    assert index.resolve('Bài mới.mp3') == added.absolute()
+    # Không có ở đâu cả: trả vị trí shard như cũ
+    assert index.resolve('khong-co.mp3') == index.shard_path('khong-co.mp3').absolute()
@@ -0,0 +1,95 @@
+import io
+import threading
+
+import pytest
+
+from blob_store import BlobStore, LocalBlobStore, S3BlobStore
+
+
+class _ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """Client giả với các hàm boto3 mà S3BlobStore dùng"""
+
+    class exceptions:
+        ClientError = _ClientError
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, stream, bucket, key, ExtraArgs=None, Config=None):
+        self.objects[(bucket, key)] = (stream.read(), ExtraArgs['ContentType'])
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None, Config=None):
+        with open(path, 'rb') as f:
+            self.upload_fileobj(f, bucket, key, ExtraArgs, Config)
+
+    def _get(self, Bucket, Key):
+        try:
+            return self.objects[(Bucket, Key)]
+        except KeyError:
+            raise _ClientError('404')
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self._get(Bucket, Key)[0])}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self._get(Bucket, Key)[0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        BlobStore()
+
+
+def test_s3_store_roundtrip(tmp_path):
+    client = FakeS3Client()
+    store = S3BlobStore('bucket', client=client, presign_expires=60)
+
+    store.put_stream('a.mp3', io.BytesIO(b'abc'))
+    local = tmp_path / 'b.mp3'
+    local.write_bytes(b'hello')
+    store.put_file('b.mp3', local)
+
+    assert not local.exists()
+    assert store.exists('a.mp3') and store.exists('b.mp3')
+    assert not store.exists('missing.mp3')
+    assert store.size('b.mp3') == 5
+    assert store.open('a.mp3').read() == b'abc'
+    (key,) = [key for _, key in client.objects if key.endswith('/a.mp3')]
+    assert key.startswith('audio/') and key.count('/') == 3
+    assert store.playback_url('a.mp3') == f'https://s3.test/bucket/{key}?expires=60'
+    assert store.local_path('a.mp3') is None
+
+    store.delete('a.mp3')
+    assert not store.exists('a.mp3')
+
+
+def test_s3_store_public_base_url():
+    store = S3BlobStore('bucket', client=FakeS3Client(), public_base_url='https://cdn.test/')
+    assert store.playback_url('a.mp3').startswith('https://cdn.test/audio/')
+
+
+def test_local_concurrent_writes_to_same_key(tmp_path):
+    store = LocalBlobStore(tmp_path / 'uploads')
+    payloads = [bytes([i]) * 200_000 for i in range(8)]
+    threads = [threading.Thread(target=store.put_stream, args=('same.mp3', io.BytesIO(p)))
+               for p in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # File cuối cùng là nguyên vẹn một trong các bản ghi, không còn file tạm
+    assert store.open('same.mp3').read() in payloads
+    assert [p.name for p in store.local_path('same.mp3').parent.iterdir()] == ['same.mp3']
@@ -0,0 +1,90 @@
+import io
+import random
+
+from hls import iter_mp3_frames, parse_frame_header, segment_mp3, build_playlist
+
+# MPEG-1 Layer III, 128 kbps, 44100 Hz: 417 byte (418 khi có padding), 1152 sample mỗi frame
+HEADER = b'\xff\xfb\x90\x00'
+HEADER_PADDED = b'\xff\xfb\x92\x00'
+FRAME_SECONDS = 1152 / 44100
+
+
+def frame(padded=False, fill=0x55):
+    header = HEADER_PADDED if padded else HEADER
+    length = 418 if padded else 417
+    return header + bytes([fill]) * (length - 4)
+
+
+def id3_tag(body):
+    size = len(body)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x03\x00\x00' + syncsafe + body
+
+
+def make_mp3(count):
+    return [frame(padded=i % 3 == 0, fill=i % 200) for i in range(count)]
+
+
+def test_parse_frame_header():
+    assert parse_frame_header(HEADER) == (417, 1152, 44100)
+    assert parse_frame_header(HEADER_PADDED) == (418, 1152, 44100)
+    assert parse_frame_header(b'\xff\xfb\xf0\x00') is None  # bitrate index 15
+    assert parse_frame_header(b'\x00\x00\x00\x00') is None
+    assert parse_frame_header(b'\xff') is None
+
+
+def test_frames_split_on_boundaries_with_small_chunks():
+    frames = make_mp3(20)
+    data = b''.join(frames)
+    for chunk_size in (1, 7, 417, 65536):
+        parsed = [f for f, _, _ in iter_mp3_frames(io.BytesIO(data), chunk_size=chunk_size)]
+        assert parsed == frames
+
+
+def test_id3_tag_is_skipped_even_with_sync_bytes():
+    frames = make_mp3(5)
+    # Tag chứa byte giống header frame: phải bỏ theo kích thước tag, không dò sync
+    tag = id3_tag(HEADER + b'\xff' * 100)
+    parsed = [f for f, _, _ in iter_mp3_frames(io.BytesIO(tag + b''.join(frames)))]
+    assert parsed == frames
+
+
+def test_garbage_between_frames_is_resynced():
+    frames = make_mp3(4)
+    data = frames[0] + b'TAG\x00\xff\x12garbage' + b''.join(frames[1:])
+    assert [f for f, _, _ in iter_mp3_frames(io.BytesIO(data))] == frames
+
+
+def test_truncated_and_garbage_input_do_not_raise():
+    data = b''.join(make_mp3(5))
+    assert len(list(iter_mp3_frames(io.BytesIO(data[:-100])))) == 4
+    assert list(iter_mp3_frames(io.BytesIO(b''))) == []
+    assert list(iter_mp3_frames(io.BytesIO(b'ID3\x03\x00\x00\x7f\x7f'))) == []
+    rng = random.Random(0)
+    noise = bytes(rng.randrange(256) for _ in range(50000))
+    list(iter_mp3_frames(io.BytesIO(noise)))
+    list(segment_mp3(io.BytesIO(noise)))
+    assert list(segment_mp3(io.BytesIO(b''))) == []
+
+
+def test_segment_durations_sum_to_total():
+    count = 1000  # ~26 giây
+    segments = list(segment_mp3(io.BytesIO(b''.join(make_mp3(count)))))
+    durations = [duration for duration, _ in segments]
+    assert abs(sum(durations) - count * FRAME_SECONDS) < 1e-9
+    # Đoạn đầu ngắn (~2 giây), các đoạn sau ~6 giây, chỉ đoạn cuối được ngắn hơn
+    assert 2.0 <= durations[0] < 2.0 + FRAME_SECONDS
+    assert all(6.0 <= d < 6.0 + FRAME_SECONDS for d in durations[1:-1])
+    # Mỗi đoạn mở đầu bằng ID3 timestamp rồi đúng các frame, không mất byte nào
+    body = b''
+    for _, segment in segments:
+        assert segment.startswith(b'ID3')
+        body += b''.join(f for f, _, _ in iter_mp3_frames(io.BytesIO(segment)))
+    assert body == b''.join(make_mp3(count))
+
+
+def test_playlist_lists_every_segment():
+    playlist = build_playlist([2.0, 6.0, 1.5])
+    assert '#EXT-X-TARGETDURATION:6' in playlist
+    assert playlist.count('#EXTINF:') == 3
+    assert playlist.rstrip().endswith('#EXT-X-ENDLIST')
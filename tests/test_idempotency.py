@@ -0,0 +1,85 @@
+import threading
+import time
+
+from idempotency import IdempotencyConflict, IdempotencyStore
+
+
+def test_completed_result_is_replayed(tmp_path):
+    store = IdempotencyStore(tmp_path)
+    result, claim = store.begin('key')
+    assert result is None
+    claim.complete(200, {'id': 'r1'})
+    claim.release()
+
+    result, claim = store.begin('key')
+    assert claim is None
+    assert result['status'] == 200 and result['body'] == {'id': 'r1'}
+
+
+def test_released_claim_without_result_runs_again(tmp_path):
+    store = IdempotencyStore(tmp_path)
+    _, claim = store.begin('key')
+    # Lỗi: không lưu kết quả, chỉ nhả khoá; lần gửi lại phải chạy lại
+    claim.release()
+    result, claim = store.begin('key')
+    assert result is None and claim is not None
+    claim.release()
+
+
+def test_concurrent_claim_waits_for_first_result(tmp_path):
+    store = IdempotencyStore(tmp_path, wait_timeout=5)
+    _, first = store.begin('key')
+    outcome = {}
+
+    def duplicate():
+        outcome['result'], outcome['claim'] = store.begin('key')
+
+    thread = threading.Thread(target=duplicate)
+    thread.start()
+    time.sleep(0.3)
+    assert thread.is_alive()  # đang chờ request đầu
+    first.complete(201, {'id': 'r1'})
+    first.release()
+    thread.join(5)
+    assert outcome['claim'] is None
+    assert outcome['result']['body'] == {'id': 'r1'}
+
+
+def test_concurrent_claim_times_out_with_conflict(tmp_path):
+    store = IdempotencyStore(tmp_path, wait_timeout=0.3)
+    _, first = store.begin('key')
+    errors = []
+
+    def duplicate():
+        try:
+            store.begin('key')
+        except IdempotencyConflict as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=duplicate)
+    thread.start()
+    thread.join(5)
+    first.release()
+    assert len(errors) == 1 and errors[0].retry_after > 0
+
+
+def test_expired_result_is_not_replayed_and_cleaned_up(tmp_path):
+    store = IdempotencyStore(tmp_path)
+    _, claim = store.begin('key')
+    claim.complete(200, {'id': 'r1'}, ttl=-1)
+    claim.release()
+    assert store.lookup('key') is None
+    store.cleanup()
+    assert not list(tmp_path.glob('*.json'))
+    result, claim = store.begin('key')
+    assert result is None
+    claim.release()
+
+
+def test_keys_do_not_block_each_other(tmp_path):
+    store = IdempotencyStore(tmp_path, wait_timeout=0.2)
+    _, a = store.begin('a')
+    result, b = store.begin('b')
+    assert result is None and b is not None
+    a.release()
+    b.release()
@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+from lease_queue import LeaseQueue, merge_results
+from qr_store import QRStore
+
+
+def _expire(queue, item):
+    key = LeaseQueue.key(item)
+    old = time.time() - queue.ttl - 1
+    for path in (queue.lease_dir / key).iterdir():
+        os.utime(path, (old, old))
+
+
+def test_only_one_node_claims_an_item(tmp_path):
+    a = LeaseQueue(tmp_path, node_id='a', ttl=60)
+    b = LeaseQueue(tmp_path, node_id='b', ttl=60)
+    assert a.try_claim('x.txt')
+    assert not b.try_claim('x.txt')
+    assert a.still_owner('x.txt') and not b.still_owner('x.txt')
+
+    a.complete('x.txt', {'audio_filename': 'x.mp3'})
+    assert a.is_done('x.txt') and b.is_done('x.txt')
+    assert not b.try_claim('x.txt')
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_steps_down(tmp_path):
+    a = LeaseQueue(tmp_path, node_id='a', ttl=60)
+    b = LeaseQueue(tmp_path, node_id='b', ttl=60)
+    assert a.try_claim('x.txt')
+    # a ngừng heartbeat quá ttl (node chết / treo)
+    _expire(a, 'x.txt')
+    assert b.try_claim('x.txt')
+    assert b.still_owner('x.txt')
+    assert not a.still_owner('x.txt')
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    a = LeaseQueue(tmp_path, node_id='a', ttl=0.3).start()
+    b = LeaseQueue(tmp_path, node_id='b', ttl=0.3)
+    try:
+        assert a.try_claim('x.txt')
+        time.sleep(0.6)
+        assert not b.try_claim('x.txt')
+        assert a.still_owner('x.txt')
+    finally:
+        a.stop()
+
+
+def test_released_item_can_be_claimed_again(tmp_path):
+    a = LeaseQueue(tmp_path, node_id='a', ttl=60)
+    b = LeaseQueue(tmp_path, node_id='b', ttl=60)
+    assert a.try_claim('x.txt')
+    a.release('x.txt')
+    assert b.try_claim('x.txt')
+
+
+def test_merge_adds_new_records_and_updates_changed_text(tmp_path):
+    store = QRStore(tmp_path / 'qr_data.json')
+    with store.transaction() as data:
+        data.append({'id': 'old', 'audio_filename': 'a.mp3', 'text_sha256': '1',
+                     'short_code': 'abc', 'title': 'A'})
+    a = LeaseQueue(tmp_path / 'queue', node_id='a')
+    b = LeaseQueue(tmp_path / 'queue', node_id='b')
+    assert a.try_claim('a.txt') and b.try_claim('b.txt')
+    a.complete('a.txt', {'id': 'new-a', 'audio_filename': 'a.mp3', 'text_sha256': '2', 'hls': {'segments': 3}})
+    b.complete('b.txt', {'id': 'new-b', 'audio_filename': 'b.mp3', 'text_sha256': '9', 'title': 'B'})
+
+    assert merge_results(tmp_path / 'queue', store, 'http://h/', settle=0) == 1
+    by_file = {r['audio_filename']: r for r in store.snapshot().records}
+    # File TXT đã sửa: cập nhật tại chỗ, giữ id và short code
+    assert by_file['a.mp3']['id'] == 'old' and by_file['a.mp3']['short_code'] == 'abc'
+    assert by_file['a.mp3']['text_sha256'] == '2' and by_file['a.mp3']['hls'] == {'segments': 3}
+    assert by_file['b.mp3']['short_code']
+
+    # Merge lại không thêm trùng; shard đã gộp nằm trong merged/
+    assert merge_results(tmp_path / 'queue', store, 'http://h/', settle=0) == 0
+    assert len(store.snapshot().records) == 2
+    merged = list((tmp_path / 'queue' / 'results' / 'merged').glob('*.jsonl'))
+    assert sorted(json.loads(p.read_text())['id'] for p in merged) == ['new-a', 'new-b']
+
+
+def test_merge_ignores_same_text(tmp_path):
+    store = QRStore(tmp_path / 'qr_data.json')
+    with store.transaction() as data:
+        data.append({'id': 'old', 'audio_filename': 'a.mp3', 'text_sha256': '1', 'hls': None})
+    a = LeaseQueue(tmp_path / 'queue', node_id='a')
+    assert a.try_claim('a.txt')
+    a.complete('a.txt', {'id': 'dup', 'audio_filename': 'a.mp3', 'text_sha256': '1', 'hls': {'segments': 1}})
+    assert merge_results(tmp_path / 'queue', store, 'http://h/', settle=0) == 0
+    assert store.snapshot().records[0]['hls'] is None
@@ -0,0 +1,50 @@
+import io
+
+from blob_store import LocalBlobStore
+from library_archive import export_archive, import_archive
+from qr_store import QRStore
+
+LEGACY_NAME = 'Câu chuyện 1.mp3'
+
+
+def _library(root, monkeypatch):
+    root.mkdir()
+    monkeypatch.chdir(root)
+    return QRStore('qr_data.json'), LocalBlobStore('uploads')
+
+
+def test_roundtrip_keeps_legacy_non_ascii_audio(tmp_path, monkeypatch):
+    legacy_dir = tmp_path / 'old' / 'audio_stories'
+    legacy_dir.mkdir(parents=True)
+    (legacy_dir / LEGACY_NAME).write_bytes(b'legacy audio')
+    monkeypatch.chdir(tmp_path / 'old')
+    # LocalBlobStore ghi file cũ trong audio_stories/ vào path index lúc khởi tạo
+    store, blobs = QRStore('qr_data.json'), LocalBlobStore('uploads')
+    blobs.put_stream('new.mp3', io.BytesIO(b'new audio'))
+    with store.transaction() as data:
+        data.append({'id': 'legacy', 'audio_filename': LEGACY_NAME, 'title': 'Câu chuyện 1'})
+        data.append({'id': 'new', 'audio_filename': 'new.mp3', 'title': 'New'})
+
+    archive = io.BytesIO()
+    stats = export_archive(store, blobs, archive)
+    assert stats['blobs'] == 2
+    assert stats['missing'] == [] and stats['invalid'] == []
+
+    archive.seek(0)
+    target_store, target_blobs = _library(tmp_path / 'new', monkeypatch)
+    result = import_archive(archive, target_store, target_blobs, temp_dir='temp', log=lambda _: None)
+
+    assert result['failed'] == 0 and result['records'] == 2
+    assert {r['id'] for r in target_store.snapshot().records} == {'legacy', 'new'}
+    with target_blobs.open(LEGACY_NAME) as f:
+        assert f.read() == b'legacy audio'
+
+
+def test_export_reports_invalid_keys(tmp_path, monkeypatch):
+    store, blobs = _library(tmp_path / 'lib', monkeypatch)
+    with store.transaction() as data:
+        data.append({'id': 'bad', 'audio_filename': '../qr_data.json'})
+
+    stats = export_archive(store, blobs, io.BytesIO())
+    assert stats['invalid'] == ['../qr_data.json']
+    assert stats['blobs'] == 0
@@ -0,0 +1,51 @@
+import io
+import json
+
+import pytest
+
+from migrate_qr_data import iter_json_array
+
+RECORDS = [
+    {'id': 'a', 'title': 'Câu "chuyện" \\ số 1', 'n': 12345, 'qr': {'box_size': 10, 'tags': [1, [2, {'x': None}]]}},
+    {'id': 'b', 'title': 'Escape é \n tab\t ] , [ }', 'n': -0.5e3, 'ok': True},
+    [], {}, 'chuỗi', 7, None,
+]
+
+
+def parse(text, chunk_size):
+    return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 16, 64 * 1024])
+def test_every_chunk_boundary(chunk_size):
+    # ensure_ascii=True sinh \\uXXXX nên ranh giới chunk rơi cả vào giữa escape
+    for text in (json.dumps(RECORDS, ensure_ascii=False, indent=2),
+                 json.dumps(RECORDS),
+                 json.dumps(RECORDS, separators=(',', ':'))):
+        assert parse(text, chunk_size) == RECORDS
+
+
+def test_number_cut_at_chunk_end():
+    assert parse('[1234567, 89]', 4) == [1234567, 89]
+
+
+def test_empty_inputs():
+    assert parse('', 4) == []
+    assert parse('  [ ]  ', 1) == []
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": 1}',            # không phải array
+    '[1, 2',               # thiếu ]
+    '[{"a": 1}',
+    '[1 2]',               # thiếu dấu phẩy
+    '[1,, 2]',
+    '[, 1]',
+    '[1, 2,]',
+    '[{"a": }]',           # phần tử hỏng
+    '["khong dong]',
+])
+@pytest.mark.parametrize('chunk_size', [1, 3, 1024])
+def test_malformed_input_raises(text, chunk_size):
+    with pytest.raises(ValueError):
+        parse(text, chunk_size)
@@ -0,0 +1,13 @@
+from qr_render import record_png_version
+
+
+def test_png_version_follows_record_content_only():
+    record = {'id': 'a', 'title': 'A', 'full_url': 'https://x.test/audio/a.mp3', 'qr': {'box_size': 10}}
+    version = record_png_version(record)
+
+    # Field không ảnh hưởng ảnh (tiêu đề, lượt nghe...) không đổi version
+    assert record_png_version(dict(record, title='B', plays=3)) == version
+    assert record_png_version(dict(record, full_url='https://y.test/audio/a.mp3')) != version
+    assert record_png_version(dict(record, qr={'box_size': 12})) != version
+    assert record_png_version(record, box_size=20) != version
+    assert record_png_version(record, 'a.png') != record_png_version(record, 'b.png')
@@ -0,0 +1,63 @@
+from qr_store import QRStore
+from search_index import SearchIndex
+
+
+def make_index(tmp_path):
+    index = SearchIndex(tmp_path / 'qr_data.search.db')
+    index.add({'id': 'title', 'title': 'Đà Nẵng', 'collection': 'B'}, 'noi dung khac')
+    index.add({'id': 'body', 'title': 'Bai A', 'collection': 'B'}, 'Thành phố Đà Nẵng đẹp')
+    return index
+
+
+def test_body_only_match_with_multiword_query(tmp_path):
+    index = make_index(tmp_path)
+    total, hits = index.search('da nang')
+    # Khớp tiêu đề trước, khớp chỉ trong nội dung sau; total khớp số dòng trả về
+    assert total == 2 and [record_id for record_id, _ in hits] == ['title', 'body']
+
+
+def test_body_only_match_paginates_and_filters(tmp_path):
+    index = make_index(tmp_path)
+    total, hits = index.search('da nang', offset=1)
+    assert total == 2 and [record_id for record_id, _ in hits] == ['body']
+    total, hits = index.search('da nang', collection='B')
+    assert total == 2 and [record_id for record_id, _ in hits] == ['title', 'body']
+    total, hits = index.search('thanh pho da', collection='B')
+    assert total == 1 and [record_id for record_id, _ in hits] == ['body']
+
+
+def test_sync_keeps_records_indexed_after_stale_snapshot(tmp_path):
+    store = QRStore(tmp_path / 'qr_data.json')
+    index = SearchIndex(tmp_path / 'qr_data.search.db')
+    with store.transaction() as data:
+        data.append({'id': 'old', 'title': 'Cu'})
+    stale = store.snapshot()
+
+    # Upload qua web sau khi request tìm kiếm đã lấy snapshot: ghi store rồi index kèm nội dung TXT
+    upload = {'id': 'web', 'title': 'Bai moi'}
+    with store.transaction() as data:
+        data.append(upload)
+    index.add_many([(upload, 'Bảo tàng Đà Nẵng')])
+
+    index.sync_store(store)
+    assert index.version() == store.version()
+    # Snapshot cũ đến sau không được lùi version hay xoá record mới
+    assert index.sync(stale.records, stale.version) == 0
+    assert index.version() == store.version()
+    assert [record_id for record_id, _ in index.search('bao tang')[1]] == ['web']
+
+
+def test_sync_keeps_body_of_records_without_source_text(tmp_path):
+    store = QRStore(tmp_path / 'qr_data.json')
+    index = SearchIndex(tmp_path / 'qr_data.search.db')
+    upload = {'id': 'web', 'title': 'Bai moi'}
+    with store.transaction() as data:
+        data.append(upload)
+    index.add_many([(upload, 'Bảo tàng Đà Nẵng')])
+
+    # Đổi tiêu đề ở process khác (không cập nhật chỉ mục): đồng bộ index lại record
+    with store.transaction() as data:
+        data[0]['title'] = 'Tieu de moi'
+    index.sync_store(store, source_text=lambda record: None)
+    assert [record_id for record_id, _ in index.search('bao tang')[1]] == ['web']
+    assert [record_id for record_id, _ in index.search('tieu de moi')[1]] == ['web']
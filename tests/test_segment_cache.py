@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+import segment_cache
+from segment_cache import SegmentCache
+
+pytestmark = pytest.mark.skipif(segment_cache.fcntl is None, reason='can fcntl')
+
+HELD = 'ab' + '0' * 62
+IDLE = 'cd' + '0' * 62
+
+
+def _age(path, days):
+    old = time.time() - days * 86400
+    os.utime(path, (old, old))
+
+
+def test_prune_skips_held_lock_files(tmp_path):
+    cache = SegmentCache(tmp_path)
+    with cache.lock(IDLE):
+        pass
+    with cache.lock(HELD):
+        held = tmp_path / HELD[:2] / f'{HELD}.lock'
+        idle = tmp_path / IDLE[:2] / f'{IDLE}.lock'
+        _age(held, 60)
+        _age(idle, 60)
+        cache.prune(30)
+        assert held.exists()
+        assert not idle.exists()
+
+
+def test_lock_after_prune_still_excludes(tmp_path):
+    cache = SegmentCache(tmp_path)
+    with cache.lock(IDLE):
+        pass
+    _age(tmp_path / IDLE[:2] / f'{IDLE}.lock', 60)
+    cache.prune(30)
+    with cache.lock(IDLE):
+        other = open(tmp_path / IDLE[:2] / f'{IDLE}.lock', 'a')
+        with pytest.raises(BlockingIOError):
+            segment_cache.fcntl.flock(other, segment_cache.fcntl.LOCK_EX | segment_cache.fcntl.LOCK_NB)
+        other.close()
@@ -0,0 +1,80 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import Tracer, span, submit
+
+
+def test_trace_written_when_queued_futures_are_cancelled(tmp_path):
+    tracer = Tracer(path=tmp_path / 'traces.jsonl')
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    with tracer.start_trace('batch', trace_id='t1'):
+        with span('work'):
+            submit(executor, blocker)
+            queued = [submit(executor, lambda: None) for _ in range(3)]
+            started.wait(5)
+    # Huỷ các việc chưa chạy: chúng không bao giờ chạy nhưng vẫn phải nhả trace
+    assert all(future.cancel() for future in queued)
+    release.set()
+    executor.shutdown(wait=True)
+
+    lines = (tmp_path / 'traces.jsonl').read_text().splitlines()
+    assert [json.loads(line)['trace_id'] for line in lines] == ['t1']
+
+
+def test_run_parallel_spans_keep_parent_trace(tmp_path):
+    from bulk_ops import run_parallel
+
+    tracer = Tracer(path=tmp_path / 'traces.jsonl')
+
+    def work(record):
+        with span('synthesize'):
+            return record['id']
+
+    with tracer.start_trace('bulk', trace_id='t2'):
+        results = run_parallel([{'id': 'a'}, {'id': 'b'}], work, max_workers=2)
+    assert [result for _, result in results] == ['a', 'b']
+
+    trace = json.loads((tmp_path / 'traces.jsonl').read_text())
+    root = next(s for s in trace['spans'] if s.get('parent') is None)
+    children = [s for s in trace['spans'] if s['name'] == 'synthesize']
+    assert len(children) == 2
+    assert all(s['parent'] == root['id'] for s in children)
+
+
+def _traced_app(monkeypatch, tracer):
+    from flask import Flask
+
+    import tracing
+
+    monkeypatch.setattr(tracing, '_tracer', tracer)
+    app = Flask(__name__)
+    tracing.init_app(app)
+    app.add_url_rule('/ping', 'ping', lambda: 'ok')
+    return app.test_client()
+
+
+def test_client_trace_header_ignored_when_not_sampled(tmp_path, monkeypatch):
+    tracer = Tracer(path=tmp_path / 'traces.jsonl')
+    client = _traced_app(monkeypatch, tracer)
+    response = client.get('/ping', headers={'X-Trace-Id': 'spam'})
+    assert response.status_code == 200
+    assert 'X-Trace-Id' not in response.headers
+    assert not (tmp_path / 'traces.jsonl').exists()
+
+
+def test_client_trace_header_used_when_sampled_or_trusted(tmp_path, monkeypatch):
+    for tracer in (Tracer(sample_rate=1.0, path=tmp_path / 'traces.jsonl'),
+                   Tracer(path=tmp_path / 'traces.jsonl', trust_header=True)):
+        client = _traced_app(monkeypatch, tracer)
+        response = client.get('/ping', headers={'X-Trace-Id': 'abc'})
+        assert response.headers['X-Trace-Id'] == 'abc'
+    lines = (tmp_path / 'traces.jsonl').read_text().splitlines()
+    assert [json.loads(line)['trace_id'] for line in lines] == ['abc', 'abc']
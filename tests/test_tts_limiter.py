@@ -0,0 +1,74 @@
+import pytest
+
+import tts_limiter
+from tts_limiter import AdaptiveLimiter, CircuitBreaker, SharedSlots, TTSUnavailableError
+
+
+def _limiter(**kwargs):
+    return AdaptiveLimiter(backoff_base=0, backoff_cap=0, **kwargs)
+
+
+def test_breaker_counts_one_failure_per_exhausted_call():
+    breaker = CircuitBreaker(failure_threshold=2)
+    limiter = _limiter(max_retries=3, breaker=breaker)
+
+    def failing():
+        raise ConnectionError('down')
+
+    with pytest.raises(TTSUnavailableError):
+        limiter.call(failing)
+    assert breaker.failures == 1
+    assert breaker.state == 'closed'
+
+
+def test_non_transient_error_does_not_close_half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.failures = 3
+    breaker.state = 'open'
+    limiter = _limiter(breaker=breaker)
+
+    def bad_input():
+        raise ValueError('empty text')
+
+    with pytest.raises(ValueError):
+        limiter.call(bad_input)
+    assert breaker.state == 'half_open'
+    assert breaker.failures == 3
+    # Lượt thăm dò đã được nhả: lời gọi sau vẫn qua được
+    assert limiter.call(lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed'
+
+
+@pytest.mark.skipif(tts_limiter.fcntl is None, reason='can fcntl')
+def test_shared_slots_cap_across_instances(tmp_path):
+    first = SharedSlots(tmp_path, 2)
+    second = SharedSlots(tmp_path, 2)
+    held = [first.try_acquire(), second.try_acquire()]
+    assert None not in held
+    assert first.try_acquire() is None
+    first.release(held.pop())
+    fd = second.try_acquire()
+    assert fd is not None
+    second.release(fd)
+    first.release(held.pop())
+
+
+def test_mixed_segment_sizes_do_not_shrink_limit():
+    limiter = _limiter(initial_limit=2, max_limit=8)
+    # Độ trễ khoẻ mạnh: 1 giây cố định + 1ms mỗi ký tự; đoạn 300-2000 ký tự xen kẽ
+    sizes = [2000, 300, 1200, 300, 2000, 450, 800, 300, 2000, 300] * 3
+    limits = []
+    for chars in sizes:
+        limiter._on_success(1.0 + chars * 0.001, chars)
+        limits.append(limiter.limit)
+    assert limits == sorted(limits)
+    assert limiter.limit == 8
+
+
+def test_latency_inflation_shrinks_limit():
+    limiter = _limiter(initial_limit=4, max_limit=8)
+    for chars in [2000, 300, 1200, 300, 2000, 800]:
+        limiter._on_success(1.0 + chars * 0.001, chars)
+    before = limiter.limit
+    limiter._on_success(3 * (1.0 + 1200 * 0.001), 1200)
+    assert limiter.limit < before
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+import txt_watcher
+from txt_watcher import TxtWatcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(txt_watcher.time, 'monotonic', fake)
+    return fake
+
+
+def _watcher(tmp_path, handle=lambda path: True, **kwargs):
+    return TxtWatcher(tmp_path, handle, debounce=1.0, **kwargs)
+
+
+def _drain(watcher):
+    items = []
+    while not watcher.queue.empty():
+        items.append(watcher.queue.get_nowait())
+    return items
+
+
+def test_file_is_ready_only_after_quiet_debounce(tmp_path, clock):
+    watcher = _watcher(tmp_path)
+    path = tmp_path / 'a.txt'
+    watcher._on_event('file', path)
+    clock.now += 0.6
+    assert watcher._ready() == []
+    # Bị ghi tiếp: debounce tính lại từ lần ghi cuối
+    watcher._on_event('file', path)
+    clock.now += 0.6
+    assert watcher._ready() == []
+    clock.now += 0.5
+    assert watcher._ready() == [path]
+    assert watcher._ready() == []
+
+
+def test_queued_file_is_submitted_once(tmp_path, clock):
+    watcher = _watcher(tmp_path)
+    path = tmp_path / 'a.txt'
+    watcher._submit(path)
+    watcher._submit(path)
+    assert _drain(watcher) == [path]
+
+
+def test_change_while_running_requeues_after_finish(tmp_path, clock):
+    path = tmp_path / 'a.txt'
+    path.write_text('v1', encoding='utf-8')
+    started, release = threading.Event(), threading.Event()
+    seen = []
+
+    def handle(p):
+        seen.append(p.read_text(encoding='utf-8'))
+        started.set()
+        release.wait(5)
+        return True
+
+    watcher = _watcher(tmp_path, handle)
+    watcher._submit(path)
+    worker = threading.Thread(target=watcher._worker)
+    worker.start()
+    assert started.wait(5)
+
+    # Sửa trong lúc đang xử lý: không xếp hàng chạy song song, đánh dấu dirty
+    path.write_text('v2', encoding='utf-8')
+    watcher._submit(path)
+    assert watcher.queue.empty()
+    assert path in watcher._dirty
+
+    release.set()
+    watcher.queue.put(None)
+    worker.join(5)
+    assert watcher.stats['processed'] == 1
+    # Xong thì quay lại pending, chờ debounce rồi xử lý lại với nội dung mới
+    assert watcher._ready() == []
+    clock.now += 1.0
+    assert watcher._ready() == [path]
+    assert path not in watcher._dirty
+
+
+def test_failed_handle_counts_error_and_frees_path(tmp_path, clock):
+    path = tmp_path / 'a.txt'
+    path.write_text('x', encoding='utf-8')
+
+    def handle(p):
+        raise RuntimeError('boom')
+
+    watcher = _watcher(tmp_path, handle)
+    watcher._submit(path)
+    watcher.queue.put(None)
+    watcher._worker()
+    assert watcher.stats == {'processed': 0, 'errors': 1, 'overflows': 0}
+    watcher._submit(path)
+    assert _drain(watcher) == [path]
+
+
+def test_overflow_rescans_tree(tmp_path, clock):
+    (tmp_path / 'sub').mkdir()
+    for name in ('a.txt', 'sub/b.txt'):
+        (tmp_path / name).write_text('x', encoding='utf-8')
+    watcher = _watcher(tmp_path)
+    watcher._on_event('overflow', None)
+    clock.now += 1.0
+    assert sorted(p.relative_to(tmp_path).as_posix() for p in watcher._ready()) == ['a.txt', 'sub/b.txt']
+    assert watcher.stats['overflows'] == 1
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing nhẹ cho request: mỗi request (được sample) có một trace id, các giai đoạn
+bên trong là span lồng nhau. Trace xong được ghi thành một dòng JSON vào file
+JSONL local có xoay vòng (traces/traces.jsonl, .1, .2, ...).
+
+    TRACE_SAMPLE_RATE=0.1 python app.py        # sample 10% request
+    python tracing.py report --top 5           # 5 trace chậm nhất, dạng flame
+
+Khi không sample (mặc định TRACE_SAMPLE_RATE=0), span() chỉ tốn một lần đọc
+ContextVar. Header X-Trace-Id của client chỉ được dùng làm trace id khi request
+đã được sample; muốn header ép trace (proxy tin cậy) thì đặt TRACE_TRUST_HEADER=1.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import contextvars
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+TRACE_HEADER = 'X-Trace-Id'
+
+# Span đang mở của context hiện tại (None: không trace)
+_current = contextvars.ContextVar('trace_span', default=None)
+
+
+class JsonlSink:
+    """Ghi trace vào file JSONL, xoay vòng khi vượt max_bytes"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock_file = Path(f'{path}.lock')
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = Path(f'{self.path}.{i}')
+            if src.exists():
+                os.replace(src, f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+    def write(self, trace):
+        line = json.dumps(trace, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_file, 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    try:
+                        if self.path.stat().st_size >= self.max_bytes:
+                            self._rotate()
+                    except FileNotFoundError:
+                        pass
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(line)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def files(self):
+        """File hiện tại và các bản xoay vòng (cũ nhất trước)"""
+        rotated = [Path(f'{self.path}.{i}') for i in range(self.backups, 0, -1)]
+        return [p for p in rotated + [self.path] if p.exists()]
+
+
+class _Trace:
+    """Các span của một trace; ghi ra sink khi root và mọi việc nền đã xong"""
+
+    def __init__(self, trace_id, sink):
+        self.trace_id = trace_id
+        self.sink = sink
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.pending = 1  # root span
+        self._lock = threading.Lock()
+
+    def hold(self):
+        with self._lock:
+            self.pending += 1
+
+    def done(self):
+        with self._lock:
+            self.pending -= 1
+            if self.pending:
+                return
+        spans = sorted(self.spans, key=lambda s: s['start_ms'])
+        root = spans[0] if spans else {}
+        self.sink.write({
+            'trace_id': self.trace_id,
+            'name': root.get('name'),
+            'ts': self.started,
+            'duration_ms': root.get('duration_ms'),
+            'spans': spans,
+        })
+
+
+class Span:
+    """Một giai đoạn trong trace; dùng làm context manager"""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'attrs', 'start', '_token')
+
+    def __init__(self, trace, name, parent_id, attrs):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current.reset(self._token)
+        origin = self.trace.origin
+        record = {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+        }
+        if self.attrs:
+            record['attrs'] = self.attrs
+        if exc is not None:
+            record['error'] = f'{exc_type.__name__}: {exc}'
+        with self.trace._lock:
+            self.trace.spans.append(record)
+        if self.parent_id is None:
+            self.trace.done()
+        return False
+
+
+class _NoopSpan:
+    """Span rỗng khi không trace"""
+
+    __slots__ = ()
+    trace = None
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Quyết định sample và tạo root span"""
+
+    def __init__(self, sample_rate=0.0, path='traces/traces.jsonl', max_bytes=10 * 1024 * 1024, backups=3,
+                 trust_header=False):
+        self.sample_rate = sample_rate
+        # True: header X-Trace-Id luôn ép trace (chỉ bật sau proxy tin cậy)
+        self.trust_header = trust_header
+        self.sink = JsonlSink(path, max_bytes, backups)
+
+    def sampled(self) -> bool:
+        """Tung xúc xắc sample cho một trace mới"""
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def start_trace(self, name, trace_id=None, **attrs):
+        """
+        Root span của một trace mới
+
+        Args:
+            name: Tên trace (vd 'POST /txt-to-qr')
+            trace_id: Trace id có sẵn (header X-Trace-Id); có thì luôn trace
+        """
+        if trace_id is None:
+            if not self.sampled():
+                return NOOP_SPAN
+            trace_id = uuid.uuid4().hex
+        return Span(_Trace(trace_id, self.sink), name, None, attrs)
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Tracer dùng chung của process, cấu hình qua biến môi trường"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(
+                    sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 0)),
+                    path=os.environ.get('TRACE_FILE', 'traces/traces.jsonl'),
+                    max_bytes=int(os.environ.get('TRACE_MAX_BYTES', 10 * 1024 * 1024)),
+                    backups=int(os.environ.get('TRACE_BACKUPS', 3)),
+                    trust_header=os.environ.get('TRACE_TRUST_HEADER', '0') == '1',
+                )
+    return _tracer
+
+
+def span(name, **attrs):
+    """Span con của span hiện tại; không trace thì trả NOOP_SPAN"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, attrs)
+
+
+def current_trace_id():
+    parent = _current.get()
+    return parent.trace.trace_id if parent is not None else None
+
+
+def submit(executor, func, *args, **kwargs):
+    """
+    executor.submit(func, ...) chạy trong context trace hiện tại.
+    Trace chỉ được ghi khi mọi future đã submit kết thúc (xong, lỗi hoặc bị huỷ trước khi chạy).
+    """
+    parent = _current.get()
+    if parent is None:
+        return executor.submit(func, *args, **kwargs)
+    ctx = contextvars.copy_context()
+    parent.trace.hold()
+    try:
+        future = executor.submit(ctx.run, func, *args, **kwargs)
+    except BaseException:
+        parent.trace.done()
+        raise
+    future.add_done_callback(lambda _: parent.trace.done())
+    return future
+
+
+def init_app(app):
+    """Trace request Flask: root span theo route, trả trace id qua header X-Trace-Id"""
+    from flask import g, request
+
+    tracer = get_tracer()
+
+    @app.before_request
+    def _start_trace():
+        trace_id = request.headers.get(TRACE_HEADER) or None
+        # Header từ client không tin được: không cho ép trace (lấp đầy file JSONL),
+        # chỉ dùng làm trace id khi request được sample
+        if trace_id is not None and not tracer.trust_header and not tracer.sampled():
+            return
+        root = tracer.start_trace(
+            f'{request.method} {request.url_rule.rule if request.url_rule else request.path}',
+            trace_id=trace_id,
+        )
+        if root is NOOP_SPAN:
+            return
+        root.set(path=request.path)
+        g._trace_span = root.__enter__()
+
+    @app.after_request
+    def _trace_header(response):
+        root = g.get('_trace_span')
+        if root is not None:
+            root.set(status=response.status_code)
+            response.headers[TRACE_HEADER] = root.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        root = g.pop('_trace_span', None)
+        if root is not None:
+            root.__exit__(type(exc) if exc else None, exc, None)
+
+
+# -- Report ------------------------------------------------------------------
+
+def load_traces(sink):
+    traces = []
+    for path in sink.files():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    traces.append(json.loads(line))
+                except ValueError:
+                    continue
+    return traces
+
+
+def print_flame(trace, width=40, file=None):
+    """In cây span của một trace, thanh ngang theo vị trí/thời lượng trong trace"""
+    file = file or sys.stdout
+    total = trace.get('duration_ms') or max(
+        (s['start_ms'] + s['duration_ms'] for s in trace['spans']), default=0) or 1
+    children = {}
+    for s in trace['spans']:
+        children.setdefault(s.get('parent'), []).append(s)
+
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trace.get('ts', 0)))
+    print(f"\ntrace {trace['trace_id']}  {trace.get('name')}  {total:.1f} ms  ({started})", file=file)
+
+    def walk(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s['start_ms']):
+            offset = int(s['start_ms'] / total * width)
+            length = max(1, int(s['duration_ms'] / total * width))
+            bar = ' ' * offset + '█' * min(length, width - offset)
+            label = ('  ' * depth + s['name'])[:36]
+            mark = ' !' if 'error' in s else ''
+            print(f"  {label:36} {s['duration_ms']:>10.1f} ms |{bar:{width}}|{mark}", file=file)
+            walk(s['id'], depth + 1)
+
+    walk(None, 0)
+
+
+def print_summary(traces, file=None):
+    """Thống kê theo tên span: số lần, p50, p95, tổng"""
+    file = file or sys.stdout
+    by_name = {}
+    for trace in traces:
+        for s in trace['spans']:
+            by_name.setdefault(s['name'], []).append(s['duration_ms'])
+
+    print(f"\n{'Span':36} {'So lan':>7} {'p50 ms':>10} {'p95 ms':>10} {'Tong ms':>12}", file=file)
+    print('-' * 80, file=file)
+    for name, values in sorted(by_name.items(), key=lambda kv: -sum(kv[1])):
+        values.sort()
+        p50 = values[len(values) // 2]
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{name[:36]:36} {len(values):>7} {p50:>10.1f} {p95:>10.1f} {sum(values):>12.1f}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Xem trace da ghi (JSONL)')
+    sub = parser.add_subparsers(dest='command')
+    report = sub.add_parser('report', help='In cac trace cham nhat dang flame')
+    report.add_argument('--file', default=os.environ.get('TRACE_FILE', 'traces/traces.jsonl'),
+                        help='File trace (mac dinh: traces/traces.jsonl, doc ca ban xoay vong)')
+    report.add_argument('--top', type=int, default=10, help='So trace cham nhat (mac dinh: 10)')
+    report.add_argument('--name', help='Chi xem trace co ten chua chuoi nay (vd /txt-to-qr)')
+    report.add_argument('--id', dest='trace_id', help='Chi xem mot trace id')
+    args = parser.parse_args()
+
+    if args.command != 'report':
+        parser.print_help()
+        sys.exit(1)
+
+    traces = load_traces(JsonlSink(args.file))
+    if args.trace_id:
+        traces = [t for t in traces if t['trace_id'] == args.trace_id]
+    if args.name:
+        traces = [t for t in traces if args.name in (t.get('name') or '')]
+    if not traces:
+        print(f"Khong co trace nao trong {args.file}")
+        return
+
+    slowest = sorted(traces, key=lambda t: t.get('duration_ms') or 0, reverse=True)[:args.top]
+    print(f"{len(traces)} trace, {len(slowest)} cham nhat:")
+    for trace in slowest:
+        print_flame(trace)
+    print_summary(traces)
+
+
+if __name__ == '__main__':
+    main()
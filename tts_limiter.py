@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Điều tiết số lời gọi TTS đồng thời:
+- AIMD: tăng dần giới hạn khi thành công, giảm một nửa khi bị throttle/lỗi
+- Retry lỗi tạm thời với exponential backoff có jitter
+- Circuit breaker: backend sập thì fail nhanh thay vì chờ timeout
+- Huỷ được khi đang chờ slot/backoff (CancelToken, xem cancellation.py)
+- Trần TTS_MAX_CONCURRENCY chung cho mọi process (các worker gunicorn và process_model_txt.py):
+  mỗi lời gọi giữ một trong N slot file khoá bằng flock (như admission.py); AIMD điều chỉnh
+  trong từng process dưới trần đó
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from pathlib import Path
+
+from cancellation import Cancelled, POLL_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Windows: trần chỉ áp dụng trong process
+    fcntl = None
+
+
+class TTSUnavailableError(Exception):
+    """Backend TTS tạm thời không dùng được (nên thử lại sau retry_after giây)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(TTSUnavailableError):
+    """Circuit breaker đang mở, không gửi request tới backend"""
+
+
+def _status_of(exc):
+    """Lấy HTTP status từ exception (aiohttp, edge-tts) nếu có"""
+    for attr in ('status', 'status_code', 'code'):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient(exc) -> bool:
+    """Lỗi có nên retry không (throttle, 5xx, mạng, timeout)"""
+    if isinstance(exc, (ValueError, FileNotFoundError, TypeError)):
+        return False
+    status = _status_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, OSError)):
+        return True
+    # Lỗi của edge-tts / aiohttp (NoAudioReceived, WebSocketError, ClientError, ...)
+    module = type(exc).__module__ or ''
+    return module.startswith(('edge_tts', 'aiohttp'))
+
+
+def is_throttle(exc) -> bool:
+    """Backend báo quá tải (429/503)"""
+    return _status_of(exc) in (429, 503)
+
+
+def _retry_after_of(exc):
+    """Đọc header Retry-After (giây) nếu backend gửi kèm"""
+    headers = getattr(exc, 'headers', None) or {}
+    try:
+        value = headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class CircuitBreaker:
+    """Circuit breaker 3 trạng thái: closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Gọi trước mỗi request; raise CircuitOpenError nếu phải fail nhanh"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                # Chỉ cho một request thăm dò đi qua
+                self._probing = True
+                return
+            raise CircuitOpenError(
+                'TTS backend dang tam ngung, thu lai sau',
+                retry_after=max(1.0, remaining),
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_cancel(self):
+        """
+        Lời gọi kết thúc mà không cho biết backend sống hay chết (bị huỷ, lỗi do input):
+        không đổi trạng thái, chỉ nhả lượt thăm dò
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_retry(self):
+        """
+        Một lần thử lỗi nhưng lời gọi còn retry: không tính vào ngưỡng (một lời gọi xui không
+        được mở circuit cho mọi người), trừ khi đang thăm dò (half_open) - backend vẫn lỗi, mở lại
+        """
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class SharedSlots:
+    """N slot dùng chung giữa các process (file slot-<i>.lock khoá bằng flock)"""
+
+    def __init__(self, state_dir, count):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.count = count
+
+    def try_acquire(self):
+        """fd của một slot còn trống, None nếu hết"""
+        # Bắt đầu từ slot ngẫu nhiên để các process không cùng tranh slot 0
+        start = random.randrange(self.count)
+        for i in range(self.count):
+            fd = os.open(self.state_dir / f'slot-{(start + i) % self.count}.lock', os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    def acquire(self, cancel=None):
+        """Chờ tới khi có slot (kiểm tra cancel trong lúc chờ)"""
+        while True:
+            fd = self.try_acquire()
+            if fd is not None:
+                return fd
+            if cancel is not None:
+                cancel.check()
+            time.sleep(random.uniform(0.01, 0.05))
+
+    def release(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class LatencyModel:
+    """
+    Độ trễ mong đợi của một lời gọi theo số ký tự: chi phí cố định (kết nối, đoạn đầu) cộng
+    chi phí theo ký tự, hồi quy tuyến tính trên trung bình trượt (EWMA) của các mẫu tốt.
+    Đoạn ngắn vì thế không bị coi là "chậm" chỉ vì độ trễ trên mỗi ký tự cao hơn đoạn dài.
+    """
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self._means = None  # EWMA của (x, y, x², xy), x = số ký tự, y = giây
+
+    def expected(self, chars):
+        """Độ trễ mong đợi (giây), None nếu chưa có mẫu"""
+        if self._means is None:
+            return None
+        x, y, xx, xy = self._means
+        variance = xx - x * x
+        if x and variance > (0.25 * x) ** 2:
+            slope = (xy - x * y) / variance
+            intercept = y - slope * x
+            if slope >= 0 and intercept >= 0:
+                return intercept + slope * chars
+        # Mẫu chưa đủ khác cỡ để tách hai phần: cận trên đúng với mọi tỉ lệ overhead / theo ký tự
+        return y * max(1.0, chars / x) if x else y
+
+    def update(self, chars, latency):
+        sample = (chars, latency, chars * chars, chars * latency)
+        if self._means is None:
+            self._means = sample
+        else:
+            a = self.alpha
+            self._means = tuple((1 - a) * m + a * v for m, v in zip(self._means, sample))
+
+
+class AdaptiveLimiter:
+    """
+    Giới hạn số lời gọi TTS đồng thời theo AIMD.
+
+    Giới hạn tăng thêm 1/limit sau mỗi lần thành công (≈ +1 mỗi "vòng"),
+    giảm một nửa khi bị throttle (25% với lỗi tạm thời khác), giảm 10% khi độ trễ vượt quá 2 lần
+    mức mong đợi cho cùng số ký tự (LatencyModel). Lỗi tạm thời được retry với backoff có jitter.
+    """
+
+    def __init__(self, min_limit=1, max_limit=8, initial_limit=2,
+                 max_retries=4, backoff_base=1.0, backoff_cap=30.0,
+                 latency_factor=2.0, breaker=None, shared_slots=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.latency_factor = latency_factor
+        self.breaker = breaker or CircuitBreaker()
+        self.shared_slots = shared_slots
+
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._latency = LatencyModel()
+        self._last_decrease = 0.0
+
+        # Thống kê
+        self.total_chars = 0
+        self.total_calls = 0
+        self.total_retries = 0
+        self.total_failures = 0
+        self._started = time.monotonic()
+
+    # -- Điều chỉnh giới hạn --------------------------------------------
+
+    def _decrease(self, factor):
+        """Giảm nhân; tối đa một lần mỗi giây để lỗi dồn dập không kéo về min ngay"""
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+
+    def _on_success(self, latency, chars):
+        with self._cond:
+            expected = self._latency.expected(chars)
+            if expected is not None and latency > expected * self.latency_factor:
+                self._decrease(0.9)
+            else:
+                self._latency.update(chars, latency)
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.total_chars += chars
+            self.total_calls += 1
+            self._cond.notify_all()
+
+    def _on_failure(self, factor):
+        with self._cond:
+            self._decrease(factor)
+            self._cond.notify_all()
+
+    # -- Slot -------------------------------------------------------------
+
+    def _acquire(self, cancel=None):
+        """Slot AIMD của process rồi slot chung toàn server; trả fd slot chung (None nếu không dùng)"""
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                if cancel is None:
+                    self._cond.wait()
+                else:
+                    self._cond.wait(POLL_INTERVAL)
+                    cancel.check()
+            self.inflight += 1
+        if self.shared_slots is None:
+            return None
+        try:
+            return self.shared_slots.acquire(cancel)
+        except BaseException:
+            self._release(None)
+            raise
+
+    def _release(self, shared):
+        if shared is not None:
+            self.shared_slots.release(shared)
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    # -- API ----------------------------------------------------------------
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full jitter: ngẫu nhiên trong [0, min(cap, base * 2^attempt)]"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, func, chars=0, cancel=None):
+        """
+        Gọi func() dưới sự điều tiết của limiter
+
+        Args:
+            func: Hàm thực hiện một lần gọi TTS (không tham số)
+            chars: Số ký tự text, dùng để chuẩn hoá độ trễ
+            cancel: CancelToken; bị huỷ thì thôi chờ slot/backoff và raise Cancelled
+
+        Returns:
+            Kết quả của func()
+        """
+        attempt = 0
+        while True:
+            if cancel is not None:
+                cancel.check()
+            self.breaker.before_call()
+            try:
+                shared = self._acquire(cancel)
+            except Cancelled:
+                self.breaker.record_cancel()
+                raise
+            started = time.monotonic()
+            try:
+                result = func()
+            except Cancelled:
+                self._release(shared)
+                self.breaker.record_cancel()
+                raise
+            except Exception as e:
+                self._release(shared)
+                if not is_transient(e):
+                    # Lỗi do input (400, text rỗng...): không nói gì về backend, chỉ nhả lượt thăm dò
+                    self.breaker.record_cancel()
+                    raise
+                self._on_failure(0.5 if is_throttle(e) else 0.75)
+                if attempt >= self.max_retries:
+                    # Mỗi lời gọi hết lượt retry tính một lần vào ngưỡng của circuit breaker
+                    self.breaker.record_failure()
+                    self.total_failures += 1
+                    raise TTSUnavailableError(
+                        f'TTS that bai sau {attempt + 1} lan thu: {e}',
+                        retry_after=_retry_after_of(e) or self.backoff_cap,
+                    ) from e
+                self.breaker.record_retry()
+                self.total_retries += 1
+                delay = self.backoff_delay(attempt, _retry_after_of(e))
+                if cancel is None:
+                    time.sleep(delay)
+                else:
+                    cancel.sleep(delay)
+                attempt += 1
+                continue
+            self._release(shared)
+            self.breaker.record_success()
+            self._on_success(time.monotonic() - started, chars)
+            return result
+
+    def snapshot(self):
+        """Trạng thái hiện tại (cho /health)"""
+        with self._cond:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                'limit': round(self.limit, 2),
+                'shared_limit': self.shared_slots.count if self.shared_slots is not None else None,
+                'inflight': self.inflight,
+                'circuit': self.breaker.state,
+                'calls': self.total_calls,
+                'retries': self.total_retries,
+                'failures': self.total_failures,
+                'chars_per_second': round(self.total_chars / elapsed, 1),
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AdaptiveLimiter:
+    """
+    Limiter của process (web app và process_model_txt.py); TTS_MAX_CONCURRENCY là trần chung
+    cho mọi process dùng cùng TTS_STATE_DIR (mặc định temp/tts)
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            max_limit = int(os.environ.get('TTS_MAX_CONCURRENCY', 8))
+            shared_slots = None
+            if fcntl is not None:
+                shared_slots = SharedSlots(os.environ.get('TTS_STATE_DIR', 'temp/tts'), max_limit)
+            _limiter = AdaptiveLimiter(
+                max_limit=max_limit,
+                initial_limit=int(os.environ.get('TTS_INITIAL_CONCURRENCY', 2)),
+                max_retries=int(os.environ.get('TTS_MAX_RETRIES', 4)),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.environ.get('TTS_BREAKER_THRESHOLD', 5)),
+                    reset_timeout=float(os.environ.get('TTS_BREAKER_RESET', 30)),
+                ),
+                shared_slots=shared_slots,
+            )
+        return _limiter
@@ -3,14 +3,31 @@
 """
 Tool convert file TXT sang Audio (MP3/WAV)
 Sử dụng edge-tts để hỗ trợ tiếng Việt
+
+Dùng được trong pipeline (`-` = stdin/stdout) và cho cả thư mục/glob:
+    cat a.txt | python txt_to_audio.py - > a.mp3
+    python txt_to_audio.py model_txt/chuong1 --jobs 8 -o out/
 """
 
+import io
+import os
 import sys
+import glob
+import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from tts_limiter import get_limiter, TTSUnavailableError
+from cancellation import Cancelled, POLL_INTERVAL
+from tracing import span, submit
+from segment_cache import get_segment_cache, split_segments, segment_key, splice_mp3
+
+# Số đoạn của một file gọi TTS cùng lúc (tổng số lời gọi vẫn do tts_limiter điều tiết)
+SEGMENT_JOBS = int(os.environ.get('TTS_SEGMENT_JOBS', 4))
 
 
-def convert_txt_to_audio(txt_path: str, output_path: str = None, voice: str = "vi-VN-HoaiMyNeural", format: str = "mp3") -> str:
+def convert_txt_to_audio(txt_path: str, output_path: str = None, voice: str = "vi-VN-HoaiMyNeural", format: str = "mp3",
+                         verbose: bool = True, cancel=None) -> str:
     """
     Convert file TXT sang Audio
     
@@ -19,6 +36,8 @@ def convert_txt_to_audio(txt_path: str, output_path: str = None, voice: str = "v
         output_path: Đường dẫn file audio output (nếu None thì tự động tạo)
         voice: Giọng đọc (mặc định: vi-VN-HoaiMyNeural - nữ)
         format: Định dạng audio (mp3 hoặc wav)
+        verbose: In tiến trình ra stdout
+        cancel: CancelToken (cancellation.py); bị huỷ thì dừng gọi TTS, xoá output dở và raise Cancelled
     
     Returns:
         Đường dẫn file audio đã tạo
@@ -56,22 +75,299 @@ def convert_txt_to_audio(txt_path: str, output_path: str = None, voice: str = "v
     else:
         output_path = Path(output_path)
     
-    # Convert text to speech
-    async def generate_speech():
-        communicate = edge_tts.Communicate(text_content, voice)
-        await communicate.save(str(output_path))
+    cache = get_segment_cache()
     
     try:
-        print(f"Dang tao audio voi giong: {voice}...")
-        print(f"Kich thuoc text: {len(text_content)} ky tu")
-        
-        asyncio.run(generate_speech())
+        if cache is None:
+            if verbose:
+                print(f"Dang tao audio voi giong: {voice}...")
+                print(f"Kich thuoc text: {len(text_content)} ky tu")
+            _synthesize(text_content, output_path, voice, cancel)
+        else:
+            _convert_segmented(text_content, output_path, voice, cache, verbose, cancel)
         
-        print(f"Da tao file audio: {output_path}")
+        if verbose:
+            print(f"Da tao file audio: {output_path}")
         return str(output_path)
     
+    except Cancelled:
+        output_path.unlink(missing_ok=True)
+        raise
+    except TTSUnavailableError:
+        raise
+    except Exception as e:
+        raise Exception(f"Loi khi tao audio: {str(e)}")
+
+
+def synthesize_text(text: str, voice: str = "vi-VN-HoaiMyNeural", format: str = "mp3",
+                    cancel=None, verbose: bool = False) -> bytes:
+    """
+    Convert text sang audio trong bộ nhớ (không qua file TXT/audio tạm)
+    
+    Args:
+        text: Nội dung cần đọc
+        voice: Giọng đọc
+        format: mp3 hoặc wav (như convert_txt_to_audio: chỉ là đuôi file, edge-tts luôn trả MP3)
+        cancel: CancelToken (cancellation.py)
+        verbose: In tiến trình ra stdout
+    
+    Returns:
+        Audio (bytes); người gọi tự ghi vào nơi lưu cuối (vd blobs.put_stream, ghi atomic)
+    """
+    if format not in ('mp3', 'wav'):
+        raise ValueError(f"Dinh dang khong ho tro: {format}")
+    text = text.strip()
+    if not text:
+        raise ValueError("Noi dung text rong")
+    
+    cache = get_segment_cache()
+    try:
+        if cache is None:
+            return _synthesize(text, None, voice, cancel)
+        buffer = io.BytesIO()
+        _convert_segmented(text, buffer, voice, cache, verbose, cancel)
+        return buffer.getvalue()
+    except (Cancelled, TTSUnavailableError):
+        raise
+    except Exception as e:
+        raise Exception(f"Loi khi tao audio: {str(e)}")
+
+
+def _synthesize(text, output_path, voice, cancel=None):
+    """
+    Một lời gọi TTS (qua limiter) ghi audio của text vào output_path;
+    output_path None thì trả audio dạng bytes
+    """
+    import edge_tts
+    import asyncio
+    
+    async def produce():
+        communicate = edge_tts.Communicate(text, voice)
+        if output_path is not None:
+            await communicate.save(str(output_path))
+            return None
+        chunks = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                chunks.append(chunk["data"])
+        return b''.join(chunks)
+    
+    async def generate_speech():
+        if cancel is None:
+            return await produce()
+        # Kiểm tra token trong lúc chờ TTS; bị huỷ thì đóng kết nối TTS ngay
+        task = asyncio.ensure_future(produce())
+        while not task.done():
+            await asyncio.wait({task}, timeout=POLL_INTERVAL)
+            if not task.done() and cancel.is_cancelled():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                cancel.check()
+        return task.result()
+    
+    def attempt():
+        with span('tts.attempt'):
+            return asyncio.run(generate_speech())
+    
+    # Limiter dùng chung: điều tiết concurrency, retry, circuit breaker
+    # (span tts gồm cả thời gian chờ limiter, mỗi lần gọi backend là một tts.attempt)
+    with span('tts', voice=voice, chars=len(text)):
+        return get_limiter().call(attempt, chars=len(text), cancel=cancel)
+
+
+def _convert_segmented(text, output, voice, cache, verbose=True, cancel=None):
+    """
+    Tạo audio theo đoạn: đoạn đã có trong cache thì dùng lại, chỉ gọi TTS cho đoạn mới,
+    rồi ghép vào output (đường dẫn hoặc file nhị phân đang mở)
+    """
+    segments = split_segments(text)
+    keys = [segment_key(segment, voice) for segment in segments]
+    missing = {}
+    for key, segment in zip(keys, segments):
+        if key not in missing and cache.get(key) is None:
+            missing[key] = segment
+    
+    if verbose:
+        print(f"Dang tao audio voi giong: {voice}...")
+        print(f"Kich thuoc text: {len(text)} ky tu, {len(segments)} doan, "
+              f"{len(missing)} doan can tao moi ({sum(map(len, missing.values()))} ky tu)")
+    
+    def synthesize_one(item):
+        key, segment = item
+        with cache.lock(key, cancel):
+            # Request khác (thread/worker) có thể vừa tạo xong đoạn này trong lúc chờ khoá
+            if cache.get(key) is not None:
+                return
+            temp_path = cache.temp_path()
+            try:
+                _synthesize(segment, temp_path, voice, cancel)
+                cache.put(key, temp_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+    
+    if missing:
+        executor = ThreadPoolExecutor(max_workers=min(len(missing), SEGMENT_JOBS))
+        try:
+            for future in [submit(executor, synthesize_one, item) for item in missing.items()]:
+                future.result()
+        finally:
+            # Lỗi/huỷ: bỏ các đoạn chưa chạy; đoạn đang chạy tự dừng khi thấy token bị huỷ
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    if cancel is not None:
+        cancel.check()
+    
+    with span('segments.splice', segments=len(segments)):
+        splice_mp3([cache.path(key) for key in keys], output)
+
+
+def stream_text_to_audio(text: str, out, voice: str = "vi-VN-HoaiMyNeural") -> int:
+    """
+    Convert text sang audio, ghi từng chunk vào out (file nhị phân) ngay khi nhận được
+    
+    Args:
+        text: Nội dung cần đọc
+        out: File-like nhị phân (vd sys.stdout.buffer)
+        voice: Giọng đọc
+    
+    Returns:
+        Số byte audio đã ghi
+    """
+    try:
+        import edge_tts
+        import asyncio
+    except ImportError:
+        print("Can cai dat edge-tts: pip install edge-tts", file=sys.stderr)
+        sys.exit(1)
+    
+    text = text.strip()
+    if not text:
+        raise ValueError("Noi dung text rong")
+    
+    written = 0
+    
+    async def generate_speech():
+        nonlocal written
+        communicate = edge_tts.Communicate(text, voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                out.write(chunk["data"])
+                out.flush()
+                written += len(chunk["data"])
+    
+    def run():
+        try:
+            with span('tts.attempt'):
+                asyncio.run(generate_speech())
+        except Exception as e:
+            # Đã ghi một phần ra stream thì không retry được (audio sẽ bị lặp)
+            if written:
+                raise RuntimeError(f"Loi khi tao audio (da ghi {written} byte): {str(e)}") from e
+            raise
+    
+    try:
+        with span('tts.stream', voice=voice, chars=len(text)):
+            get_limiter().call(run, chars=len(text))
+    except (TTSUnavailableError, RuntimeError):
+        raise
     except Exception as e:
         raise Exception(f"Loi khi tao audio: {str(e)}")
+    return written
+
+
+def expand_inputs(inputs):
+    """
+    Mở rộng danh sách input (file, thư mục, glob) thành các cặp (file TXT, thư mục gốc)
+    
+    Thư mục gốc dùng để giữ cấu trúc thư mục con khi ghi vào thư mục output.
+    """
+    files = []
+    seen = set()
+    
+    def add(path, base):
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            files.append((path, base))
+    
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            for txt in sorted(path.rglob('*.txt')):
+                add(txt, path)
+        elif path.is_file():
+            add(path, path.parent)
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"Khong tim thay file: {item}")
+            for match in matches:
+                match = Path(match)
+                if match.is_file() and match.suffix.lower() == '.txt':
+                    add(match, match.parent)
+    return files
+
+
+def convert_many(files, output_dir=None, voice="vi-VN-HoaiMyNeural", format="mp3", jobs=4):
+    """
+    Convert nhiều file TXT song song (tối đa jobs file cùng lúc)
+    
+    Args:
+        files: Danh sách (file TXT, thư mục gốc) từ expand_inputs
+        output_dir: Thư mục output (None: cạnh file TXT)
+        jobs: Số file xử lý cùng lúc (số lời gọi TTS thực sự do tts_limiter điều tiết)
+    
+    Returns:
+        Danh sách kết quả theo thứ tự input: dict(input, output, chars, bytes, seconds, error)
+    """
+    def convert_one(entry):
+        txt_path, base = entry
+        if output_dir is None:
+            output_path = txt_path.with_suffix(f'.{format}')
+        else:
+            output_path = Path(output_dir) / txt_path.relative_to(base).with_suffix(f'.{format}')
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        result = {'input': str(txt_path), 'output': str(output_path),
+                  'chars': 0, 'bytes': 0, 'seconds': 0.0, 'error': None}
+        started = time.perf_counter()
+        try:
+            result['chars'] = len(txt_path.read_text(encoding='utf-8').strip())
+            convert_txt_to_audio(str(txt_path), str(output_path), voice, format, verbose=False)
+            result['bytes'] = output_path.stat().st_size
+        except Exception as e:
+            result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - started
+        
+        status = 'OK' if result['error'] is None else f"LOI: {result['error']}"
+        print(f"  [{result['seconds']:6.2f}s] {txt_path} -> {output_path} {status}", flush=True)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [submit(executor, convert_one, entry) for entry in files]
+        return [future.result() for future in futures]
+
+
+def print_timing_report(results, wall_seconds, file=None):
+    """In bảng thời gian từng file và tổng kết"""
+    file = file or sys.stdout
+    print(f"\n{'File':50} {'Ky tu':>8} {'KB':>8} {'Giay':>8}  Trang thai", file=file)
+    print("-" * 90, file=file)
+    for r in results:
+        name = r['input'] if len(r['input']) <= 50 else '...' + r['input'][-47:]
+        status = 'OK' if r['error'] is None else 'LOI'
+        print(f"{name:50} {r['chars']:>8} {r['bytes'] / 1024:>8.1f} {r['seconds']:>8.2f}  {status}", file=file)
+    
+    ok = [r for r in results if r['error'] is None]
+    total_chars = sum(r['chars'] for r in ok)
+    busy = sum(r['seconds'] for r in results)
+    print("-" * 90, file=file)
+    print(f"Thanh cong: {len(ok)}/{len(results)}  Thoi gian: {wall_seconds:.2f}s "
+          f"(tong thoi gian tung file: {busy:.2f}s, song song x{busy / wall_seconds if wall_seconds else 0:.1f})",
+          file=file)
+    if wall_seconds:
+        print(f"Toc do: {total_chars / wall_seconds:.0f} ky tu/s", file=file)
+    print(f"TTS: {get_limiter().snapshot()}", file=file)
 
 
 def list_voices(language: str = "vi-VN"):
@@ -117,19 +413,25 @@ Vi du:
   python txt_to_audio.py sample.txt -o output.mp3
   python txt_to_audio.py sample.txt --voice vi-VN-NamMinhNeural
   python txt_to_audio.py sample.txt --list-voices
+  cat sample.txt | python txt_to_audio.py - > output.mp3
+  python txt_to_audio.py sample.txt -o - | mpv -
+  python txt_to_audio.py model_txt/chuong1 --jobs 8 -o out/
+  python txt_to_audio.py "model_txt/**/*.txt" --jobs 8
         """
     )
     
     parser.add_argument(
-        'txt_file',
-        nargs='?',
-        help='Duong dan file TXT can convert'
+        'inputs',
+        nargs='*',
+        metavar='INPUT',
+        help='File TXT, thu muc, glob, hoac - (doc tu stdin)'
     )
     
     parser.add_argument(
         '-o', '--output',
         dest='output',
-        help='Duong dan file audio output (mac dinh: cung ten voi file TXT)'
+        help='File audio output, - (ghi ra stdout), hoac thu muc output khi co nhieu file '
+             '(mac dinh: cung ten voi file TXT; stdin thi ghi ra stdout)'
     )
     
     parser.add_argument(
@@ -147,6 +449,13 @@ Vi du:
         help='Dinh dang audio (mp3 hoac wav, mac dinh: mp3)'
     )
     
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=int(os.environ.get('TTS_MAX_CONCURRENCY', 8)),
+        help='So file xu ly cung luc khi co nhieu file (mac dinh: TTS_MAX_CONCURRENCY hoac 8)'
+    )
+    
     parser.add_argument(
         '--list-voices',
         action='store_true',
@@ -161,25 +470,79 @@ Vi du:
         return
     
     # Convert file
-    if not args.txt_file:
+    if not args.inputs:
         parser.print_help()
         print("\nHoac su dung --list-voices de xem danh sach giong doc")
         sys.exit(1)
     
-    try:
-        output_file = convert_txt_to_audio(
-            args.txt_file, 
-            args.output, 
-            args.voice,
-            args.format
-        )
-        print(f"\nHoan thanh! File da duoc luu tai: {output_file}")
+    # stdin/stdout: audio ghi ra stdout nên mọi thông báo đi qua stderr
+    if '-' in args.inputs or args.output == '-':
+        if len(args.inputs) != 1:
+            print("Loi: '-' chi dung voi mot input", file=sys.stderr)
+            sys.exit(1)
+        try:
+            if args.inputs[0] == '-':
+                text = sys.stdin.read()
+            else:
+                with open(args.inputs[0], 'r', encoding='utf-8') as f:
+                    text = f.read()
+            
+            started = time.perf_counter()
+            if args.output in (None, '-'):
+                written = stream_text_to_audio(text, sys.stdout.buffer, args.voice)
+                target = 'stdout'
+            else:
+                with open(args.output, 'wb') as out:
+                    written = stream_text_to_audio(text, out, args.voice)
+                target = args.output
+            print(f"Da ghi {written} byte audio ra {target} ({len(text.strip())} ky tu, "
+                  f"{time.perf_counter() - started:.2f}s)", file=sys.stderr)
+        except BrokenPipeError:
+            # Chương trình đọc stdout đã thoát (vd | head)
+            sys.stderr.close()
+            sys.exit(1)
+        except Exception as e:
+            print(f"\nLoi: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
     
+    try:
+        files = expand_inputs(args.inputs)
     except Exception as e:
         print(f"\nLoi: {str(e)}", file=sys.stderr)
         sys.exit(1)
+    
+    if not files:
+        print("\nLoi: Khong tim thay file .txt nao", file=sys.stderr)
+        sys.exit(1)
+    
+    # Một file: giữ nguyên hành vi cũ (-o là file output)
+    if len(files) == 1 and not Path(args.inputs[0]).is_dir():
+        try:
+            started = time.perf_counter()
+            output_file = convert_txt_to_audio(
+                str(files[0][0]),
+                args.output,
+                args.voice,
+                args.format
+            )
+            print(f"\nHoan thanh! File da duoc luu tai: {output_file} "
+                  f"({time.perf_counter() - started:.2f}s)")
+        
+        except Exception as e:
+            print(f"\nLoi: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
+    # Nhiều file: -o là thư mục output
+    print(f"Tim thay {len(files)} file .txt, jobs: {args.jobs}")
+    started = time.perf_counter()
+    results = convert_many(files, args.output, args.voice, args.format, args.jobs)
+    print_timing_report(results, time.perf_counter() - started)
+    
+    if any(r['error'] for r in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
     main()
-
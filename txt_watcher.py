@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Theo dõi model_txt/ và đưa file TXT mới/bị sửa vào xử lý (python process_model_txt.py --watch):
+- Linux: inotify qua ctypes (không cần thư viện ngoài), mỗi thư mục một watch, thư mục con mới
+  được watch ngay khi xuất hiện; không có inotify (hoặc hết watch) thì quét mtime/size định kỳ
+- Gom sự kiện (debounce): file được ghi nhiều lần liên tiếp chỉ xử lý một lần, sau khi yên debounce giây
+- Hàng đợi có giới hạn: worker không kịp thì watcher chờ (sự kiện nằm lại trong kernel, tràn thì
+  quét lại cây một lần); một file không bao giờ được xử lý song song hai lần
+- Chỉ xử lý thay đổi xảy ra khi đang chạy: file có từ trước thì chạy process_model_txt.py một lần
+"""
+
+import os
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from pathlib import Path
+
+# Hằng số của <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct('iIII')
+
+# Sự kiện gửi cho watcher: ('file', path), ('dir', path) - thư mục mới, ('overflow', None)
+OVERFLOW = ('overflow', None)
+
+
+def iter_txt(root):
+    """Mọi file .txt trong cây thư mục root"""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith('.txt'):
+                yield Path(dirpath) / name
+
+
+class InotifySource:
+    """Sự kiện file của cây thư mục qua inotify (Linux)"""
+
+    def __init__(self, root):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.paths = {}
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, root):
+        """Watch root và mọi thư mục con (OSError nếu hết watch: fs.inotify.max_user_watches)"""
+        for dirpath, _, _ in os.walk(root):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f'inotify_add_watch {dirpath}: {os.strerror(errno)}')
+            self.paths[wd] = Path(dirpath)
+
+    def _forget_tree(self, root):
+        # Thư mục bị chuyển đi: bỏ watch cả cây con (chuyển tới đâu trong model_txt thì được watch lại)
+        for wd, path in list(self.paths.items()):
+            if path == root or root in path.parents:
+                self._rm_watch(self.fd, wd)
+                self.paths.pop(wd, None)
+
+    def read(self, timeout):
+        """Các sự kiện trong tối đa timeout giây"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(OVERFLOW)
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            parent = self.paths.get(wd)
+            if parent is None or not name:
+                continue
+            path = parent / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    self._forget_tree(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append(('dir', path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and path.suffix == '.txt':
+                events.append(('file', path))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Phát hiện file .txt mới/bị sửa bằng cách quét mtime/size định kỳ (khi không có inotify)"""
+
+    def __init__(self, root, interval=2.0):
+        self.root = root
+        self.interval = interval
+        self.state = self._scan()
+        self._next = time.monotonic() + interval
+
+    def _scan(self):
+        state = {}
+        for path in iter_txt(self.root):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def read(self, timeout):
+        remaining = self._next - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, remaining))
+        self._next = time.monotonic() + self.interval
+        previous, self.state = self.state, self._scan()
+        return [('file', path) for path, signature in self.state.items() if previous.get(path) != signature]
+
+    def add_tree(self, root):
+        pass
+
+    def close(self):
+        pass
+
+
+class TxtWatcher:
+    """Theo dõi cây thư mục, gọi handle(path) cho file TXT mới/bị sửa bằng một pool worker"""
+
+    def __init__(self, root, handle, workers=4, debounce=1.0, max_queue=100,
+                 poll_interval=2.0, use_inotify=True):
+        """
+        Args:
+            root: Thư mục cần theo dõi (model_txt)
+            handle: Hàm xử lý một file (path tương đối theo root như process_txt_file cần)
+            workers: Số file xử lý song song
+            debounce: Số giây file phải yên (không bị ghi thêm) trước khi xử lý
+            max_queue: Số file chờ tối đa; đầy thì watcher chờ worker (backpressure)
+            poll_interval: Chu kỳ quét khi không dùng được inotify
+            use_inotify: False: luôn quét định kỳ (vd thư mục mạng NFS/SMB không có inotify)
+        """
+        self.root = Path(root)
+        self.handle = handle
+        self.workers = workers
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.source = None
+        self._pending = {}
+        self._queued = set()
+        self._running = set()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {'processed': 0, 'errors': 0, 'overflows': 0}
+
+    def _open_source(self):
+        if self.use_inotify:
+            try:
+                return InotifySource(self.root)
+            except (OSError, AttributeError) as e:
+                print(f"Khong dung duoc inotify ({e}), chuyen sang quet moi {self.poll_interval}s")
+        return PollingSource(self.root, self.poll_interval)
+
+    def touch(self, path):
+        """Ghi nhận file vừa thay đổi (xử lý khi yên debounce giây)"""
+        with self._lock:
+            self._pending[path] = time.monotonic()
+
+    def _on_event(self, kind, path):
+        if kind == 'file':
+            self.touch(path)
+        elif kind == 'dir':
+            # Thư mục mới (hoặc chuyển vào): watch rồi lấy các file đã nằm sẵn trong đó
+            try:
+                self.source.add_tree(path)
+            except OSError as e:
+                print(f"Khong watch duoc {path}: {e}")
+            for txt_path in iter_txt(path):
+                self.touch(txt_path)
+        else:
+            # Kernel bỏ sự kiện vì hàng đợi tràn: quét lại cả cây một lần
+            # (file không đổi được process_txt_file bỏ qua theo text_sha256)
+            with self._lock:
+                self.stats['overflows'] += 1
+            for txt_path in iter_txt(self.root):
+                self.touch(txt_path)
+
+    def _ready(self):
+        """Các file đã yên đủ lâu, bỏ khỏi pending"""
+        deadline = time.monotonic() - self.debounce
+        with self._lock:
+            ready = [path for path, touched in self._pending.items() if touched <= deadline]
+            for path in ready:
+                del self._pending[path]
+        return ready
+
+    def _submit(self, path):
+        with self._lock:
+            if path in self._queued:
+                return  # Đang chờ trong hàng đợi: khi chạy sẽ đọc nội dung mới nhất
+            if path in self._running:
+                self._dirty.add(path)  # Đang xử lý: xử lý lại sau khi xong
+                return
+            self._queued.add(path)
+        while not self._stop.is_set():
+            try:
+                self.queue.put(path, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _worker(self):
+        while True:
+            path = self.queue.get()
+            if path is None:
+                return
+            with self._lock:
+                self._queued.discard(path)
+                self._running.add(path)
+            ok = True
+            try:
+                if path.is_file():
+                    ok = bool(self.handle(path))
+            except Exception as e:
+                ok = False
+                print(f"  ✗ Lỗi: {path}: {e}")
+            finally:
+                with self._lock:
+                    self.stats['processed' if ok else 'errors'] += 1
+                    self._running.discard(path)
+                    if path in self._dirty:
+                        self._dirty.discard(path)
+                        self._pending[path] = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Chạy tới khi stop() hoặc Ctrl+C"""
+        self.source = self._open_source()
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                for kind, path in self.source.read(timeout=min(self.debounce, 0.5) or 0.1):
+                    self._on_event(kind, path)
+                for path in self._ready():
+                    self._submit(path)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            self.source.close()
+            # Worker làm nốt file đang xử lý; file còn chờ bị bỏ (lần chạy sau xử lý lại)
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            for _ in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()